@@ -0,0 +1,126 @@
+import argparse
+import heapq
+import random
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+from benchmarks.dags import step
+from src.workflow.admission_queue import StepAdmissionQueue
+from src.workflow.duration_store import StepDurationStore
+from src.workflow.scheduler import WorkflowScheduler
+from src.workflow.workflow import Workflow
+from src.workflow.workflow_schema import WorkflowSchema, WorkflowStepSchema
+
+"""
+    Simulated makespan of workflows run with a limited number of slots (MAX_RUNNING_STEPS), with steps admitted
+    in FIFO order vs. longest remaining critical path first. Steps are started through the real StepAdmissionQueue,
+    time is simulated. Priorities come from a StepDurationStore filled by a previous run, whose step durations
+    differ from the simulated ones by up to --noise.
+    Reported makespan is relative to the lower bound max(critical path, total work / slots).
+    Run with: python -m benchmarks.bench_critical_path
+"""
+
+NAMESPACE = "default"
+SLOTS = [4, 16, 64]
+
+
+def random_dag(n: int, rng: random.Random) -> List[Dict]:
+    """
+        Every step depends on up to 3 random steps among the previous 50.
+    """
+    return [step(f"step{i}", [f"step{j}" for j in set(rng.randrange(max(0, i - 50), i) for _ in range(rng.randint(0, 3)))]
+                 if i else []) for i in range(n)]
+
+
+def chains_and_fillers(n: int, rng: random.Random) -> List[Dict]:
+    """
+        A few long chains and many independent steps queued before them.
+    """
+    fillers = [step(f"filler{i}", []) for i in range(n * 3 // 4)]
+    chains = [step(f"chain{c}-{i}", [f"chain{c}-{i - 1}"] if i else []) for c in range(4) for i in range(n // 16)]
+    return fillers + chains
+
+
+SHAPES = {"random_dag": random_dag, "chains_and_fillers": chains_and_fillers}
+
+
+class _InlineSubmitter:
+    def submit_async(self, task) -> Future:
+        future = Future()
+        future.set_result(task())
+        return future
+
+
+def simulate(containers: List[Dict], durations: Dict[str, float], slots: int,
+             priorities: Optional[Dict[str, float]]) -> float:
+    graph = Workflow(WorkflowSchema(steps=[WorkflowStepSchema(**c) for c in containers]))
+    scheduler = WorkflowScheduler(graph)
+    now = 0.0
+    running: List = []
+
+    def launch(namespace: str, workflow_name: str, step_name: str, job_name: str) -> bool:
+        heapq.heappush(running, (now + durations[step_name], step_name))
+        return True
+
+    queue = StepAdmissionQueue(slots, _InlineSubmitter(), on_started=lambda *args: None)
+    queue.start(launch)
+    queue.stop()
+    queue.enqueue(NAMESPACE, "wf", [s.stepName for s in scheduler.get_ready()], None, priorities)
+    queue.dispatch()
+    while running:
+        now, step_name = heapq.heappop(running)
+        queue.release(NAMESPACE, "wf", step_name)
+        ready = scheduler.mark_executed(step_name)
+        queue.enqueue(NAMESPACE, "wf", [s.stepName for s in ready], None, priorities)
+        queue.dispatch()
+    return now
+
+
+def lower_bound(containers: List[Dict], durations: Dict[str, float], slots: int) -> float:
+    graph = Workflow(WorkflowSchema(steps=[WorkflowStepSchema(**c) for c in containers]))
+    store = StepDurationStore(len(containers))
+    for c in containers:
+        store.record("wf", c['stepName'], c['image'], durations[c['stepName']])
+    critical_path = max(store.get_critical_path_lengths("wf", graph, graph.topological_order()))
+    return max(critical_path, sum(durations.values()) / slots)
+
+
+def run_case(shape: str, steps: int, slots: int, noise: float, seed: int) -> Dict[str, float]:
+    rng = random.Random(seed)
+    containers = SHAPES[shape](steps, rng)
+    # Heavy tailed run times, as of real batch steps
+    durations = {c['stepName']: rng.lognormvariate(0, 1) for c in containers}
+
+    history = StepDurationStore(len(containers))
+    for c in containers:
+        history.record("wf", c['stepName'], c['image'], durations[c['stepName']] * rng.uniform(1 - noise, 1 + noise))
+    graph = Workflow(WorkflowSchema(steps=[WorkflowStepSchema(**c) for c in containers]))
+    lengths = history.get_critical_path_lengths("wf", graph, graph.topological_order())
+    priorities = {s.stepName: lengths[i] for i, s in enumerate(graph.steps)}
+
+    bound = lower_bound(containers, durations, slots)
+    return {
+        "fifo": simulate(containers, durations, slots, None) / bound,
+        "critical_path": simulate(containers, durations, slots, priorities) / bound,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Simulated makespan of FIFO vs critical path first admission.")
+    parser.add_argument("--steps", type=int, default=2000)
+    parser.add_argument("--slots", nargs="+", type=int, default=SLOTS)
+    parser.add_argument("--noise", type=float, default=0.3, help="Relative error of the recorded step durations.")
+    parser.add_argument("--seeds", type=int, default=5, help="Number of random workflows per case.")
+    args = parser.parse_args(argv)
+
+    print(f"{'shape':<20}{'slots':>6}{'FIFO / bound':>14}{'critical path / bound':>23}{'speedup':>9}")
+    for shape in SHAPES:
+        for slots in args.slots:
+            results = [run_case(shape, args.steps, slots, args.noise, seed) for seed in range(args.seeds)]
+            fifo = sum(r["fifo"] for r in results) / len(results)
+            critical_path = sum(r["critical_path"] for r in results) / len(results)
+            print(f"{shape:<20}{slots:>6}{fifo:>14.3f}{critical_path:>23.3f}{fifo / critical_path:>9.2f}x")
+
+
+if __name__ == '__main__':
+    main()
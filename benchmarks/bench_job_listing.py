@@ -0,0 +1,80 @@
+import time
+from typing import Dict, List, Optional
+
+import kubernetes
+
+from src.api_client import kubernetes_api
+from src.job.job_controller import JobController
+
+"""
+    Lookup of job names of a single workflow in a namespace holding 100k jobs:
+        * full namespace listing filtered on the client side (former implementation),
+        * label-selected, paginated listing,
+        * local job index.
+    The API server is replaced with an in-memory stand-in which counts objects it returns.
+    Run with: python -m benchmarks.bench_job_listing
+"""
+
+JOBS = 100_000
+WORKFLOWS = 1_000
+LOOKUPS = 20
+LABEL = "kopf__workflow__kopf"
+
+
+class FakeBatchV1Api:
+    def __init__(self, jobs: List[kubernetes.client.V1Job]):
+        self.jobs = jobs
+        self.by_workflow: Dict[str, List[kubernetes.client.V1Job]] = {}
+        for job in jobs:
+            self.by_workflow.setdefault(job.metadata.labels[LABEL], []).append(job)
+        self.returned_objects = 0
+        self.calls = 0
+
+    def list_namespaced_job(self, namespace: str, label_selector: Optional[str] = None, limit: Optional[int] = None,
+                            _continue: Optional[str] = None) -> kubernetes.client.V1JobList:
+        self.calls += 1
+        jobs = self.jobs
+        if label_selector:
+            jobs = self.by_workflow.get(label_selector.split('=')[1], [])
+        start = int(_continue or 0)
+        end = start + limit if limit else len(jobs)
+        items = jobs[start:end]
+        self.returned_objects += len(items)
+        return kubernetes.client.V1JobList(
+            items=items, metadata=kubernetes.client.V1ListMeta(_continue=str(end) if end < len(jobs) else None))
+
+
+def legacy_fetch_workflow_job_names(namespace: str, workflow_name: str) -> List[str]:
+    jobs = kubernetes_api.batch().list_namespaced_job(namespace=namespace)
+    jobs = [x.to_dict() for x in jobs.items if x.to_dict()['metadata']['labels'].get(LABEL) == workflow_name]
+    return [x['metadata']['name'] for x in jobs]
+
+
+def make_jobs() -> List[kubernetes.client.V1Job]:
+    return [kubernetes.client.V1Job(metadata=kubernetes.client.V1ObjectMeta(
+        name=f"step{i}-job", namespace="default", labels={LABEL: f"workflow{i % WORKFLOWS}", "label": "test"}))
+        for i in range(JOBS)]
+
+
+def run(name: str, api: FakeBatchV1Api, fetch) -> None:
+    api.calls, api.returned_objects = 0, 0
+    start = time.perf_counter()
+    for i in range(LOOKUPS):
+        names = list(fetch("default", f"workflow{i}"))
+        assert len(names) == JOBS // WORKFLOWS
+    elapsed = (time.perf_counter() - start) / LOOKUPS
+    print(f"{name:<24}{elapsed * 1e3:>14.2f}{api.calls / LOOKUPS:>14.1f}{api.returned_objects / LOOKUPS:>18.1f}")
+
+
+def main() -> None:
+    api = FakeBatchV1Api(make_jobs())
+    print(f"{'implementation':<24}{'ms/lookup':>14}{'calls/lookup':>14}{'objects/lookup':>18}")
+    kubernetes_api.configure(batch=api)
+    run("full list", api, legacy_fetch_workflow_job_names)
+    run("label selector", api, JobController.fetch_workflow_job_names)
+    # Second round of lookups is served from the job index synced by the first one
+    run("job index", api, JobController.fetch_workflow_job_names)
+
+
+if __name__ == '__main__':
+    main()
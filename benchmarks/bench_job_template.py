@@ -0,0 +1,88 @@
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+import uuid
+from typing import Callable, Dict, List, Optional
+
+import kopf
+import kubernetes
+
+from src.config import OperatorConfig
+from src.job.job_builder import BatchJobBuilder
+from src.job.job_controller import JobController
+from src.workflow.constants import WorkflowConstants
+from src.workflow.workflow_schema import WorkflowStepSchema
+
+"""
+    Cost of creating the manifest of a step job, as sent to the API server: the job built from kubernetes.client
+    models (how the operator built jobs before templates) vs. rendered from the template of the workflow. Both are
+    passed through sanitize_for_serialization, like the client does with the body of the create request, and their
+    serialized forms are checked to be identical.
+    Reported per way of creating the job: microseconds per job and peak memory allocated while creating a job.
+    Run with: python -m benchmarks.bench_job_template
+"""
+
+WORKFLOW = {
+    "apiVersion": "workflow.example.com/v1", "kind": "Workflow",
+    "metadata": {"uid": "bench-job-template", "name": "bench-job-template", "namespace": "default", "generation": 1,
+                 "labels": {"team": "data", "project": "benchmarks"}},
+    "spec": {"containers": [{"stepName": "step0", "image": "busybox", "command": ["sleep", "1"], "dependsOn": []}],
+             "maxStepTimeout": 60}
+}
+STEP = WorkflowStepSchema(**WORKFLOW["spec"]["containers"][0])
+serialize = kubernetes.client.ApiClient().sanitize_for_serialization
+
+
+def build_job(job_name: Optional[str] = None) -> Dict:
+    job_name = job_name or STEP.stepName + '-' + str(uuid.uuid4())
+    builder = BatchJobBuilder(job_name).add_container(job_name, STEP.image, commands=STEP.command) \
+        .add_labels({"kopf__workflow__kopf": WORKFLOW["metadata"]["name"],
+                     "kopf__workflow__step__kopf": STEP.stepName}) \
+        .add_labels(WORKFLOW["metadata"]["labels"]) \
+        .set_active_deadline(WORKFLOW["spec"]["maxStepTimeout"])
+    job = builder.build(WorkflowConstants.BACKOFF_LIMIT)
+    kopf.append_owner_reference(job, WORKFLOW)
+    return serialize(job)
+
+
+def render_job() -> Dict:
+    return serialize(JobController.create_job(STEP, WORKFLOW["metadata"]["name"], WORKFLOW))
+
+
+def measure(create: Callable[[], Dict], jobs: int) -> Dict:
+    start = time.perf_counter()
+    for _ in range(jobs):
+        create()
+    elapsed = time.perf_counter() - start
+    # Peak of memory allocated while creating a single job
+    peaks = []
+    tracemalloc.start()
+    for _ in range(min(jobs, 1000)):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        create()
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    return {"us_per_job": elapsed / jobs * 1e6, "bytes_per_job": sum(peaks) / len(peaks)}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Cost of creating manifests of step jobs.")
+    parser.add_argument("--jobs", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    OperatorConfig.JOB_ACTIVE_DEADLINE = True
+    rendered = render_job()
+    if json.dumps(build_job(rendered["metadata"]["name"])) != json.dumps(rendered):
+        raise RuntimeError("Rendered job differs from the built one.")
+    print(f"{'job':>10}{'us/job':>10}{'bytes/job':>12}")
+    for name, create in (("built", build_job), ("rendered", render_job)):
+        result = measure(create, args.jobs)
+        print(f"{name:>10}{result['us_per_job']:>10.1f}{result['bytes_per_job']:>12.0f}", flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
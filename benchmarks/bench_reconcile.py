@@ -0,0 +1,422 @@
+import argparse
+import json
+import logging
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Tuple
+
+import kopf
+import kubernetes
+from kopf._cogs.structs import diffs
+
+import workflow_operator
+from benchmarks.dags import SHAPES
+from benchmarks.fake_api import JOBS, WORKFLOWS, FakeApiServer, FakeBatchV1Api, FakeCluster, FakeCustomObjectsApi
+from src.api_client import kubernetes_api
+from src.config import OperatorConfig
+from src.sharding import shard_membership
+from src.workflow.admission_queue import step_admission_queue
+from src.workflow.constants import WorkflowConstants
+from src.workflow.deadline_scheduler import deadline_scheduler
+from src.workflow.execution_state import StepSet
+from src.workflow.patch_aggregator import workflow_patch_aggregator
+
+"""
+    End-to-end reconcile benchmark: real handlers of workflow_operator.py run against the in-memory API server
+    of benchmarks.fake_api. Watch events are dispatched to handlers the way kopf does it:
+        * every workflow event goes to index_workflow, a new workflow to create_workflow, a change
+          of status.execution.executed to update_workflow_after_step_execution and a change of status.workflow-status
+          to clean_up_finished_workflow. Workflows which already have a status when they are seen first (i.e. handled
+          before restart of the operator) go to the resume handlers, a change of labels to relabel.
+          Like kopf, the handlers get the latest state of the object and their patches are applied afterwards,
+        * every job event goes to handle_workflow_job_completion.
+    With sharding enabled, events of workflows owned by other replicas are filtered like kopf does it - only
+    index_workflow sees them.
+    Jobs complete as soon as their creation is observed (after --churn non terminal updates), so the numbers
+    describe the operator alone. Reported per run:
+        * events/s       - watch events handled per second of wall time,
+        * ready->job ms  - time from persisting the state which makes a step ready to creation of its Job (p50, p99),
+        * calls/step     - API requests made by the operator per workflow step,
+        * peak MiB       - peak of memory allocated by Python (only with --memory, measured in a separate run).
+    By default the operator calls the fake API in process. With --client the cluster is served over HTTP
+    (with --api-latency seconds added to every request) and the operator uses kubernetes.client:
+        * pooled   - the shared client with a keep-alive pool of API_CONNECTION_POOL_SIZE connections,
+        * per-call - a new client (and connection) for every request, as the operator did before the shared client.
+    --workflows runs that many workflows of the shape at the same time.
+    Run with: python -m benchmarks.bench_reconcile
+    As a regression gate: python -m benchmarks.bench_reconcile --save-baseline baseline.json on the reference
+    revision, then python -m benchmarks.bench_reconcile --baseline baseline.json exits with 1 if events/s dropped
+    or calls/step grew by more than --tolerance.
+"""
+
+NAMESPACE = "default"
+SIZES = [10, 100, 1000, 10000]
+TERMINAL_STATUSES = {"Completed", "Failed"}
+CLIENTS = ["pooled", "per-call"]
+
+
+class _PerCallApi:
+    """
+        API object creating a new client for every request.
+    """
+
+    def __init__(self, factory: Callable):
+        self.__factory = factory
+
+    def __getattr__(self, name: str):
+        return getattr(self.__factory(), name)
+
+
+class ReconcileHarness:
+    def __init__(self, churn: int = 0, timeout: float = 600, client: Optional[str] = None, api_latency: float = 0.0):
+        self.cluster = FakeCluster()
+        self.cluster.listeners.append(self.__on_change)
+        self.churn = churn
+        self.timeout = timeout
+        self.logger = logging.getLogger("bench_reconcile")
+        self.events = 0
+        self.retries = 0
+        self.latencies: List[float] = []
+        self.__handled_executed: Dict[Tuple[str, str], Optional[str]] = {}
+        self.__parents: Dict[Tuple[str, str], List[List[int]]] = {}
+        self.__children: Dict[Tuple[str, str], List[List[int]]] = {}
+        self.__ids: Dict[Tuple[str, str], Dict[str, int]] = {}
+        self.__ready_at: Dict[Tuple[str, str, int], float] = {}
+        # Spec of the workflow at the last handled generation
+        self.__handled_specs: Dict[Tuple[str, str], Dict] = {}
+        self.__handled_resumes: Dict[Tuple[str, str], Optional[str]] = {}
+        self.__handled_statuses: Dict[Tuple[str, str], Optional[str]] = {}
+        self.__handled_labels: Dict[Tuple[str, str], Optional[Dict]] = {}
+        # (workflow name, step name) -> number of times jobs of the step fail before one completes
+        self.failures: Dict[Tuple[str, str], int] = {}
+        self.__server: Optional[FakeApiServer] = None
+        self.__default_configuration = None
+        if client is None:
+            kubernetes_api.configure(custom_objects=FakeCustomObjectsApi(self.cluster),
+                                     batch=FakeBatchV1Api(self.cluster))
+            self.__kopf_api = kubernetes_api.custom_objects()
+            return
+        self.__server = FakeApiServer(self.cluster, api_latency)
+        self.__server.start()
+        configuration = kubernetes.client.Configuration()
+        configuration.host = self.__server.host
+        configuration.connection_pool_maxsize = OperatorConfig.API_CONNECTION_POOL_SIZE
+        # kopf talks to the API server with its own client
+        self.__kopf_api = kubernetes.client.CustomObjectsApi(kubernetes.client.ApiClient(configuration))
+        if client == "pooled":
+            kubernetes_api.configure(api_client=kubernetes.client.ApiClient(configuration))
+        else:
+            self.__default_configuration = kubernetes.client.Configuration.get_default_copy()
+            kubernetes.client.Configuration.set_default(configuration)
+            kubernetes_api.configure(custom_objects=_PerCallApi(kubernetes.client.CustomObjectsApi),
+                                     batch=_PerCallApi(kubernetes.client.BatchV1Api))
+
+    def close(self) -> None:
+        if self.__server is not None:
+            self.__server.stop()
+        if self.__default_configuration is not None:
+            kubernetes.client.Configuration.set_default(self.__default_configuration)
+
+    def add_workflow(self, name: str, containers: List[Dict], **spec) -> None:
+        """
+            @spec - other fields of the workflow spec, e.g. retryPolicy.
+        """
+        self.__set_steps(name, containers)
+        self.cluster.create(WORKFLOWS, {
+            'apiVersion': f"{WorkflowConstants.GROUP}/{WorkflowConstants.API_VERSION}",
+            'kind': 'Workflow',
+            'metadata': {'name': name, 'namespace': NAMESPACE, 'labels': {'benchmark': 'reconcile'}},
+            'spec': {'maxStepTimeout': -1, 'containers': containers, **spec}
+        })
+
+    def update_workflow(self, name: str, containers: List[Dict]) -> None:
+        """
+            Replaces steps of the workflow, like `kubectl apply` of an edited spec.
+        """
+        self.__set_steps(name, containers)
+        self.cluster.patch(WORKFLOWS, NAMESPACE, name, {'spec': {'containers': containers}})
+
+    def __set_steps(self, name: str, containers: List[Dict]) -> None:
+        key = (NAMESPACE, name)
+        self.__ids[key] = {c['stepName']: i for i, c in enumerate(containers)}
+        self.__parents[key] = [[self.__ids[key][p] for p in c['dependsOn']] for c in containers]
+        self.__children[key] = [[] for _ in containers]
+        for child, parents in enumerate(self.__parents[key]):
+            for parent in parents:
+                self.__children[key][parent].append(child)
+
+    def run(self) -> None:
+        """
+            Dispatches events until all workflows are finished. Ready steps are started by the step dispatcher
+            of the operator, running for the duration of the call.
+        """
+        step_admission_queue.start(workflow_operator.launch_workflow_step)
+        # Serves retries of failed steps
+        deadline_scheduler.start()
+        try:
+            self.__dispatch_events()
+        finally:
+            step_admission_queue.stop()
+            deadline_scheduler.stop()
+
+    def __dispatch_events(self) -> None:
+        deadline = time.time() + self.timeout
+        while True:
+            item = self.cluster.watch(timeout=0.05)
+            if item is None:
+                if self.__all_finished():
+                    return
+            else:
+                self.events += 1
+                resource, event = item
+                if resource == WORKFLOWS:
+                    self.__on_workflow_event(event)
+                elif resource == JOBS:
+                    self.__on_job_event(event)
+            if time.time() > deadline:
+                raise TimeoutError(f"Workflows did not finish within {self.timeout} seconds.")
+
+    def api_calls(self) -> int:
+        return sum(self.cluster.calls.values())
+
+    def __all_finished(self) -> bool:
+        return not step_admission_queue.has_queued() and all(
+            w.get('status', {}).get('workflow-status') in TERMINAL_STATUSES and
+            not workflow_patch_aggregator.has_pending(ns, name)
+            for (ns, name), w in self.cluster.objects[WORKFLOWS].items() if shard_membership.owns(ns, name))
+
+    def __on_workflow_event(self, event: Dict) -> None:
+        name, namespace = event['object']['metadata']['name'], event['object']['metadata']['namespace']
+        workflow_operator.index_workflow(event=event, name=name, namespace=namespace, logger=self.logger)
+        if event['type'] == 'DELETED' or not workflow_operator.is_owned_workflow(name=name, namespace=namespace):
+            return
+        key = (namespace, name)
+        # Events queued in the meantime are batched - handlers see the current object
+        body = self.cluster.objects[WORKFLOWS][key]
+        if key not in self.__handled_executed:
+            if 'workflow-status' in body.get('status', {}):
+                # Handled before restart of the operator
+                self.__resume(body)
+            elif self.__run_handler(workflow_operator.create_workflow, body):
+                self.__handled_executed[key] = None
+                self.__handled_specs[key] = body['spec']
+                self.__handled_labels[key] = body['metadata'].get('labels')
+            return
+        if body['spec'] != self.__handled_specs[key]:
+            if self.__run_handler(workflow_operator.spec_update, body, old=self.__handled_specs[key]):
+                self.__handled_specs[key] = body['spec']
+            return
+        labels = body['metadata'].get('labels')
+        if labels != self.__handled_labels.get(key):
+            diff = diffs.diff(self.__handled_labels.get(key), labels)
+            if self.__run_handler(workflow_operator.relabel, body, diff=diff):
+                self.__handled_labels[key] = labels
+            return
+        resume = body['metadata'].get('annotations', {}).get('workflow-resume')
+        if resume != self.__handled_resumes.get(key):
+            if self.__run_handler(workflow_operator.resume_failed_workflow, body, new=resume):
+                self.__handled_resumes[key] = resume
+            return
+        executed = body.get('status', {}).get('execution', {}).get('executed')
+        if executed != self.__handled_executed[key]:
+            if self.__run_handler(workflow_operator.update_workflow_after_step_execution, body):
+                self.__handled_executed[key] = executed
+        status = body.get('status', {}).get('workflow-status')
+        if status != self.__handled_statuses.get(key):
+            if self.__run_handler(workflow_operator.clean_up_finished_workflow, body, new=status):
+                self.__handled_statuses[key] = status
+
+    def __resume(self, body: Dict) -> None:
+        key = (body['metadata']['namespace'], body['metadata']['name'])
+        for handler in [workflow_operator.migrate_execution_state, workflow_operator.resume_workflow_timeout,
+                        workflow_operator.resume_workflow_steps]:
+            if not self.__run_handler(handler, body):
+                return
+        self.__handled_executed[key] = ReconcileHarness.__get_executed(body)
+        self.__handled_specs[key] = body['spec']
+        self.__handled_labels[key] = body['metadata'].get('labels')
+        self.__handled_resumes[key] = body['metadata'].get('annotations', {}).get('workflow-resume')
+        self.__handled_statuses[key] = body['status']['workflow-status']
+
+    def __on_job_event(self, event: Dict) -> None:
+        job = event['object']
+        if not workflow_operator.is_owned_job(body=job, namespace=job['metadata']['namespace']):
+            return
+        workflow_operator.handle_workflow_job_completion(event=event, namespace=job['metadata']['namespace'],
+                                                         logger=self.logger)
+        if event['type'] == 'ADDED':
+            for _ in range(self.churn):
+                self.cluster.touch_job(job['metadata']['namespace'], job['metadata']['name'])
+            labels = job['metadata']['labels']
+            failure_key = (labels['kopf__workflow__kopf'], labels['kopf__workflow__step__kopf'])
+            failures = self.failures.get(failure_key, 0)
+            self.failures[failure_key] = max(0, failures - 1)
+            self.cluster.set_job_condition(job['metadata']['namespace'], job['metadata']['name'],
+                                           'Failed' if failures else 'Complete')
+
+    def __run_handler(self, handler, body: Dict, **kwargs) -> bool:
+        patch = {}
+        name, namespace = body['metadata']['name'], body['metadata']['namespace']
+        succeeded = True
+        try:
+            handler(body=body, name=name, namespace=namespace, patch=patch, logger=self.logger, **kwargs)
+        except kopf.TemporaryError:
+            # kopf retries the handler later, the retry is queued behind events which are already waiting
+            self.retries += 1
+            succeeded = False
+        if patch:
+            # kopf sends status to the status subresource and the rest to the object itself
+            api = self.__kopf_api
+            for method, part in [(api.patch_namespaced_custom_object_status, {'status': patch.get('status')}),
+                                 (api.patch_namespaced_custom_object, {k: v for k, v in patch.items() if k != 'status'})]:
+                if any(part.values()):
+                    method(group=WorkflowConstants.GROUP, version=WorkflowConstants.API_VERSION, namespace=namespace,
+                           plural=WorkflowConstants.PLURAL, name=name, body=part)
+        if not succeeded:
+            self.cluster.republish(WORKFLOWS, namespace, name)
+        return succeeded
+
+    def __on_change(self, resource: str, old: Optional[Dict], new: Optional[Dict]) -> None:
+        now = time.perf_counter()
+        if resource == WORKFLOWS and new is not None:
+            key = (new['metadata']['namespace'], new['metadata']['name'])
+            if old is None:
+                for step_id, parents in enumerate(self.__parents[key]):
+                    if not parents:
+                        self.__ready_at[(*key, step_id)] = now
+                return
+            executed = StepSet.decode(ReconcileHarness.__get_executed(new))
+            newly_executed = executed.bits & ~StepSet.decode(ReconcileHarness.__get_executed(old)).bits
+            for step_id in StepSet(newly_executed):
+                for child in self.__children[key][step_id]:
+                    if all(p in executed for p in self.__parents[key][child]):
+                        self.__ready_at.setdefault((*key, child), now)
+        elif resource == JOBS and old is None:
+            labels = new['metadata']['labels']
+            key = (new['metadata']['namespace'], labels['kopf__workflow__kopf'])
+            ready_at = self.__ready_at.pop((*key, self.__ids[key][labels['kopf__workflow__step__kopf']]), None)
+            if ready_at is not None:
+                self.latencies.append(now - ready_at)
+
+    @staticmethod
+    def __get_executed(workflow: Dict) -> str:
+        return workflow.get('status', {}).get('execution', {}).get('executed', '')
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run_case(shape: str, steps: int, churn: int, run_id: int, workflows: int = 1, client: Optional[str] = None,
+             api_latency: float = 0.0, fuse_chains: bool = False) -> Dict:
+    harness = ReconcileHarness(churn=churn, client=client, api_latency=api_latency)
+    try:
+        for i in range(workflows):
+            harness.add_workflow(f"bench-{shape}-{steps}-{run_id}-{i}", SHAPES[shape](steps),
+                                 **({'fuseChains': True} if fuse_chains else {}))
+        start = time.perf_counter()
+        harness.run()
+        elapsed = time.perf_counter() - start
+    finally:
+        harness.close()
+    statuses = {w['status']['workflow-status'] for w in harness.cluster.objects[WORKFLOWS].values()}
+    # Jobs of fused chains run more than one step
+    if statuses != {"Completed"} or (len(harness.cluster.objects[JOBS]) != steps * workflows and not fuse_chains):
+        raise RuntimeError(f"Workflows {shape}/{steps} ended as {statuses} with {len(harness.cluster.objects[JOBS])} "
+                           f"jobs.")
+    return {
+        "events_per_sec": harness.events / elapsed,
+        "steps_per_sec": steps * workflows / elapsed,
+        "ready_to_job_p50_ms": percentile(harness.latencies, 0.5) * 1e3,
+        "ready_to_job_p99_ms": percentile(harness.latencies, 0.99) * 1e3,
+        "api_calls_per_step": harness.api_calls() / (steps * workflows),
+        "seconds": elapsed,
+    }
+
+
+def measure_memory(shape: str, steps: int, churn: int, run_id: int, workflows: int = 1) -> float:
+    tracemalloc.start()
+    try:
+        run_case(shape, steps, churn, run_id, workflows)
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    regressions = []
+    for case, result in results.items():
+        if case not in baseline:
+            continue
+        expected = baseline[case]
+        if result["events_per_sec"] < expected["events_per_sec"] * (1 - tolerance):
+            regressions.append(f"{case}: {result['events_per_sec']:.0f} events/s, "
+                               f"baseline {expected['events_per_sec']:.0f}")
+        if result["api_calls_per_step"] > expected["api_calls_per_step"] * (1 + tolerance):
+            regressions.append(f"{case}: {result['api_calls_per_step']:.2f} API calls/step, "
+                               f"baseline {expected['api_calls_per_step']:.2f}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Reconcile throughput benchmark against an in-memory API server.")
+    parser.add_argument("--shapes", nargs="+", default=list(SHAPES), choices=list(SHAPES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=SIZES)
+    parser.add_argument("--churn", type=int, default=0, help="Non terminal updates of every job before completion.")
+    parser.add_argument("--patch-window", type=float, default=0.0,
+                        help="PATCH_COALESCE_WINDOW used by the operator, 0 makes runs deterministic.")
+    parser.add_argument("--workflows", type=int, default=1, help="Number of workflows run at the same time.")
+    parser.add_argument("--client", choices=CLIENTS,
+                        help="Serve the cluster over HTTP and call it with the given kind of kubernetes.client.")
+    parser.add_argument("--api-latency", type=float, default=0.0,
+                        help="Seconds added to every HTTP request (only with --client).")
+    parser.add_argument("--memory", action="store_true", help="Measure peak memory in an additional run.")
+    parser.add_argument("--fuse-chains", action="store_true", help="Run workflows with spec.fuseChains set.")
+    parser.add_argument("--baseline", help="JSON file with results to compare against.")
+    parser.add_argument("--save-baseline", help="Write results to the given JSON file.")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    workflow_patch_aggregator.window = args.patch_window
+    workflow_patch_aggregator.start()
+    step_admission_queue.start(workflow_operator.launch_workflow_step)
+
+    results: Dict[str, Dict] = {}
+    print(f"{'shape':<16}{'steps':>7}{'events/s':>11}{'steps/s':>10}{'ready->job ms p50':>19}{'p99':>9}"
+          f"{'calls/step':>12}{'peak MiB':>10}")
+    run_id = 0
+    for shape in args.shapes:
+        for steps in args.sizes:
+            run_id += 1
+            result = run_case(shape, steps, args.churn, run_id, args.workflows, args.client, args.api_latency,
+                              args.fuse_chains)
+            if args.memory:
+                run_id += 1
+                result["peak_mib"] = measure_memory(shape, steps, args.churn, run_id, args.workflows)
+            results[f"{shape}/{steps}"] = result
+            print(f"{shape:<16}{steps:>7}{result['events_per_sec']:>11.0f}{result['steps_per_sec']:>10.0f}"
+                  f"{result['ready_to_job_p50_ms']:>19.2f}"
+                  f"{result['ready_to_job_p99_ms']:>9.2f}{result['api_calls_per_step']:>12.2f}"
+                  f"{result.get('peak_mib', float('nan')):>10.1f}", flush=True)
+    step_admission_queue.stop()
+    workflow_patch_aggregator.stop()
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import time
+from collections import deque
+
+from benchmarks.dags import SHAPES
+from src.workflow.execution_state import StepSet
+from src.workflow.scheduler import WorkflowScheduler
+from src.workflow.workflow_controller import WorkflowController
+from src.workflow.workflow import Workflow
+from src.workflow.workflow_schema import WorkflowSchema, WorkflowStepSchema
+
+"""
+    Per-event cost of ready-set computation: incremental counters vs rescanning the graph on every event,
+    and the full per-event path of the operator (WorkflowController.get_steps_to_execute on a workflow body,
+    including decoding of its execution state).
+    Run with: python -m benchmarks.bench_scheduler
+"""
+
+SIZES = [1_000, 10_000, 50_000]
+# Rescanning is quadratic over the workflow lifetime, limit number of events measured for it
+RESCAN_EVENTS = 200
+# Encoding of the execution state between events isn't measured, but it is linear in the workflow size
+CONTROLLER_EVENTS = 200
+
+
+def run_incremental(graph: Workflow, order) -> float:
+    scheduler = WorkflowScheduler(graph)
+    start = time.perf_counter()
+    for s in order:
+        scheduler.mark_executed(s.stepName)
+    return (time.perf_counter() - start) / len(order)
+
+
+def run_rescan(graph: Workflow, order) -> float:
+    executed = set()
+    start = time.perf_counter()
+    for s in order[:RESCAN_EVENTS]:
+        executed.add(s.stepName)
+        graph.get_next_to_execute(executed)
+    return (time.perf_counter() - start) / RESCAN_EVENTS
+
+
+def run_controller(shape: str, containers, graph: Workflow) -> float:
+    """
+        Executes steps one by one, in the order they have been started, and times get_steps_to_execute
+        after every step. Returned steps are marked as started, as the step dispatcher would do.
+    """
+    body = {
+        "metadata": {"name": f"bench-{shape}", "namespace": "default", "uid": f"bench-{shape}-{len(containers)}",
+                     "generation": 1},
+        "spec": {"containers": containers},
+        "status": {"workflow-status": "Started", "execution": {"version": 1, "executed": "", "started": ""}}
+    }
+    executed, started = StepSet(), StepSet()
+    running = deque()
+
+    def start(steps) -> None:
+        for step in steps:
+            step_id = graph.get_id(step.stepName)
+            started.add(step_id)
+            running.append(step_id)
+        body["status"]["execution"]["started"] = started.encode()
+
+    start(WorkflowController.get_steps_to_execute(body))
+    elapsed, events = 0.0, 0
+    while running and events < CONTROLLER_EVENTS:
+        executed.add(running.popleft())
+        body["status"]["execution"]["executed"] = executed.encode()
+        start_time = time.perf_counter()
+        ready = WorkflowController.get_steps_to_execute(body)
+        elapsed += time.perf_counter() - start_time
+        events += 1
+        start(ready)
+    return elapsed / events
+
+
+def main() -> None:
+    print(f"{'shape':<16}{'steps':>8}{'incremental us/event':>24}{'rescan us/event':>20}{'controller us/event':>24}")
+    for shape, generate in SHAPES.items():
+        for size in SIZES:
+            steps = [WorkflowStepSchema(**c) for c in generate(size)]
+            graph = Workflow(WorkflowSchema(steps=steps))
+            # Steps are generated in a topological order
+            incremental = run_incremental(graph, steps)
+            rescan = run_rescan(graph, steps)
+            controller = run_controller(shape, generate(size), graph)
+            print(f"{shape:<16}{size:>8}{incremental * 1e6:>24.2f}{rescan * 1e6:>20.2f}{controller * 1e6:>24.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import logging
+import sys
+import time
+from typing import Dict, List, Optional
+
+from benchmarks.bench_reconcile import NAMESPACE, ReconcileHarness
+from benchmarks.dags import SHAPES
+from benchmarks.fake_api import JOBS, WORKFLOWS
+from src.sharding import shard_membership
+from src.workflow.patch_aggregator import workflow_patch_aggregator
+
+"""
+    Throughput of the operator sharded between replicas. For every number of replicas, all workflows are created
+    in the in-memory cluster of bench_reconcile once per replica and every replica runs only the workflows hashed
+    to it (events of other workflows are filtered like in the operator). Replicas share nothing but the API server,
+    which costs nothing here - they are run one after another and the aggregate throughput is the number of steps
+    of all workflows divided by the time of the slowest replica, i.e. what replicas on their own cores achieve.
+    Reported per number of replicas:
+        * workflows min/max - workflows owned by the least and the most loaded replica,
+        * slowest s         - run time of the slowest replica,
+        * steps/s           - aggregate throughput, with speedup and efficiency (speedup / replicas) against
+                              a single replica.
+    Run with: python -m benchmarks.bench_sharding
+"""
+
+
+def run_replica(identity: str, members: List[str], workflows: Dict[str, List[Dict]]) -> Dict:
+    shard_membership.identity = identity
+    shard_membership.set_members(members)
+    harness = ReconcileHarness()
+    for name, containers in workflows.items():
+        harness.add_workflow(name, containers)
+    start = time.perf_counter()
+    harness.run()
+    elapsed = time.perf_counter() - start
+    owned = [name for name in workflows if shard_membership.owns(NAMESPACE, name)]
+    statuses = {harness.cluster.objects[WORKFLOWS][(NAMESPACE, name)]['status']['workflow-status'] for name in owned}
+    steps = sum(len(workflows[name]) for name in owned)
+    if owned and (statuses != {"Completed"} or len(harness.cluster.objects[JOBS]) != steps):
+        raise RuntimeError(f"Workflows of replica {identity} ended as {statuses} with "
+                           f"{len(harness.cluster.objects[JOBS])} jobs, expected {steps}.")
+    return {"workflows": len(owned), "steps": steps, "seconds": elapsed}
+
+
+def run_case(shape: str, steps: int, workflows: int, replicas: int, run_id: int) -> Dict:
+    specs = {f"bench-shard-{run_id}-{i}": SHAPES[shape](steps) for i in range(workflows)}
+    members = [f"replica-{i}" for i in range(replicas)]
+    results = [run_replica(identity, members, specs) for identity in members]
+    slowest = max(r["seconds"] for r in results)
+    return {
+        "workflows_min": min(r["workflows"] for r in results),
+        "workflows_max": max(r["workflows"] for r in results),
+        "slowest_seconds": slowest,
+        "steps_per_sec": sum(r["steps"] for r in results) / slowest,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Throughput of the operator sharded between replicas.")
+    parser.add_argument("--shape", default="fan_out", choices=list(SHAPES))
+    parser.add_argument("--steps", type=int, default=20, help="Steps of every workflow.")
+    parser.add_argument("--workflows", type=int, default=400)
+    parser.add_argument("--replicas", nargs="+", type=int, default=[1, 2, 4, 8])
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    workflow_patch_aggregator.window = 0.0
+    workflow_patch_aggregator.start()
+    enabled, identity = shard_membership.enabled, shard_membership.identity
+    shard_membership.enabled = True
+    print(f"{'replicas':>8}{'workflows min':>15}{'max':>6}{'slowest s':>11}{'steps/s':>10}{'speedup':>9}"
+          f"{'efficiency':>12}")
+    single = None
+    try:
+        for run_id, replicas in enumerate(args.replicas):
+            result = run_case(args.shape, args.steps, args.workflows, replicas, run_id)
+            single = single or result["steps_per_sec"] / replicas
+            speedup = result["steps_per_sec"] / single
+            print(f"{replicas:>8}{result['workflows_min']:>15}{result['workflows_max']:>6}"
+                  f"{result['slowest_seconds']:>11.2f}{result['steps_per_sec']:>10.0f}{speedup:>9.2f}"
+                  f"{speedup / replicas:>12.2f}", flush=True)
+    finally:
+        shard_membership.enabled, shard_membership.identity = enabled, identity
+        shard_membership.set_members([])
+        workflow_patch_aggregator.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
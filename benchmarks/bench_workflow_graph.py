@@ -0,0 +1,95 @@
+import itertools
+import time
+import tracemalloc
+from typing import List, Set
+
+from benchmarks.dags import SHAPES
+from src.workflow.workflow import Workflow
+from src.workflow.workflow_schema import WorkflowSchema, WorkflowStepSchema
+
+"""
+    Memory use and speed of the CSR workflow graph compared to the former networkx based one.
+    networkx is needed only to run the baseline: pip install networkx
+    Run with: python -m benchmarks.bench_workflow_graph
+"""
+
+SIZES = [1_000, 10_000, 50_000]
+
+try:
+    import networkx as nx
+except ImportError:
+    nx = None
+
+if nx is not None:
+    class LegacyWorkflow(nx.DiGraph):
+        """
+            Copy of the networkx subclass used before the graph got integer step ids.
+        """
+
+        def __init__(self, schema: WorkflowSchema):
+            super().__init__()
+            self.name_to_node = {}
+            for step in schema.steps:
+                self.add_node(step)
+                self.name_to_node[step.stepName] = step
+            for step in schema.steps:
+                for parent in step.dependsOn:
+                    self.add_edge(self.name_to_node[parent], step)
+
+        def get_next_to_execute(self, executed_steps: Set[str]) -> Set[WorkflowStepSchema]:
+            if not executed_steps:
+                return set([step for step in list(self.nodes) if not list(self.predecessors(step))])
+            to_execute = set()
+            nodes = [self.name_to_node[s] for s in executed_steps]
+            for child in set(itertools.chain(*[list(self.successors(n)) for n in nodes])):
+                if child.stepName in executed_steps:
+                    continue
+                if all([n.stepName in executed_steps for n in self.predecessors(child)]):
+                    to_execute.add(child)
+            return to_execute
+
+
+def measure(build, steps: List[WorkflowStepSchema]):
+    schema = WorkflowSchema(steps=steps)
+    tracemalloc.start()
+    graph = build(schema)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del graph
+
+    start = time.perf_counter()
+    graph = build(schema)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if isinstance(graph, Workflow):
+        graph.topological_order()
+        graph.find_cycle()
+    else:
+        list(nx.topological_sort(graph))
+        nx.is_directed_acyclic_graph(graph)
+    validation_time = time.perf_counter() - start
+
+    executed = set(s.stepName for s in steps[:len(steps) // 2])
+    start = time.perf_counter()
+    graph.get_next_to_execute(executed)
+    next_time = time.perf_counter() - start
+    return build_time, memory, validation_time, next_time
+
+
+def main() -> None:
+    if nx is None:
+        print("networkx is not installed - only the CSR graph is measured.")
+    print(f"{'shape':<16}{'steps':>8}{'impl':>10}{'build ms':>12}{'graph MiB':>12}{'validate ms':>14}{'next ms':>10}")
+    for shape, generate in SHAPES.items():
+        for size in SIZES:
+            steps = [WorkflowStepSchema(**c) for c in generate(size)]
+            implementations = [("csr", Workflow)] + ([("networkx", LegacyWorkflow)] if nx is not None else [])
+            for name, build in implementations:
+                build_time, memory, validation_time, next_time = measure(build, steps)
+                print(f"{shape:<16}{size:>8}{name:>10}{build_time * 1e3:>12.1f}{memory / 2 ** 20:>12.2f}"
+                      f"{validation_time * 1e3:>14.1f}{next_time * 1e3:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
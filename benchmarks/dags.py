@@ -0,0 +1,39 @@
+from typing import Dict, List
+
+"""
+    Generators of workflow specs (lists of spec.containers entries) of various shapes.
+"""
+
+
+def step(name: str, depends_on: List[str]) -> Dict:
+    return {"stepName": name, "image": "busybox", "command": ["true"], "dependsOn": depends_on}
+
+
+def chain(n: int) -> List[Dict]:
+    return [step(f"step{i}", [f"step{i - 1}"] if i else []) for i in range(n)]
+
+
+def fan_out(n: int) -> List[Dict]:
+    """
+        One root followed by n - 2 independent steps joined by a single sink.
+    """
+    middle = [step(f"step{i}", ["step0"]) for i in range(1, n - 1)]
+    return [step("step0", [])] + middle + [step(f"step{n - 1}", [s["stepName"] for s in middle])]
+
+
+def diamond_lattice(n: int, width: int = 10) -> List[Dict]:
+    """
+        Layers of @width steps, every step depends on the two closest steps of the previous layer.
+    """
+    steps = []
+    for i in range(n):
+        layer, pos = divmod(i, width)
+        if layer == 0:
+            steps.append(step(f"step{i}", []))
+        else:
+            parents = {(layer - 1) * width + pos, (layer - 1) * width + (pos + 1) % width}
+            steps.append(step(f"step{i}", [f"step{p}" for p in sorted(parents)]))
+    return steps
+
+
+SHAPES = {"chain": chain, "fan_out": fan_out, "diamond_lattice": diamond_lattice}
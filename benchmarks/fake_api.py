@@ -0,0 +1,440 @@
+import itertools
+import json
+import queue
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import kubernetes
+
+"""
+    In-memory stand-in for the parts of the Kubernetes API used by the operator: workflow custom objects
+    (with status subresource), batch/v1 jobs and coordination.k8s.io/v1 leases. Every change of an object is published as a watch event.
+    Objects are never modified in place - a patch produces a new object sharing unchanged subtrees, so objects
+    handed out (and carried by events) are stable snapshots.
+    The API is available in process (Fake*Api classes) or over HTTP (FakeApiServer), for the real client.
+"""
+
+WORKFLOWS = "workflows"
+JOBS = "jobs"
+LEASES = "leases"
+
+
+def merge_patch(target: Dict, patch: Dict) -> Dict:
+    """
+        JSON merge patch (RFC 7386), @target is left intact.
+    """
+    result = dict(target)
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        elif isinstance(value, dict):
+            result[key] = merge_patch(result[key] if isinstance(result.get(key), dict) else {}, value)
+        else:
+            result[key] = value
+    return result
+
+
+def matches_selector(labels: Optional[Dict], selector: Optional[str]) -> bool:
+    """
+        Supports equality (k=v, k!=v), set (k in (a,b), k notin (a,b)) and existence (k, !k) requirements.
+    """
+    labels = labels or {}
+    if not selector:
+        return True
+    for requirement in _split_selector(selector):
+        if ' notin ' in requirement or ' in ' in requirement:
+            negated = ' notin ' in requirement
+            key, values = requirement.split(' notin ' if negated else ' in ', 1)
+            values = {v.strip() for v in values.strip().strip('()').split(',')}
+            if (labels.get(key.strip()) in values) == (not negated):
+                continue
+            return False
+        if '!=' in requirement:
+            key, value = requirement.split('!=', 1)
+            if labels.get(key.strip()) == value.strip():
+                return False
+        elif '=' in requirement:
+            key, value = requirement.split('==' if '==' in requirement else '=', 1)
+            if labels.get(key.strip()) != value.strip():
+                return False
+        elif requirement.startswith('!'):
+            if requirement[1:].strip() in labels:
+                return False
+        elif requirement not in labels:
+            return False
+    return True
+
+
+def _split_selector(selector: str) -> List[str]:
+    # Commas inside of "in (a,b)" don't separate requirements
+    requirements, depth, current = [], 0, ''
+    for char in selector:
+        depth += char == '('
+        depth -= char == ')'
+        if char == ',' and not depth:
+            requirements.append(current.strip())
+            current = ''
+        else:
+            current += char
+    return requirements + [current.strip()] if current.strip() else requirements
+
+
+class FakeCluster:
+    # Shared by all clusters of the process - indexes of the operator keep the object with the highest version,
+    # reused names must not go back in versions
+    __RESOURCE_VERSIONS__ = itertools.count(1)
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.objects: Dict[str, Dict[Tuple[str, str], Dict]] = {WORKFLOWS: {}, JOBS: {}, LEASES: {}}
+        # Counts of API requests by (verb, resource), requests made by the harness itself are not counted
+        self.calls: Counter = Counter()
+        # Called under the cluster lock with (resource, old object or None, new object or None) after every change
+        self.listeners: List[Callable[[str, Optional[Dict], Optional[Dict]], None]] = []
+        self.__events: "queue.Queue[Tuple[str, Dict]]" = queue.Queue()
+
+    def watch(self, timeout: Optional[float] = None) -> Optional[Tuple[str, Dict]]:
+        """
+            Returns next (resource, event) pair, or None if nothing happened within @timeout seconds.
+        """
+        try:
+            return self.__events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def get(self, resource: str, namespace: str, name: str) -> Dict:
+        with self.lock:
+            obj = self.objects[resource].get((namespace, name))
+        if obj is None:
+            raise kubernetes.client.ApiException(status=404, reason="Not Found")
+        return obj
+
+    def list(self, resource: str, namespace: Optional[str] = None, label_selector: Optional[str] = None) -> List[Dict]:
+        with self.lock:
+            return [obj for (ns, _), obj in self.objects[resource].items()
+                    if (namespace is None or ns == namespace) and
+                    matches_selector(obj['metadata'].get('labels'), label_selector)]
+
+    def create(self, resource: str, obj: Dict) -> Dict:
+        with self.lock:
+            key = (obj['metadata']['namespace'], obj['metadata']['name'])
+            if key in self.objects[resource]:
+                raise kubernetes.client.ApiException(status=409, reason="AlreadyExists")
+            obj = merge_patch(obj, {'metadata': {
+                'uid': str(uuid.uuid4()),
+                'generation': 1,
+                'creationTimestamp': datetime.utcnow().isoformat() + 'Z',
+                'resourceVersion': str(next(FakeCluster.__RESOURCE_VERSIONS__))
+            }})
+            self.__commit(resource, key, None, obj, 'ADDED')
+            return obj
+
+    def patch(self, resource: str, namespace: str, name: str, patch: Dict, subresource: Optional[str] = None) -> Dict:
+        """
+            Merge patch of the object. metadata.resourceVersion in @patch is a precondition.
+            Status of workflows can be patched only through the status subresource and vice versa.
+        """
+        with self.lock:
+            old = self.get(resource, namespace, name)
+            expected_version = patch.get('metadata', {}).get('resourceVersion')
+            if expected_version is not None and expected_version != old['metadata']['resourceVersion']:
+                raise kubernetes.client.ApiException(status=409, reason="Conflict")
+            if resource == WORKFLOWS:
+                patch = {'status': patch.get('status', {})} if subresource == 'status' else \
+                    {k: v for k, v in patch.items() if k != 'status'}
+            new = merge_patch(old, {k: v for k, v in patch.items() if k != 'metadata'})
+            new['metadata'] = merge_patch(old['metadata'], {
+                k: v for k, v in patch.get('metadata', {}).items() if k in ['labels', 'annotations', 'ownerReferences']})
+            if new == old:
+                return old
+            if new.get('spec') != old.get('spec'):
+                new['metadata']['generation'] = old['metadata']['generation'] + 1
+            new['metadata']['resourceVersion'] = str(next(FakeCluster.__RESOURCE_VERSIONS__))
+            self.__commit(resource, (namespace, name), old, new, 'MODIFIED')
+            return new
+
+    def delete(self, resource: str, namespace: str, name: str) -> Dict:
+        with self.lock:
+            old = self.get(resource, namespace, name)
+            self.__commit(resource, (namespace, name), old, None, 'DELETED')
+            return old
+
+    def republish(self, resource: str, namespace: str, name: str) -> None:
+        """
+            Publishes current state of the object again, without changing it.
+        """
+        self.__events.put((resource, {'type': 'MODIFIED', 'object': self.get(resource, namespace, name)}))
+
+    def set_job_condition(self, namespace: str, name: str, condition: str) -> None:
+        """
+            Plays the part of the Job controller - marks job as 'Complete' or 'Failed'.
+        """
+        self.patch(JOBS, namespace, name, {'status': {
+            'conditions': [{'type': condition, 'status': 'True'}],
+            'active': 0, 'succeeded' if condition == 'Complete' else 'failed': 1}})
+
+    def touch_job(self, namespace: str, name: str) -> None:
+        """
+            Non terminal update of the job, like the ones caused by pod scheduling and startup.
+        """
+        job = self.get(JOBS, namespace, name)
+        self.patch(JOBS, namespace, name, {'status': {'active': job.get('status', {}).get('active', 0) + 1}})
+
+    def __commit(self, resource: str, key: Tuple[str, str], old: Optional[Dict], new: Optional[Dict],
+                 event_type: str) -> None:
+        if new is None:
+            del self.objects[resource][key]
+        else:
+            self.objects[resource][key] = new
+        for listener in self.listeners:
+            listener(resource, old, new)
+        self.__events.put((resource, {'type': event_type, 'object': new if new is not None else old}))
+
+
+class FakeCustomObjectsApi:
+    def __init__(self, cluster: FakeCluster):
+        self.cluster = cluster
+
+    def get_namespaced_custom_object(self, group: str, version: str, namespace: str, plural: str, name: str) -> Dict:
+        self.cluster.calls['get', plural] += 1
+        return self.cluster.get(plural, namespace, name)
+
+    def list_namespaced_custom_object(self, group: str, version: str, namespace: str, plural: str,
+                                      label_selector: Optional[str] = None, limit: Optional[int] = None,
+                                      _continue: Optional[str] = None) -> Dict:
+        self.cluster.calls['list', plural] += 1
+        return FakeCustomObjectsApi.__page(self.cluster.list(plural, namespace, label_selector), limit, _continue)
+
+    def list_cluster_custom_object(self, group: str, version: str, plural: str, label_selector: Optional[str] = None,
+                                   limit: Optional[int] = None, _continue: Optional[str] = None) -> Dict:
+        self.cluster.calls['list', plural] += 1
+        return FakeCustomObjectsApi.__page(self.cluster.list(plural, None, label_selector), limit, _continue)
+
+    def create_namespaced_custom_object(self, group: str, version: str, namespace: str, plural: str,
+                                        body: Dict) -> Dict:
+        self.cluster.calls['create', plural] += 1
+        return self.cluster.create(plural, merge_patch(body, {'metadata': {'namespace': namespace}}))
+
+    def patch_namespaced_custom_object(self, group: str, version: str, namespace: str, plural: str, name: str,
+                                       body: Dict) -> Dict:
+        self.cluster.calls['patch', plural] += 1
+        return self.cluster.patch(plural, namespace, name, body)
+
+    def patch_namespaced_custom_object_status(self, group: str, version: str, namespace: str, plural: str, name: str,
+                                              body: Dict) -> Dict:
+        self.cluster.calls['patch', plural + '/status'] += 1
+        return self.cluster.patch(plural, namespace, name, body, subresource='status')
+
+    def delete_namespaced_custom_object(self, group: str, version: str, namespace: str, plural: str, name: str,
+                                        **kwargs) -> Dict:
+        self.cluster.calls['delete', plural] += 1
+        return self.cluster.delete(plural, namespace, name)
+
+    @staticmethod
+    def __page(items: List[Dict], limit: Optional[int], continue_token: Optional[str]) -> Dict:
+        start = int(continue_token or 0)
+        end = start + limit if limit else len(items)
+        return {'items': items[start:end], 'metadata': {'continue': str(end) if end < len(items) else None}}
+
+
+class _Response:
+    # ApiClient.deserialize() expects an HTTP response carrying JSON in .data
+    def __init__(self, obj):
+        self.data = json.dumps(obj)
+
+
+class FakeBatchV1Api:
+    """
+        Jobs are stored (and published in watch events) as dicts, like kopf sees them. Like the real client,
+        API methods take and return kubernetes.client models.
+    """
+
+    def __init__(self, cluster: FakeCluster):
+        self.cluster = cluster
+        self.__api_client = kubernetes.client.ApiClient()
+
+    def create_namespaced_job(self, namespace: str, body: kubernetes.client.V1Job) -> kubernetes.client.V1Job:
+        self.cluster.calls['create', JOBS] += 1
+        job = self.__api_client.sanitize_for_serialization(body)
+        job['metadata']['namespace'] = namespace
+        return self.__to_model(self.cluster.create(JOBS, job), 'V1Job')
+
+    def list_namespaced_job(self, namespace: str, label_selector: Optional[str] = None, limit: Optional[int] = None,
+                            _continue: Optional[str] = None) -> kubernetes.client.V1JobList:
+        self.cluster.calls['list', JOBS] += 1
+        jobs = self.cluster.list(JOBS, namespace, label_selector)
+        start = int(_continue or 0)
+        end = start + limit if limit else len(jobs)
+        return self.__to_model({'items': jobs[start:end], 'metadata': {'continue': str(end) if end < len(jobs) else None}},
+                               'V1JobList')
+
+    def list_job_for_all_namespaces(self, label_selector: Optional[str] = None, limit: Optional[int] = None,
+                                    _continue: Optional[str] = None) -> kubernetes.client.V1JobList:
+        self.cluster.calls['list', JOBS] += 1
+        jobs = self.cluster.list(JOBS, None, label_selector)
+        start = int(_continue or 0)
+        end = start + limit if limit else len(jobs)
+        return self.__to_model({'items': jobs[start:end], 'metadata': {'continue': str(end) if end < len(jobs) else None}},
+                               'V1JobList')
+
+    def patch_namespaced_job(self, name: str, namespace: str, body: Dict) -> kubernetes.client.V1Job:
+        self.cluster.calls['patch', JOBS] += 1
+        return self.__to_model(self.cluster.patch(JOBS, namespace, name, body), 'V1Job')
+
+    def delete_namespaced_job(self, name: str, namespace: str, **kwargs) -> kubernetes.client.V1Status:
+        self.cluster.calls['delete', JOBS] += 1
+        self.cluster.delete(JOBS, namespace, name)
+        return kubernetes.client.V1Status(status='Success')
+
+    def delete_collection_namespaced_job(self, namespace: str, label_selector: Optional[str] = None,
+                                         **kwargs) -> kubernetes.client.V1Status:
+        self.cluster.calls['deletecollection', JOBS] += 1
+        with self.cluster.lock:
+            for job in self.cluster.list(JOBS, namespace, label_selector):
+                self.cluster.delete(JOBS, namespace, job['metadata']['name'])
+        return kubernetes.client.V1Status(status='Success')
+
+    def __to_model(self, obj: Dict, model: str):
+        return self.__api_client.deserialize(_Response(obj), model)
+
+
+class FakeCoordinationV1Api:
+    def __init__(self, cluster: FakeCluster):
+        self.cluster = cluster
+        self.__api_client = kubernetes.client.ApiClient()
+
+    def create_namespaced_lease(self, namespace: str, body: Dict) -> kubernetes.client.V1Lease:
+        self.cluster.calls['create', LEASES] += 1
+        lease = merge_patch(self.__api_client.sanitize_for_serialization(body), {'metadata': {'namespace': namespace}})
+        return self.__to_model(self.cluster.create(LEASES, lease), 'V1Lease')
+
+    def list_namespaced_lease(self, namespace: str, label_selector: Optional[str] = None, limit: Optional[int] = None,
+                              _continue: Optional[str] = None) -> kubernetes.client.V1LeaseList:
+        self.cluster.calls['list', LEASES] += 1
+        leases = self.cluster.list(LEASES, namespace, label_selector)
+        start = int(_continue or 0)
+        end = start + limit if limit else len(leases)
+        return self.__to_model({'items': leases[start:end],
+                                'metadata': {'continue': str(end) if end < len(leases) else None}}, 'V1LeaseList')
+
+    def patch_namespaced_lease(self, name: str, namespace: str, body: Dict) -> kubernetes.client.V1Lease:
+        self.cluster.calls['patch', LEASES] += 1
+        return self.__to_model(self.cluster.patch(LEASES, namespace, name, body), 'V1Lease')
+
+    def delete_namespaced_lease(self, name: str, namespace: str, **kwargs) -> kubernetes.client.V1Status:
+        self.cluster.calls['delete', LEASES] += 1
+        self.cluster.delete(LEASES, namespace, name)
+        return kubernetes.client.V1Status(status='Success')
+
+    def __to_model(self, obj: Dict, model: str):
+        return self.__api_client.deserialize(_Response(obj), model)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Clients creating a connection per request open them in bursts
+    request_queue_size = 1024
+
+
+class FakeApiServer:
+    """
+        Serves the cluster over HTTP on localhost, so that the operator talks to it through kubernetes.client,
+        paying for (de)serialization and connection handling like against a real API server.
+        Every request is delayed by @latency seconds, standing for the network round trip and the API server itself.
+    """
+    __PATH__ = re.compile(r'^/apis/(?P<group>[^/]+)/(?P<version>[^/]+)(/namespaces/(?P<namespace>[^/]+))?'
+                          r'/(?P<plural>[^/]+)(/(?P<name>[^/]+))?(/(?P<subresource>status))?$')
+
+    def __init__(self, cluster: FakeCluster, latency: float = 0.0):
+        self.cluster = cluster
+        self.latency = latency
+        self.__server = _Server(('127.0.0.1', 0), self.__make_handler())
+        self.__thread = threading.Thread(target=self.__server.serve_forever, name="fake-api-server", daemon=True)
+
+    @property
+    def host(self) -> str:
+        return f"http://127.0.0.1:{self.__server.server_address[1]}"
+
+    def start(self) -> None:
+        self.__thread.start()
+
+    def stop(self) -> None:
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def handle(self, method: str, path: str, body: Optional[Dict]) -> Tuple[int, Dict]:
+        url = urlparse(path)
+        match = FakeApiServer.__PATH__.match(url.path)
+        if match is None:
+            return 404, FakeApiServer.__status(404, "NotFound")
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        namespace, plural, name = match.group('namespace'), match.group('plural'), match.group('name')
+        subresource = match.group('subresource')
+        verb = {'GET': 'get' if name else 'list', 'POST': 'create', 'PATCH': 'patch',
+                'DELETE': 'delete' if name else 'deletecollection'}[method]
+        self.cluster.calls[verb, plural + ('/status' if subresource else '')] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        try:
+            if verb == 'get':
+                return 200, self.cluster.get(plural, namespace, name)
+            if verb == 'list':
+                items = self.cluster.list(plural, namespace, query.get('labelSelector'))
+                start = int(query.get('continue') or 0)
+                end = start + int(query['limit']) if query.get('limit') else len(items)
+                return 200, {'items': items[start:end],
+                             'metadata': {'continue': str(end) if end < len(items) else None}}
+            if verb == 'create':
+                return 201, self.cluster.create(plural, merge_patch(body, {'metadata': {'namespace': namespace}}))
+            if verb == 'patch':
+                return 200, self.cluster.patch(plural, namespace, name, body, subresource=subresource)
+            if verb == 'delete':
+                return 200, self.cluster.delete(plural, namespace, name)
+            with self.cluster.lock:
+                for obj in self.cluster.list(plural, namespace, query.get('labelSelector')):
+                    self.cluster.delete(plural, namespace, obj['metadata']['name'])
+            return 200, FakeApiServer.__status(200, "Success")
+        except kubernetes.client.ApiException as e:
+            return e.status, FakeApiServer.__status(e.status, e.reason)
+
+    def __make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately, Nagle's algorithm would delay the body of kept alive
+            # connections until the client acknowledges the headers
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                self.__respond()
+
+            do_POST = do_PATCH = do_DELETE = do_GET
+
+            def log_message(self, format, *args):
+                pass
+
+            def __respond(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                code, response = server.handle(self.command, self.path, body)
+                data = json.dumps(response).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    @staticmethod
+    def __status(code: int, reason: str) -> Dict:
+        return {'kind': 'Status', 'apiVersion': 'v1', 'code': code, 'reason': reason,
+                'status': 'Success' if code < 400 else 'Failure'}
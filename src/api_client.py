@@ -0,0 +1,94 @@
+import threading
+from typing import Dict, Optional
+
+import kubernetes
+
+from src.config import OperatorConfig
+from src.metrics import operator_metrics
+
+"""
+    Single, long-lived Kubernetes API client shared by all controllers.
+    Connections are kept alive in a pool of API_CONNECTION_POOL_SIZE connections instead of constructing
+    a new client (and connection pool) for every request.
+"""
+
+
+class KubernetesApi:
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__api_client: Optional[kubernetes.client.ApiClient] = None
+        self.__custom_objects = None
+        self.__batch = None
+        self.__coordination = None
+        self.__injected = False
+
+    def configure(self, api_client: Optional[kubernetes.client.ApiClient] = None, custom_objects=None,
+                  batch=None, coordination=None) -> None:
+        """
+            Injects API client (or the API objects directly, e.g. stand-ins used in benchmarks).
+            Objects which are not given are created lazily from the (possibly given) API client.
+        """
+        with self.__lock:
+            self.__injected = any(x is not None for x in (api_client, custom_objects, batch, coordination))
+            self.__api_client = api_client
+            self.__custom_objects = operator_metrics.instrument_api(custom_objects) if custom_objects else None
+            self.__batch = operator_metrics.instrument_api(batch, "jobs") if batch else None
+            self.__coordination = operator_metrics.instrument_api(coordination, "leases") if coordination else None
+
+    def load_config(self) -> None:
+        """
+            Loads client configuration the way kopf does during login - in-cluster config, falling back to kubeconfig.
+            Startup handlers run before kopf logs in, so they must call it before their first use of the API.
+            Injected clients are kept as they are.
+        """
+        with self.__lock:
+            if self.__injected:
+                return
+            try:
+                kubernetes.config.load_incluster_config()
+            except kubernetes.config.ConfigException:
+                kubernetes.config.load_kube_config()
+            # Objects created before are bound to the configuration they have been created with
+            self.__api_client = None
+            self.__custom_objects, self.__batch, self.__coordination = None, None, None
+
+    def custom_objects(self) -> kubernetes.client.CustomObjectsApi:
+        if self.__custom_objects is None:
+            with self.__lock:
+                if self.__custom_objects is None:
+                    self.__custom_objects = operator_metrics.instrument_api(
+                        kubernetes.client.CustomObjectsApi(self.__get_api_client()))
+        return self.__custom_objects
+
+    def batch(self) -> kubernetes.client.BatchV1Api:
+        if self.__batch is None:
+            with self.__lock:
+                if self.__batch is None:
+                    self.__batch = operator_metrics.instrument_api(
+                        kubernetes.client.BatchV1Api(self.__get_api_client()), "jobs")
+        return self.__batch
+
+    def coordination(self) -> kubernetes.client.CoordinationV1Api:
+        if self.__coordination is None:
+            with self.__lock:
+                if self.__coordination is None:
+                    self.__coordination = operator_metrics.instrument_api(
+                        kubernetes.client.CoordinationV1Api(self.__get_api_client()), "leases")
+        return self.__coordination
+
+    def serialize(self, obj) -> Dict:
+        """
+            Returns JSON-able dict of a kubernetes.client model, e.g. of a listed object, as seen in watch events.
+        """
+        return self.__get_api_client().sanitize_for_serialization(obj)
+
+    def __get_api_client(self) -> kubernetes.client.ApiClient:
+        # Must be created lazily - after load_config or login of kopf, which load the client configuration
+        if self.__api_client is None:
+            configuration = kubernetes.client.Configuration.get_default_copy()
+            configuration.connection_pool_maxsize = OperatorConfig.API_CONNECTION_POOL_SIZE
+            self.__api_client = kubernetes.client.ApiClient(configuration)
+        return self.__api_client
+
+
+kubernetes_api = KubernetesApi()
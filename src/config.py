@@ -0,0 +1,58 @@
+import os
+import socket
+
+
+class OperatorConfig:
+    """
+        Operator-wide tunables. Every value can be overridden with an environment variable of the same name.
+    """
+    # Maximal number of compiled workflow DAGs kept in memory
+    WORKFLOW_CACHE_SIZE = int(os.environ.get("WORKFLOW_CACHE_SIZE", 512))
+    # Page size used when listing objects from the API server
+    LIST_PAGE_SIZE = int(os.environ.get("LIST_PAGE_SIZE", 500))
+    # Maximal number of job creation requests in flight, in total and for a single workflow
+    JOB_SUBMISSION_CONCURRENCY = int(os.environ.get("JOB_SUBMISSION_CONCURRENCY", 32))
+    JOB_SUBMISSION_CONCURRENCY_PER_WORKFLOW = int(os.environ.get("JOB_SUBMISSION_CONCURRENCY_PER_WORKFLOW", 8))
+    # Size of the HTTP connection pool of the shared Kubernetes API client
+    API_CONNECTION_POOL_SIZE = int(os.environ.get("API_CONNECTION_POOL_SIZE", 64))
+    # Number of threads executing synchronous handlers
+    HANDLER_WORKERS = int(os.environ.get("HANDLER_WORKERS", 32))
+    # Set activeDeadlineSeconds of step jobs to maxStepTimeout of the workflow
+    JOB_ACTIVE_DEADLINE = os.environ.get("JOB_ACTIVE_DEADLINE", "false").lower() == "true"
+    # Seconds for which status patches of a workflow are collected before being sent as a single patch
+    PATCH_COALESCE_WINDOW = float(os.environ.get("PATCH_COALESCE_WINDOW", 0.2))
+    # Number of attempts to apply a workflow patch which keeps conflicting with concurrent updates,
+    # and number of retries of a patch failing with a transient error
+    PATCH_MAX_ATTEMPTS = int(os.environ.get("PATCH_MAX_ATTEMPTS", 5))
+    # Maximal number of running steps (admitted, but not finished jobs) of all workflows, 0 means no limit
+    MAX_RUNNING_STEPS = int(os.environ.get("MAX_RUNNING_STEPS", 0))
+    # Number of (workflow, step, image) entries of observed step run times kept for prioritization of steps
+    STEP_DURATION_STORE_SIZE = int(os.environ.get("STEP_DURATION_STORE_SIZE", 100000))
+    # File in which observed step run times are kept between restarts, empty keeps them in memory only
+    STEP_DURATION_STORE_PATH = os.environ.get("STEP_DURATION_STORE_PATH", "")
+    # Number of successful step results kept for workflows with spec.cacheSteps, and seconds for which they are reused
+    STEP_CACHE_SIZE = int(os.environ.get("STEP_CACHE_SIZE", 100000))
+    STEP_CACHE_TTL = float(os.environ.get("STEP_CACHE_TTL", 86400))
+    # File in which step results are kept between restarts, empty keeps them in memory only
+    STEP_CACHE_PATH = os.environ.get("STEP_CACHE_PATH", "")
+    # Seconds for which jobs of a finished workflow are kept (their ttlSecondsAfterFinished is set once the workflow
+    # finishes), -1 keeps them until the workflow is deleted
+    JOB_TTL_AFTER_FINISHED = int(os.environ.get("JOB_TTL_AFTER_FINISHED", -1))
+    # Replace per-step state in status of finished workflows with a summary
+    COMPACT_FINISHED_WORKFLOWS = os.environ.get("COMPACT_FINISHED_WORKFLOWS", "false").lower() == "true"
+    # List workflows and jobs in bulk at startup and resume in-flight workflows before kopf starts watching
+    WARM_START = os.environ.get("WARM_START", "true").lower() == "true"
+    # Share workflows between replicas of the operator - every replica handles workflows hashed to it
+    SHARDING = os.environ.get("SHARDING", "false").lower() == "true"
+    # Identity of the replica (name of the pod by default) and name of the group of replicas sharing workflows
+    SHARD_IDENTITY = os.environ.get("SHARD_IDENTITY", socket.gethostname())
+    SHARD_GROUP = os.environ.get("SHARD_GROUP", "workflow-operator")
+    # Namespace of Lease objects of the replicas, seconds after which a replica not renewing its Lease is dropped
+    # from the group, and seconds between renewals
+    SHARD_LEASE_NAMESPACE = os.environ.get("SHARD_LEASE_NAMESPACE", "default")
+    SHARD_LEASE_DURATION = int(os.environ.get("SHARD_LEASE_DURATION", 15))
+    SHARD_RENEW_INTERVAL = float(os.environ.get("SHARD_RENEW_INTERVAL", 5))
+    # Points of every replica on the hash ring, more points spread workflows more evenly
+    SHARD_VIRTUAL_NODES = int(os.environ.get("SHARD_VIRTUAL_NODES", 64))
+    # Port of the Prometheus metrics endpoint, 0 disables metrics (requires prometheus_client)
+    METRICS_PORT = int(os.environ.get("METRICS_PORT", 0))
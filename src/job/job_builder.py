@@ -1,4 +1,4 @@
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 from kubernetes import client
 
@@ -7,12 +7,16 @@ class BatchJobBuilder:
     RESTART_POLICY: str = "Never"
     JOB_KIND: str = "Job"
     API_VERSION: str = "batch/v1"
+    INDEXED_COMPLETION_MODE: str = "Indexed"
 
     def __init__(self, job_name: str):
         self.job_name = job_name
         self.container = []
         self.pod_spec = client.V1PodSpec(containers=[], restart_policy=BatchJobBuilder.RESTART_POLICY)
         self.metadata = client.V1ObjectMeta(name=job_name, labels={})
+        self.active_deadline_seconds: Optional[int] = None
+        self.completions: Optional[int] = None
+        self.parallelism: Optional[int] = None
 
     def add_labels(self, labels: Dict[str, str]) -> 'BatchJobBuilder':
         self.metadata.labels.update(labels)
@@ -22,9 +26,27 @@ class BatchJobBuilder:
         self.pod_spec.containers.append(client.V1Container(name=name, image=image, command=commands))
         return self
 
+    def set_active_deadline(self, seconds: int) -> 'BatchJobBuilder':
+        self.active_deadline_seconds = seconds
+        return self
+
+    def set_completions(self, completions: int, parallelism: int) -> 'BatchJobBuilder':
+        """
+            Makes the job an Indexed Job, complete once pods with each of the indexes 0..@completions-1 succeed.
+        """
+        self.completions = completions
+        self.parallelism = parallelism
+        return self
+
     def build(self, backoff_limit: int) -> client.V1Job:
         return client.V1Job(
                     api_version=BatchJobBuilder.API_VERSION,
                     kind=BatchJobBuilder.JOB_KIND,
                     metadata=self.metadata,
-                    spec=client.V1JobSpec(backoff_limit=backoff_limit, template=client.V1PodTemplateSpec(spec=self.pod_spec)))
+                    spec=client.V1JobSpec(backoff_limit=backoff_limit,
+                                          active_deadline_seconds=self.active_deadline_seconds,
+                                          completion_mode=BatchJobBuilder.INDEXED_COMPLETION_MODE
+                                          if self.completions is not None else None,
+                                          completions=self.completions,
+                                          parallelism=self.parallelism,
+                                          template=client.V1PodTemplateSpec(spec=self.pod_spec)))
@@ -1,64 +1,255 @@
+import functools
 import uuid
-from typing import Dict, List, Optional
+from datetime import datetime, timezone
+from typing import Collection, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
 
 import kopf
 import kubernetes
 
-from src.job.job_builder import BatchJobBuilder
+from src.api_client import KubernetesApi, kubernetes_api
+from src.config import OperatorConfig
+from src.job.job_index import job_index
+from src.job.job_submitter import job_submitter
+from src.job.job_template import JobTemplate
 from src.workflow.constants import WorkflowConstants
+from src.workflow.workflow_cache import workflow_cache
+from src.workflow.workflow_controller import WorkflowController
 from src.workflow.workflow_schema import WorkflowStepSchema
 
 
 class JobController:
     __OWNING_WORKFLOW_NAME_LABEL__ = "kopf__workflow__kopf"
     __CORRESPONDING_WORKFLOW_STEP_LABEL__ = "kopf__workflow__step__kopf"
+    # ';'-joined names of steps run by a job running a chain of fused steps
+    __FUSED_STEPS_ANNOTATION__ = "workflow-fused-steps"
+    # Pods of deleted jobs are orphaned by default
+    __DELETE_PROPAGATION_POLICY__ = "Background"
     JOB_SELECTOR = {__OWNING_WORKFLOW_NAME_LABEL__: kopf.PRESENT}
+    api: KubernetesApi = kubernetes_api
 
     @staticmethod
-    def has_failed(job: Dict) -> bool:
-        return 'conditions' in job['status'] and any(
-            [c['type'] == 'Failed' and c['status'] == 'True' for c in job['status']['conditions']])
+    def get_job_run_time(job: Dict) -> float:
+        """
+            Seconds from start of the job to its completion (or now, if completion time is not known).
+        """
+        status = job.get('status') or {}
+        start = JobController.__parse_time(status.get('startTime') or job['metadata']['creationTimestamp'])
+        end = JobController.__parse_time(status['completionTime']) if status.get('completionTime') else \
+            datetime.now(timezone.utc)
+        return (end - start).total_seconds()
 
     @staticmethod
-    def has_completed(job: Dict) -> bool:
-        return 'conditions' in job['status'] and any(
-            [c['type'] == 'Complete' and c['status'] == 'True' for c in job['status']['conditions']])
+    def get_job_workflow_name(job: Dict) -> Optional[str]:
+        return (job['metadata'].get('labels') or {}).get(JobController.__OWNING_WORKFLOW_NAME_LABEL__, None)
 
     @staticmethod
-    def get_owning_workflow(job: Dict) -> Dict:
-        return kubernetes.client.CustomObjectsApi().get_namespaced_custom_object(
-            namespace=job['metadata']['namespace'],
-            group=WorkflowConstants.GROUP,
-            version=WorkflowConstants.API_VERSION,
-            plural=WorkflowConstants.PLURAL,
-            name=JobController.__get_job_workflow_name(job))
+    def get_job_image(job: Dict) -> str:
+        return job['spec']['template']['spec']['containers'][0]['image']
+
+    @staticmethod
+    def get_job_command(job: Dict) -> Optional[List[str]]:
+        return job['spec']['template']['spec']['containers'][0].get('command')
+
+    @staticmethod
+    def get_job_step_containers(job: Dict) -> List[Tuple[str, Dict]]:
+        """
+            Returns steps run by the job, in order, with their containers - more than one if steps have been fused.
+        """
+        fused = (job['metadata'].get('annotations') or {}).get(JobController.__FUSED_STEPS_ANNOTATION__)
+        pod_spec = job['spec']['template']['spec']
+        if not fused:
+            return [(JobController.get_job_workflow_step_name(job), pod_spec['containers'][0])]
+        return list(zip(fused.split(';'), (pod_spec.get('initContainers') or []) + pod_spec['containers']))
 
     @staticmethod
     def get_job_workflow_step_name(job: Dict) -> str:
         return job['metadata']['labels'][JobController.__CORRESPONDING_WORKFLOW_STEP_LABEL__]
 
     @staticmethod
-    def create_job(step: WorkflowStepSchema, workflow_name: str, workflow_body: Dict) -> kubernetes.client.V1Job:
-        job_name = step.stepName + '-' + str(uuid.uuid4())
-        return BatchJobBuilder(job_name) \
-            .add_container(job_name, step.image, commands=step.command) \
-            .add_labels(JobController.__create_job_labels(workflow_name, step.stepName)) \
-            .add_labels(workflow_body['metadata']['labels']) \
-            .build(WorkflowConstants.BACKOFF_LIMIT)
+    def create_job(step: WorkflowStepSchema, workflow_name: str, workflow_body: Dict,
+                   fused_steps: Sequence[WorkflowStepSchema] = (), job_name: Optional[str] = None) -> Dict:
+        """
+            Returns manifest of the job of @step, owned by the workflow. @fused_steps run in the same pod after
+            the step - all steps but the last one are run as init containers (named after the steps).
+            The job is named @job_name, a unique name derived from the step name by default.
+        """
+        job_name = job_name or step.stepName + '-' + str(uuid.uuid4())
+        # Failed steps with retries are run again by the operator, with a backoff
+        retries = WorkflowController.get_max_retries(workflow_body, step.stepName)
+        steps = [step, *fused_steps]
+        return JobController.__get_job_template(workflow_body).render(
+            job_name, steps[-1].image, steps[-1].command,
+            JobController.__create_job_labels(workflow_name, step.stepName),
+            0 if retries else WorkflowConstants.BACKOFF_LIMIT, step.completions, step.parallelism or step.completions,
+            init_containers=[JobTemplate.container(s.stepName, s.image, s.command) for s in steps[:-1]],
+            annotations={JobController.__FUSED_STEPS_ANNOTATION__: ';'.join(s.stepName for s in steps)}
+            if fused_steps else None)
+
+    @staticmethod
+    def fetch_workflow_job_names(namespace: str, workflow_name: str) -> Iterator[str]:
+        """
+            Lazily yields names of jobs belonging to the workflow.
+            Names are served from the local job index, API server is listed only if the index is not synced yet.
+        """
+        job_names = job_index.get_job_names(namespace, workflow_name)
+        if job_names is not None:
+            return iter(job_names)
+        return JobController.__list_workflow_job_names(namespace, workflow_name)
+
+    @staticmethod
+    def list_workflow_jobs(namespace: str, workflow_name: str) -> Iterator[kubernetes.client.V1Job]:
+        """
+            Lazily lists jobs of the workflow page by page, filtering by the owning workflow label on the server side.
+        """
+        continue_token = None
+        while True:
+            jobs = JobController.api.batch().list_namespaced_job(
+                namespace=namespace,
+                label_selector=f"{JobController.__OWNING_WORKFLOW_NAME_LABEL__}={workflow_name}",
+                limit=OperatorConfig.LIST_PAGE_SIZE,
+                _continue=continue_token
+            )
+            yield from jobs.items
+            continue_token = jobs.metadata._continue
+            if not continue_token:
+                return
+
+    @staticmethod
+    def list_jobs() -> Iterator[Dict]:
+        """
+            Lazily lists jobs of all workflows in all namespaces page by page, as dicts like the ones in watch events.
+        """
+        continue_token = None
+        while True:
+            jobs = JobController.api.batch().list_job_for_all_namespaces(
+                label_selector=JobController.__OWNING_WORKFLOW_NAME_LABEL__,
+                limit=OperatorConfig.LIST_PAGE_SIZE,
+                _continue=continue_token
+            )
+            yield from (JobController.api.serialize(job) for job in jobs.items)
+            continue_token = jobs.metadata._continue
+            if not continue_token:
+                return
+
+    @staticmethod
+    def index_workflow_jobs(namespace: str, workflow_name: str, jobs: Iterable[Dict]) -> None:
+        """
+            Records (listed) jobs of the workflow as all its jobs in the local job index.
+        """
+        job_index.mark_synced(namespace, workflow_name, [(j['metadata']['name'], j['metadata'].get('labels'))
+                                                         for j in jobs])
+
+    @staticmethod
+    def index_job_event(event: Dict) -> None:
+        """
+            Keeps the local job index up to date with events from the jobs watch.
+        """
+        job = event['object']
+        workflow_name = JobController.get_job_workflow_name(job)
+        if workflow_name is None:
+            return
+        if event['type'] == 'DELETED':
+            job_index.remove(job['metadata']['namespace'], workflow_name, job['metadata']['name'])
+        else:
+            job_index.add(job['metadata']['namespace'], workflow_name, job['metadata']['name'],
+                          job['metadata']['labels'])
+
+    @staticmethod
+    def forget_workflow_jobs(namespace: str, workflow_name: str) -> None:
+        job_index.forget(namespace, workflow_name)
 
     @staticmethod
-    def fetch_workflow_job_names(namespace: str, workflow_name: str) -> List[str]:
-        jobs = kubernetes.client.api.BatchV1Api().list_namespaced_job(namespace=namespace)
-        jobs = [x.to_dict() for x in jobs.items if JobController.__get_job_workflow_name(x.to_dict()) == workflow_name]
-        return [x['metadata']['name'] for x in jobs]
+    def submit_job(namespace: str, job: Dict) -> None:
+        job = JobController.api.batch().create_namespaced_job(namespace=namespace, body=job)
+        job_index.add(namespace, job.metadata.labels[JobController.__OWNING_WORKFLOW_NAME_LABEL__], job.metadata.name,
+                      job.metadata.labels)
+
+    @staticmethod
+    def get_workflow_job_steps(namespace: str, workflow_name: str) -> Set[str]:
+        """
+            Returns names of steps of the workflow which have jobs.
+        """
+        steps = set()
+        for job_name in list(JobController.fetch_workflow_job_names(namespace, workflow_name)):
+            labels = job_index.get_job_labels(namespace, workflow_name, job_name) or {}
+            steps.add(labels.get(JobController.__CORRESPONDING_WORKFLOW_STEP_LABEL__))
+        return steps
+
+    @staticmethod
+    def delete_job(namespace: str, workflow_name: str, name: str) -> None:
+        try:
+            JobController.api.batch().delete_namespaced_job(
+                name=name, namespace=namespace, propagation_policy=JobController.__DELETE_PROPAGATION_POLICY__)
+        except kubernetes.client.ApiException as e:
+            if e.status != 404:
+                raise
+        job_index.remove(namespace, workflow_name, name)
+
+    @staticmethod
+    def delete_workflow_jobs(namespace: str, workflow_name: str, kept_steps: Collection[str] = ()) -> None:
+        """
+            Deletes jobs of the workflow, except for jobs of @kept_steps, with a single request.
+        """
+        label_selector = f"{JobController.__OWNING_WORKFLOW_NAME_LABEL__}={workflow_name}"
+        if kept_steps:
+            label_selector += f",{JobController.__CORRESPONDING_WORKFLOW_STEP_LABEL__} notin ({','.join(sorted(kept_steps))})"
+        JobController.api.batch().delete_collection_namespaced_job(
+            namespace=namespace, label_selector=label_selector,
+            propagation_policy=JobController.__DELETE_PROPAGATION_POLICY__)
+        for job_name in job_index.get_job_names(namespace, workflow_name) or []:
+            labels = job_index.get_job_labels(namespace, workflow_name, job_name) or {}
+            if labels.get(JobController.__CORRESPONDING_WORKFLOW_STEP_LABEL__) not in kept_steps:
+                job_index.remove(namespace, workflow_name, job_name)
 
     @staticmethod
     def patch_job(namespace: str, patch: Dict, name: str) -> None:
-        kubernetes.client.BatchV1Api().patch_namespaced_job(
+        job = JobController.api.batch().patch_namespaced_job(
             name=name,
             namespace=namespace,
             body=patch
         )
+        job_index.add(namespace, job.metadata.labels[JobController.__OWNING_WORKFLOW_NAME_LABEL__], job.metadata.name,
+                      job.metadata.labels)
+
+    @staticmethod
+    def patch_workflow_jobs(namespace: str, workflow_name: str, job_names: Iterable[str],
+                            patch: Dict) -> Dict[str, Exception]:
+        """
+            Patches jobs of the workflow concurrently, within concurrency caps of the job submitter.
+            Jobs deleted in the meantime are skipped. Returns exceptions raised for jobs which haven't been patched.
+        """
+        def patch_job(job_name: str) -> None:
+            try:
+                JobController.patch_job(namespace, patch=patch, name=job_name)
+            except kubernetes.client.ApiException as e:
+                if e.status != 404:
+                    raise
+                job_index.remove(namespace, workflow_name, job_name)
+
+        _, failed = job_submitter.submit({job_name: functools.partial(patch_job, job_name) for job_name in job_names})
+        return failed
+
+    @staticmethod
+    def has_labels(namespace: str, workflow_name: str, job_name: str, labels: Dict[str, Optional[str]]) -> bool:
+        """
+            Checks with the job index whether the job carries @labels already (None stands for a missing label).
+            Jobs which are not in the index are reported as not labeled.
+        """
+        job_labels = job_index.get_job_labels(namespace, workflow_name, job_name)
+        return job_labels is not None and all(job_labels.get(k) == v for k, v in labels.items())
+
+    @staticmethod
+    def __get_job_template(workflow_body: Dict) -> JobTemplate:
+        compiled = workflow_cache.get(workflow_body)
+        labels = workflow_body['metadata'].get('labels') or {}
+        # Labels of the workflow can change without a new spec generation
+        if compiled.job_template is None or compiled.job_template.labels != labels:
+            timeout = workflow_body['spec'].get('maxStepTimeout', -1)
+            compiled.job_template = JobTemplate(
+                labels, kopf.build_owner_reference(workflow_body),
+                # Let Kubernetes enforce the step timeout as well
+                timeout if OperatorConfig.JOB_ACTIVE_DEADLINE and timeout != -1 else None)
+        return compiled.job_template
 
     @staticmethod
     def __create_job_labels(workflow_name: str, step_name: str) -> Dict:
@@ -68,5 +259,14 @@ class JobController:
         }
 
     @staticmethod
-    def __get_job_workflow_name(job: Dict) -> Optional[str]:
-        return job['metadata']['labels'].get(JobController.__OWNING_WORKFLOW_NAME_LABEL__, None)
\ No newline at end of file
+    def __parse_time(timestamp: str) -> datetime:
+        # Kubernetes timestamps are RFC 3339 in UTC, e.g. 2022-01-01T12:00:00Z
+        return datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+
+    @staticmethod
+    def __list_workflow_job_names(namespace: str, workflow_name: str) -> Iterator[str]:
+        listed = []
+        for job in JobController.list_workflow_jobs(namespace, workflow_name):
+            listed.append((job.metadata.name, job.metadata.labels))
+            yield job.metadata.name
+        job_index.mark_synced(namespace, workflow_name, listed)
\ No newline at end of file
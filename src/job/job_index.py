@@ -0,0 +1,54 @@
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+"""
+    Local index of jobs owned by workflows: (namespace, workflow name) -> {job name -> job labels}.
+    Index is kept up to date by the jobs watch. Jobs of a workflow are served from the index only once they have been
+    listed from the API server (i.e. the workflow entry is synced), before that the index may be incomplete.
+"""
+
+
+class JobIndex:
+    def __init__(self):
+        self.__jobs: Dict[Tuple[str, str], Dict[str, Dict[str, str]]] = {}
+        self.__synced: Set[Tuple[str, str]] = set()
+        self.__lock = threading.Lock()
+
+    def add(self, namespace: str, workflow_name: str, job_name: str, labels: Dict[str, str]) -> None:
+        with self.__lock:
+            self.__jobs.setdefault((namespace, workflow_name), {})[job_name] = dict(labels or {})
+
+    def remove(self, namespace: str, workflow_name: str, job_name: str) -> None:
+        with self.__lock:
+            self.__jobs.get((namespace, workflow_name), {}).pop(job_name, None)
+
+    def mark_synced(self, namespace: str, workflow_name: str, jobs: Iterable[Tuple[str, Dict[str, str]]]) -> None:
+        """
+            Records result of a full listing of jobs of the workflow. Jobs added by the watch in the meantime are kept.
+        """
+        with self.__lock:
+            entry = self.__jobs.setdefault((namespace, workflow_name), {})
+            for job_name, labels in jobs:
+                entry.setdefault(job_name, dict(labels or {}))
+            self.__synced.add((namespace, workflow_name))
+
+    def forget(self, namespace: str, workflow_name: str) -> None:
+        with self.__lock:
+            self.__jobs.pop((namespace, workflow_name), None)
+            self.__synced.discard((namespace, workflow_name))
+
+    def get_job_names(self, namespace: str, workflow_name: str) -> Optional[List[str]]:
+        """
+            Returns names of jobs of the workflow or None if the index has not been synced for the workflow.
+        """
+        with self.__lock:
+            if (namespace, workflow_name) not in self.__synced:
+                return None
+            return list(self.__jobs.get((namespace, workflow_name), {}))
+
+    def get_job_labels(self, namespace: str, workflow_name: str, job_name: str) -> Optional[Dict[str, str]]:
+        with self.__lock:
+            return self.__jobs.get((namespace, workflow_name), {}).get(job_name)
+
+
+job_index = JobIndex()
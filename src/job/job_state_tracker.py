@@ -0,0 +1,62 @@
+import threading
+from typing import Dict, Optional
+
+"""
+    Filter of job watch events - only the first event showing a job in a terminal (Complete or Failed) condition
+    passes, all other events (pod status churn, redelivered terminal events) are dropped.
+"""
+
+COMPLETE = "Complete"
+FAILED = "Failed"
+
+
+class JobStateTracker:
+    """
+        Keeps job UID -> terminal condition for jobs which have been seen finished. Entries are dropped with
+        deletion of the job. The state is not persistent - after restart of the operator terminal events of
+        already recorded steps have to be recognized with the execution state stored in the workflow.
+    """
+
+    def __init__(self):
+        self.filtered = 0
+        self.__conditions: Dict[str, str] = {}
+        self.__lock = threading.Lock()
+
+    def get_new_terminal_condition(self, event: Dict) -> Optional[str]:
+        """
+            Returns terminal condition of the job from @event if the job has just moved to it, None otherwise.
+        """
+        job = event['object']
+        uid = job['metadata'].get('uid')
+        if event['type'] == 'DELETED':
+            with self.__lock:
+                self.__conditions.pop(uid, None)
+                self.filtered += 1
+            return None
+        condition = JobStateTracker.get_terminal_condition(job)
+        with self.__lock:
+            if condition is None or self.__conditions.get(uid) == condition:
+                self.filtered += 1
+                return None
+            self.__conditions[uid] = condition
+        return condition
+
+    def count_filtered(self) -> None:
+        """
+            Counts event which passed the tracker, but has been dropped later on.
+        """
+        with self.__lock:
+            self.filtered += 1
+
+    def __len__(self) -> int:
+        return len(self.__conditions)
+
+    @staticmethod
+    def get_terminal_condition(job: Dict) -> Optional[str]:
+        for condition in (job.get('status') or {}).get('conditions') or []:
+            if condition['type'] in (COMPLETE, FAILED) and condition['status'] == 'True':
+                return condition['type']
+        return None
+
+
+job_state_tracker = JobStateTracker()
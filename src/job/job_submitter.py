@@ -0,0 +1,48 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+from src.config import OperatorConfig
+
+"""
+    Concurrent calls of the jobs API (creation of jobs, patches of jobs of a workflow) with global and per-call
+    concurrency caps.
+"""
+
+
+class JobSubmitter:
+    def __init__(self, max_concurrency: int, max_concurrency_per_workflow: int):
+        self.max_concurrency_per_workflow = max_concurrency_per_workflow
+        self.__executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="job-submitter")
+
+    def submit_async(self, task: Callable[[], None]) -> Future:
+        """
+            Runs a single call, within the global concurrency cap only (job creation calls of a workflow are capped
+            by the step dispatcher).
+        """
+        return self.__executor.submit(task)
+
+    def submit(self, tasks: Dict[str, Callable[[], None]]) -> Tuple[List[str], Dict[str, Exception]]:
+        """
+            Runs @tasks (job name -> call, e.g. patch of the job) concurrently, at most max_concurrency_per_workflow
+            at a time. Returns names of jobs whose calls have succeeded and exceptions raised for the remaining ones.
+        """
+        window = threading.BoundedSemaphore(self.max_concurrency_per_workflow)
+        futures: Dict[str, Future] = {}
+        for job_name, task in tasks.items():
+            window.acquire()
+            futures[job_name] = self.__executor.submit(task)
+            futures[job_name].add_done_callback(lambda _: window.release())
+
+        succeeded, failed = [], {}
+        for job_name, future in futures.items():
+            exception = future.exception()
+            if exception is None:
+                succeeded.append(job_name)
+            else:
+                failed[job_name] = exception
+        return succeeded, failed
+
+
+job_submitter = JobSubmitter(OperatorConfig.JOB_SUBMISSION_CONCURRENCY,
+                             OperatorConfig.JOB_SUBMISSION_CONCURRENCY_PER_WORKFLOW)
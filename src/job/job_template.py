@@ -0,0 +1,59 @@
+from typing import Dict, List, Optional
+
+from src.job.job_builder import BatchJobBuilder
+
+"""
+    Job manifests of workflow steps stamped out of a per-workflow template as plain dicts, instead of building
+    kubernetes.client models which the client has to serialize back.
+"""
+
+
+class JobTemplate:
+    """
+        Parts of Job manifests shared by all steps of a workflow - labels, owner reference and deadline, compiled once
+        per spec generation (and labels) of the workflow. Rendered manifests are equal, key order included, to
+        the serialized output of BatchJobBuilder, shared parts are referenced and must not be modified.
+    """
+
+    def __init__(self, labels: Dict[str, str], owner_reference: Dict, active_deadline_seconds: Optional[int]):
+        self.labels = dict(labels)
+        self.active_deadline_seconds = active_deadline_seconds
+        # Keys in the order of serialized V1OwnerReference
+        self.__owner_references = [{key: owner_reference[key] for key in sorted(owner_reference)}]
+
+    def render(self, job_name: str, image: str, command: Optional[List[str]], step_labels: Dict[str, str],
+               backoff_limit: int, completions: Optional[int] = None, parallelism: Optional[int] = None,
+               init_containers: Optional[List[Dict]] = None, annotations: Optional[Dict[str, str]] = None) -> Dict:
+        """
+            Returns manifest of the job of a step, labeled with @step_labels followed by labels of the workflow.
+            With @completions set, the job is an Indexed Job (see BatchJobBuilder.set_completions).
+            @init_containers (see container) run one after another before the step, the active deadline
+            is given for each of them.
+        """
+        labels = dict(step_labels)
+        labels.update(self.labels)
+        deadline = self.active_deadline_seconds
+        spec = {'activeDeadlineSeconds': deadline * (1 + len(init_containers or ()))} if deadline is not None else {}
+        spec['backoffLimit'] = backoff_limit
+        if completions is not None:
+            spec['completionMode'] = BatchJobBuilder.INDEXED_COMPLETION_MODE
+            spec['completions'] = completions
+            spec['parallelism'] = parallelism
+        pod_spec = {'containers': [JobTemplate.container(job_name, image, command)]}
+        if init_containers:
+            pod_spec['initContainers'] = init_containers
+        pod_spec['restartPolicy'] = BatchJobBuilder.RESTART_POLICY
+        spec['template'] = {'spec': pod_spec}
+        metadata = {'annotations': annotations} if annotations else {}
+        metadata.update({'labels': labels, 'name': job_name, 'ownerReferences': self.__owner_references})
+        return {
+            'apiVersion': BatchJobBuilder.API_VERSION,
+            'kind': BatchJobBuilder.JOB_KIND,
+            'metadata': metadata,
+            'spec': spec
+        }
+
+    @staticmethod
+    def container(name: str, image: str, command: Optional[List[str]]) -> Dict:
+        return {'command': command, 'image': image, 'name': name} if command is not None else \
+            {'image': image, 'name': name}
@@ -0,0 +1,148 @@
+import functools
+import time
+from typing import Callable, List, Optional, Sequence
+
+import kubernetes
+
+from src.config import OperatorConfig
+
+try:
+    import prometheus_client
+except ImportError:
+    prometheus_client = None
+
+"""
+    Optional Prometheus metrics of the operator hot paths, served over HTTP from the operator process.
+    Metrics are collected only if METRICS_PORT is set and prometheus_client is installed. Otherwise all metrics are
+    no-ops and nothing is wrapped, so disabled metrics cost (almost) nothing.
+"""
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DURATION_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800, 3600, 3 * 3600, 12 * 3600)
+STEP_COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000, 10000)
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs) -> '_NoopMetric':
+        return self
+
+    def observe(self, value: float) -> None:
+        pass
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+
+class OperatorMetrics:
+    def __init__(self, enabled: bool):
+        self.enabled = enabled and prometheus_client is not None
+        self.registry = prometheus_client.CollectorRegistry() if self.enabled else None
+        self.handler_seconds = self.__histogram(
+            "workflow_operator_handler_seconds", "Duration of handler calls.", ["handler"], LATENCY_BUCKETS)
+        self.api_requests = self.__counter(
+            "workflow_operator_api_requests", "Kubernetes API requests.", ["verb", "resource", "code"])
+        self.api_seconds = self.__histogram(
+            "workflow_operator_api_request_seconds", "Latency of Kubernetes API requests.", ["verb", "resource"],
+            LATENCY_BUCKETS)
+        self.dag_compile_seconds = self.__histogram(
+            "workflow_operator_dag_compile_seconds", "Time of parsing and validation of workflow specs.", [],
+            LATENCY_BUCKETS)
+        self.ready_steps = self.__histogram(
+            "workflow_operator_ready_steps", "Number of steps ready for execution per dispatch.", [],
+            STEP_COUNT_BUCKETS)
+        self.step_queue_seconds = self.__histogram(
+            "workflow_operator_step_queue_seconds", "Time from dispatch of a ready step to creation of its job.", [],
+            LATENCY_BUCKETS)
+        self.job_events_filtered = self.__counter(
+            "workflow_operator_job_events_filtered", "Job events dropped without processing.", ["reason"])
+        self.step_run_seconds = self.__histogram(
+            "workflow_operator_step_run_seconds", "Run time of step jobs.", ["result"], DURATION_BUCKETS)
+        self.step_retries = self.__counter(
+            "workflow_operator_step_retries", "Failed steps scheduled to run again.", [])
+        self.step_cache_hits = self.__counter(
+            "workflow_operator_step_cache_hits", "Steps marked executed from recorded results, without a job.", [])
+
+    def start_server(self, port: int) -> None:
+        prometheus_client.start_http_server(port, registry=self.registry)
+
+    def register_collector(self, collector) -> None:
+        """
+            Registers collector computing metrics at scrape time (see prometheus_client custom collectors).
+        """
+        if self.enabled:
+            self.registry.register(collector)
+
+    def measure_handler(self, handler: str) -> Callable:
+        """
+            Decorator recording duration of calls of the decorated function as @handler.
+        """
+        def decorator(fn: Callable) -> Callable:
+            if not self.enabled:
+                return fn
+            observe = self.handler_seconds.labels(handler).observe
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    observe(time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def instrument_api(self, api, resource: Optional[str] = None):
+        """
+            Returns @api with calls counted and timed by verb and resource. Resource of custom objects calls
+            is taken from their 'plural' argument.
+        """
+        return _InstrumentedApi(api, self, resource) if self.enabled else api
+
+    def __histogram(self, name: str, documentation: str, labels: List[str], buckets: Sequence[float]):
+        if not self.enabled:
+            return _NoopMetric()
+        return prometheus_client.Histogram(name, documentation, labels, buckets=buckets, registry=self.registry)
+
+    def __counter(self, name: str, documentation: str, labels: List[str]):
+        if not self.enabled:
+            return _NoopMetric()
+        return prometheus_client.Counter(name, documentation, labels, registry=self.registry)
+
+
+class _InstrumentedApi:
+    __VERBS__ = {'read': 'get', 'replace': 'update'}
+
+    def __init__(self, api, metrics: OperatorMetrics, resource: Optional[str]):
+        self.__api = api
+        self.__metrics = metrics
+        self.__resource = resource
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.__api, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+        verb = 'deletecollection' if name.startswith('delete_collection') else name.split('_')[0]
+        verb = _InstrumentedApi.__VERBS__.get(verb, verb)
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            resource = kwargs.get('plural', self.__resource)
+            if name.endswith('_status'):
+                resource = f"{resource}/status"
+            code = "200"
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            except kubernetes.client.ApiException as e:
+                code = str(e.status)
+                raise
+            except Exception:
+                code = "error"
+                raise
+            finally:
+                self.__metrics.api_seconds.labels(verb, resource).observe(time.perf_counter() - start)
+                self.__metrics.api_requests.labels(verb, resource, code).inc()
+        return call
+
+
+operator_metrics = OperatorMetrics(OperatorConfig.METRICS_PORT > 0)
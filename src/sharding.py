@@ -0,0 +1,208 @@
+import bisect
+import hashlib
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, FrozenSet, Iterable, List, Optional, Set
+
+import kubernetes
+
+from src.api_client import KubernetesApi, kubernetes_api
+from src.config import OperatorConfig
+
+"""
+    Sharding of workflows between replicas of the operator. Every replica keeps its own Lease renewed, replicas
+    holding live Leases of the group form a consistent hash ring and a workflow (by namespace/name) is handled by
+    the replica it hashes to. A replica joining or leaving the group moves only workflows hashed next to its points
+    on the ring.
+"""
+
+
+class HashRing:
+    def __init__(self, members: Iterable[str] = (), virtual_nodes: int = 64):
+        self.members: FrozenSet[str] = frozenset(members)
+        points = sorted((HashRing.hash(f"{member}#{i}"), member) for member in self.members
+                        for i in range(virtual_nodes))
+        self.__hashes: List[int] = [h for h, _ in points]
+        self.__owners: List[str] = [member for _, member in points]
+
+    def get_owner(self, key: str) -> Optional[str]:
+        """
+            Returns member owning @key (the first point on the ring at or after hash of the key), None for empty ring.
+        """
+        if not self.__hashes:
+            return None
+        return self.__owners[bisect.bisect_left(self.__hashes, HashRing.hash(key)) % len(self.__hashes)]
+
+    @staticmethod
+    def hash(key: str) -> int:
+        # Must be stable across processes (unlike built-in hash of strings)
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+class ShardMembership:
+    """
+        Membership of this replica in the group of replicas sharing workflows.
+        When sharding is disabled the replica owns all workflows.
+    """
+    GROUP_LABEL = "workflow-operator-shard-group"
+    # Set on workflows taken over before they have been handled, so that their owner sees an event of them
+    OWNER_ANNOTATION = "workflow-operator-shard-owner"
+    api: KubernetesApi = kubernetes_api
+
+    def __init__(self, enabled: bool, identity: str, group: str, namespace: str, lease_duration: int,
+                 renew_interval: float, virtual_nodes: int):
+        self.enabled = enabled
+        self.identity = identity
+        self.group = group
+        self.namespace = namespace
+        self.lease_duration = lease_duration
+        self.renew_interval = renew_interval
+        self.virtual_nodes = virtual_nodes
+        self.__ring = HashRing((), virtual_nodes)
+        self.__on_rebalance: Optional[Callable[[HashRing], None]] = None
+        self.__renewed_at: Optional[float] = None
+        self.__lock = threading.Lock()
+        self.__stopped = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+
+    @property
+    def lease_name(self) -> str:
+        return f"{self.group}-{self.identity}"
+
+    def get_ring(self) -> HashRing:
+        with self.__lock:
+            return self.__ring
+
+    def owns(self, namespace: str, name: str, ring: Optional[HashRing] = None) -> bool:
+        """
+            Checks whether the workflow is handled by this replica (according to @ring, the current one by default).
+        """
+        if not self.enabled:
+            return True
+        ring = ring if ring is not None else self.get_ring()
+        return ring.get_owner(f"{namespace}/{name}") == self.identity
+
+    def set_members(self, members: Iterable[str]) -> bool:
+        """
+            Rebuilds the ring from @members. If the membership has changed, rebalance callback is called with
+            the previous ring. Returns True if the membership has changed.
+        """
+        members = frozenset(members)
+        with self.__lock:
+            previous = self.__ring
+            if previous.members == members:
+                return False
+            self.__ring = HashRing(members, self.virtual_nodes)
+            on_rebalance = self.__on_rebalance
+        logging.getLogger(__name__).info(f"Shard group {self.group} has {len(members)} replicas: {sorted(members)}.")
+        if on_rebalance is not None:
+            on_rebalance(previous)
+        return True
+
+    def start(self, on_rebalance: Callable[[HashRing], None]) -> None:
+        """
+            Joins the group and keeps the membership up to date in a background thread. @on_rebalance is called
+            with the previous ring whenever the membership changes.
+        """
+        self.__on_rebalance = on_rebalance
+        self.__stopped.clear()
+        self.refresh()
+        if self.__thread is None or not self.__thread.is_alive():
+            self.__thread = threading.Thread(target=self.__run, name="shard-membership", daemon=True)
+            self.__thread.start()
+
+    def stop(self) -> None:
+        """
+            Leaves the group - the Lease is deleted, so that other replicas take over workflows of this replica
+            without waiting for the Lease to expire.
+        """
+        self.__stopped.set()
+        if self.__thread is not None and self.__thread is not threading.current_thread():
+            self.__thread.join()
+        try:
+            ShardMembership.api.coordination().delete_namespaced_lease(name=self.lease_name, namespace=self.namespace)
+        except kubernetes.client.ApiException as e:
+            if e.status != 404:
+                logging.getLogger(__name__).warning(f"Failed to delete lease {self.lease_name}: {e.reason}")
+
+    def refresh(self, now: Optional[float] = None) -> bool:
+        """
+            Renews Lease of this replica and rebuilds the ring from live Leases of the group.
+            A replica which failed to renew its Lease for lease_duration seconds owns nothing, as other replicas
+            have dropped it from the group. Returns True if the membership has changed.
+        """
+        now = now or time.time()
+        logger = logging.getLogger(__name__)
+        try:
+            self.__renew(now)
+            self.__renewed_at = now
+        except Exception as e:
+            logger.warning(f"Failed to renew lease {self.lease_name}: {e}")
+        try:
+            members = self.__list_live_members(now)
+        except Exception as e:
+            logger.warning(f"Failed to list leases of shard group {self.group}: {e}")
+            members = set(self.get_ring().members)
+        if self.__renewed_at is not None and now - self.__renewed_at < self.lease_duration:
+            members.add(self.identity)
+        else:
+            members.discard(self.identity)
+        return self.set_members(members)
+
+    def __run(self) -> None:
+        while not self.__stopped.wait(self.renew_interval):
+            try:
+                self.refresh()
+            except Exception:
+                logging.getLogger(__name__).exception("Failed to refresh membership of the shard group.")
+
+    def __renew(self, now: float) -> None:
+        spec = {
+            'holderIdentity': self.identity,
+            'leaseDurationSeconds': self.lease_duration,
+            'renewTime': ShardMembership.__format_time(now)
+        }
+        try:
+            ShardMembership.api.coordination().patch_namespaced_lease(
+                name=self.lease_name, namespace=self.namespace, body={'spec': spec})
+        except kubernetes.client.ApiException as e:
+            if e.status != 404:
+                raise
+            ShardMembership.api.coordination().create_namespaced_lease(namespace=self.namespace, body={
+                'apiVersion': 'coordination.k8s.io/v1',
+                'kind': 'Lease',
+                'metadata': {'name': self.lease_name, 'labels': {ShardMembership.GROUP_LABEL: self.group}},
+                'spec': {**spec, 'acquireTime': spec['renewTime']}
+            })
+
+    def __list_live_members(self, now: float) -> Set[str]:
+        members = set()
+        continue_token = None
+        while True:
+            leases = ShardMembership.api.coordination().list_namespaced_lease(
+                namespace=self.namespace,
+                label_selector=f"{ShardMembership.GROUP_LABEL}={self.group}",
+                limit=OperatorConfig.LIST_PAGE_SIZE,
+                _continue=continue_token
+            )
+            for lease in leases.items:
+                spec = lease.spec
+                if spec is None or not spec.holder_identity or spec.renew_time is None:
+                    continue
+                if spec.renew_time.timestamp() + (spec.lease_duration_seconds or self.lease_duration) > now:
+                    members.add(spec.holder_identity)
+            continue_token = leases.metadata._continue
+            if not continue_token:
+                return members
+
+    @staticmethod
+    def __format_time(timestamp: float) -> str:
+        # Leases carry MicroTime - RFC 3339 with microseconds
+        return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+shard_membership = ShardMembership(OperatorConfig.SHARDING, OperatorConfig.SHARD_IDENTITY, OperatorConfig.SHARD_GROUP,
+                                   OperatorConfig.SHARD_LEASE_NAMESPACE, OperatorConfig.SHARD_LEASE_DURATION,
+                                   OperatorConfig.SHARD_RENEW_INTERVAL, OperatorConfig.SHARD_VIRTUAL_NODES)
@@ -0,0 +1,305 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+import kubernetes
+
+from src.config import OperatorConfig
+from src.job.job_submitter import JobSubmitter, job_submitter
+from src.metrics import operator_metrics
+from src.workflow.deadline_scheduler import DeadlineScheduler
+from src.workflow.patch_aggregator import workflow_patch_aggregator
+
+"""
+    Central queue of steps ready for execution. Steps are started by a single dispatcher thread, which drains
+    the queue fairly (round robin over namespaces, then over workflows of the namespace) while keeping
+    the number of running steps within MAX_RUNNING_STEPS in total and within spec.maxParallelism for every workflow.
+    Jobs of at most JOB_SUBMISSION_CONCURRENCY_PER_WORKFLOW steps of a workflow are being created at a time.
+    Within a workflow, steps with the highest priority (longest remaining critical path) are started first,
+    steps of equal priority in the order they have been queued.
+    A step is running from its admission until its job finishes (or is deleted). Every admission is given the name
+    of the job to create, so that events of other jobs of the step (e.g. of a job replaced by a rerun of the step)
+    don't free its slot.
+"""
+
+# (namespace, workflow name, step name, job name) -> False if the step doesn't exist anymore
+Launcher = Callable[[str, str, str, str], bool]
+# (namespace, workflow name, step name)
+StepCallback = Callable[[str, str, str], None]
+
+
+class WorkflowQueue:
+    def __init__(self, max_parallelism: Optional[int]):
+        self.max_parallelism = max_parallelism
+        self.priorities: Dict[str, float] = {}
+        # Heap of (-priority, sequence number, step name, time of enqueueing)
+        self.queue: List[Tuple[float, int, str, float]] = []
+        self.queued: Set[str] = set()
+        # step name -> name of its job, None for steps restored as running (their jobs are not known)
+        self.running: Dict[str, Optional[str]] = {}
+        # Number of admitted steps whose jobs are being created
+        self.launching = 0
+        self.__sequence = itertools.count()
+
+    def can_start(self, max_launching: int = 0) -> bool:
+        return bool(self.queue) and (not self.max_parallelism or len(self.running) < self.max_parallelism) and \
+            (not max_launching or self.launching < max_launching)
+
+    def push(self, step_name: str, enqueued_at: float) -> None:
+        priority = self.priorities.get(step_name, 0.0)
+        heapq.heappush(self.queue, (-priority, next(self.__sequence), step_name, enqueued_at))
+        self.queued.add(step_name)
+
+    def pop(self) -> Tuple[str, float]:
+        _, _, step_name, enqueued_at = heapq.heappop(self.queue)
+        self.queued.discard(step_name)
+        return step_name, enqueued_at
+
+
+class StepAdmissionQueue:
+    def __init__(self, max_running: int, submitter: JobSubmitter = job_submitter, retry_delay: float = 10.0,
+                 on_started: Optional[StepCallback] = None, max_launching_per_workflow: int = 0):
+        """
+            @on_started(namespace, workflow name, step name) records a started step, by default in the workflow status.
+            @max_launching_per_workflow caps job creation calls in flight for a workflow, 0 means no limit.
+        """
+        self.max_running = max_running
+        self.max_launching_per_workflow = max_launching_per_workflow
+        self.retry_delay = retry_delay
+        self.__on_started = on_started
+        self.running = 0
+        self.__submitter = submitter
+        self.__workflows: Dict[Tuple[str, str], WorkflowQueue] = {}
+        # namespace -> workflows of the namespace with non empty queues, in the order they are served
+        self.__rotation: "OrderedDict[str, Deque[Tuple[str, str]]]" = OrderedDict()
+        self.__condition = threading.Condition()
+        self.__launcher: Optional[Launcher] = None
+        self.__thread: Optional[threading.Thread] = None
+        self.__stopped = False
+        self.__retries = DeadlineScheduler()
+
+    def start(self, launcher: Launcher) -> None:
+        """
+            Starts the dispatcher. @launcher(namespace, workflow name, step name, job name) creates the job of the step.
+        """
+        with self.__condition:
+            self.__launcher = launcher
+            self.__stopped = False
+            if self.__thread is None or not self.__thread.is_alive():
+                self.__thread = threading.Thread(target=self.__run, name="step-dispatcher", daemon=True)
+                self.__thread.start()
+        self.__retries.start()
+
+    def stop(self) -> None:
+        with self.__condition:
+            self.__stopped = True
+            self.__condition.notify()
+            thread = self.__thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self.__retries.stop()
+
+    def is_tracked(self, namespace: str, workflow_name: str) -> bool:
+        with self.__condition:
+            return (namespace, workflow_name) in self.__workflows
+
+    def restore(self, namespace: str, workflow_name: str, running_steps: Iterable[str],
+                max_parallelism: Optional[int]) -> None:
+        """
+            Registers steps of the workflow which are running already, e.g. after restart of the operator.
+        """
+        with self.__condition:
+            workflow = self.__get_workflow(namespace, workflow_name, max_parallelism)
+            for step_name in running_steps:
+                if step_name not in workflow.running:
+                    workflow.running[step_name] = None
+                    self.running += 1
+
+    def enqueue(self, namespace: str, workflow_name: str, step_names: Iterable[str],
+                max_parallelism: Optional[int], priorities: Optional[Dict[str, float]] = None) -> int:
+        """
+            Queues steps of the workflow for execution, steps which are queued or running already are skipped.
+            @priorities (step name -> priority, for all steps of the workflow) order steps of the workflow.
+            Returns number of newly queued steps.
+        """
+        now = time.perf_counter()
+        with self.__condition:
+            workflow = self.__get_workflow(namespace, workflow_name, max_parallelism)
+            if priorities is not None:
+                workflow.priorities = priorities
+            new_steps = [s for s in step_names if s not in workflow.queued and s not in workflow.running]
+            for step_name in new_steps:
+                workflow.push(step_name, now)
+            if new_steps:
+                self.__schedule(namespace, workflow_name)
+            return len(new_steps)
+
+    def release(self, namespace: str, workflow_name: str, step_name: str, job_name: Optional[str] = None) -> None:
+        """
+            Frees the slot of a step whose job @job_name has finished. Jobs of the step other than the one created
+            for its admission are ignored - any job frees the slot of a restored step. Without @job_name the slot
+            is freed regardless of the job.
+        """
+        with self.__condition:
+            workflow = self.__workflows.get((namespace, workflow_name))
+            if workflow is not None and step_name in workflow.running and \
+                    (job_name is None or workflow.running[step_name] in (None, job_name)):
+                del workflow.running[step_name]
+                self.running -= 1
+                self.__condition.notify()
+
+    def cancel(self, namespace: str, workflow_name: str) -> None:
+        """
+            Drops queued steps of the workflow (e.g. after its failure), running steps keep their slots.
+        """
+        with self.__condition:
+            workflow = self.__workflows.get((namespace, workflow_name))
+            if workflow is not None:
+                workflow.queue.clear()
+                workflow.queued.clear()
+
+    def forget(self, namespace: str, workflow_name: str) -> None:
+        """
+            Drops all state of the workflow. Jobs which are being created at the moment won't be recorded as started.
+        """
+        with self.__condition:
+            workflow = self.__workflows.pop((namespace, workflow_name), None)
+            if workflow is not None:
+                self.running -= len(workflow.running)
+                self.__condition.notify()
+
+    def get_queued(self) -> Dict[str, int]:
+        """
+            Returns number of queued steps by namespace.
+        """
+        with self.__condition:
+            queued: Dict[str, int] = {}
+            for (namespace, _), workflow in self.__workflows.items():
+                queued[namespace] = queued.get(namespace, 0) + len(workflow.queue)
+            return queued
+
+    def has_queued(self) -> bool:
+        with self.__condition:
+            return any(workflow.queue for workflow in self.__workflows.values())
+
+    def dispatch(self) -> int:
+        """
+            Starts all steps which can be started now. Returns number of started steps.
+        """
+        with self.__condition:
+            admitted = self.__admit()
+        for admission in admitted:
+            self.__launch(*admission)
+        return len(admitted)
+
+    def __run(self) -> None:
+        while True:
+            with self.__condition:
+                admitted = self.__admit()
+                while not admitted and not self.__stopped:
+                    self.__condition.wait()
+                    admitted = self.__admit()
+                if self.__stopped:
+                    return
+            for admission in admitted:
+                self.__launch(*admission)
+
+    def __admit(self) -> List[Tuple[str, str, str, str, float, WorkflowQueue]]:
+        admitted = []
+        while self.__rotation and (not self.max_running or self.running < self.max_running):
+            progressed = False
+            for namespace in list(self.__rotation):
+                if self.max_running and self.running >= self.max_running:
+                    break
+                workflows = self.__rotation[namespace]
+                for _ in range(len(workflows)):
+                    key = workflows[0]
+                    workflows.rotate(-1)
+                    workflow = self.__workflows.get(key)
+                    if workflow is None or not workflow.queue:
+                        workflows.remove(key)
+                        continue
+                    if not workflow.can_start(self.max_launching_per_workflow):
+                        continue
+                    step_name, enqueued_at = workflow.pop()
+                    workflow.launching += 1
+                    job_name = f"{step_name}-{uuid.uuid4()}"
+                    workflow.running[step_name] = job_name
+                    self.running += 1
+                    admitted.append((key[0], key[1], step_name, job_name, enqueued_at, workflow))
+                    if not workflow.queue:
+                        workflows.remove(key)
+                    progressed = True
+                    self.__rotation.move_to_end(namespace)
+                    break
+                if not workflows:
+                    del self.__rotation[namespace]
+            if not progressed:
+                break
+        return admitted
+
+    def __launch(self, namespace: str, workflow_name: str, step_name: str, job_name: str, enqueued_at: float,
+                 workflow: WorkflowQueue) -> None:
+        future = self.__submitter.submit_async(lambda: self.__launcher(namespace, workflow_name, step_name, job_name))
+        future.add_done_callback(lambda f: self.__on_launched(f, namespace, workflow_name, step_name, job_name,
+                                                              enqueued_at, workflow))
+
+    def __on_launched(self, future: Future, namespace: str, workflow_name: str, step_name: str, job_name: str,
+                      enqueued_at: float, workflow: WorkflowQueue) -> None:
+        with self.__condition:
+            workflow.launching -= 1
+            self.__condition.notify()
+            # Workflow may have been forgotten (deleted, restarted) in the meantime
+            is_current = self.__workflows.get((namespace, workflow_name)) is workflow
+        exception = future.exception()
+        if exception is None and not future.result():
+            self.release(namespace, workflow_name, step_name, job_name)
+            return
+        if exception is None:
+            operator_metrics.step_queue_seconds.observe(time.perf_counter() - enqueued_at)
+            if is_current:
+                (self.__on_started or workflow_patch_aggregator.add_started_step)(namespace, workflow_name, step_name)
+            return
+
+        logging.getLogger(__name__).error(
+            f"Failed to start job for step {step_name} in workflow {workflow_name} in namespace {namespace}: {exception}")
+        self.release(namespace, workflow_name, step_name, job_name)
+        if isinstance(exception, kubernetes.client.ApiException) and exception.status == 404:
+            # Workflow is gone
+            return
+        if is_current:
+            self.__retries.schedule((namespace, workflow_name, step_name), time.time() + self.retry_delay,
+                                    lambda: self.__retry(namespace, workflow_name, step_name, workflow))
+
+    def __retry(self, namespace: str, workflow_name: str, step_name: str, workflow: WorkflowQueue) -> None:
+        with self.__condition:
+            if self.__workflows.get((namespace, workflow_name)) is not workflow:
+                return
+            if step_name not in workflow.queued and step_name not in workflow.running:
+                workflow.push(step_name, time.perf_counter())
+                self.__schedule(namespace, workflow_name)
+
+    def __get_workflow(self, namespace: str, workflow_name: str, max_parallelism: Optional[int]) -> WorkflowQueue:
+        workflow = self.__workflows.get((namespace, workflow_name))
+        if workflow is None:
+            workflow = self.__workflows[(namespace, workflow_name)] = WorkflowQueue(max_parallelism)
+        elif workflow.max_parallelism != max_parallelism:
+            workflow.max_parallelism = max_parallelism
+            self.__condition.notify()
+        return workflow
+
+    def __schedule(self, namespace: str, workflow_name: str) -> None:
+        workflows = self.__rotation.setdefault(namespace, deque())
+        if (namespace, workflow_name) not in workflows:
+            workflows.append((namespace, workflow_name))
+        self.__condition.notify()
+
+
+step_admission_queue = StepAdmissionQueue(
+    OperatorConfig.MAX_RUNNING_STEPS, max_launching_per_workflow=OperatorConfig.JOB_SUBMISSION_CONCURRENCY_PER_WORKFLOW)
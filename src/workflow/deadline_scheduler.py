@@ -0,0 +1,105 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+"""
+    Single thread serving deadlines of all workflows from a heap.
+    Memory use is proportional to the number of live deadlines: cancelled or replaced heap entries are dropped lazily
+    and the heap is compacted once they outnumber live deadlines.
+"""
+
+
+class DeadlineScheduler:
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.__clock = clock
+        self.__heap: List[Tuple[float, int, Hashable]] = []
+        # key -> (sequence number of the live heap entry, deadline, callback)
+        self.__deadlines: Dict[Hashable, Tuple[int, float, Callable[[], None]]] = {}
+        self.__sequence = itertools.count()
+        self.__condition = threading.Condition()
+        self.__thread: Optional[threading.Thread] = None
+        self.__stopped = False
+
+    def schedule(self, key: Hashable, deadline: float, callback: Callable[[], None]) -> None:
+        """
+            Calls @callback at @deadline (timestamp) unless it is cancelled before. Replaces earlier deadline of @key.
+        """
+        with self.__condition:
+            sequence = next(self.__sequence)
+            self.__deadlines[key] = (sequence, deadline, callback)
+            heapq.heappush(self.__heap, (deadline, sequence, key))
+            if len(self.__heap) > 2 * len(self.__deadlines) + 64:
+                self.__compact()
+            self.__condition.notify()
+
+    def cancel(self, key: Hashable) -> None:
+        with self.__condition:
+            self.__deadlines.pop(key, None)
+
+    def get_deadline(self, key: Hashable) -> Optional[float]:
+        with self.__condition:
+            return self.__deadlines[key][1] if key in self.__deadlines else None
+
+    def start(self) -> None:
+        with self.__condition:
+            self.__stopped = False
+            if self.__thread is None or not self.__thread.is_alive():
+                self.__thread = threading.Thread(target=self.__run, name="deadline-scheduler", daemon=True)
+                self.__thread.start()
+
+    def stop(self) -> None:
+        with self.__condition:
+            self.__stopped = True
+            self.__condition.notify()
+            thread = self.__thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def __len__(self) -> int:
+        return len(self.__deadlines)
+
+    def run_due(self) -> int:
+        """
+            Fires all deadlines which are due. Returns number of callbacks called.
+        """
+        fired = 0
+        while True:
+            with self.__condition:
+                callback = self.__pop_due()
+            if callback is None:
+                return fired
+            try:
+                callback()
+            except Exception:
+                logging.getLogger(__name__).exception("Deadline callback failed.")
+            fired += 1
+
+    def __pop_due(self) -> Optional[Callable[[], None]]:
+        while self.__heap and self.__heap[0][0] <= self.__clock():
+            _, sequence, key = heapq.heappop(self.__heap)
+            live = self.__deadlines.get(key)
+            if live is not None and live[0] == sequence:
+                del self.__deadlines[key]
+                return live[2]
+        return None
+
+    def __run(self) -> None:
+        while True:
+            with self.__condition:
+                if self.__stopped:
+                    return
+                timeout = self.__heap[0][0] - self.__clock() if self.__heap else None
+                if timeout is None or timeout > 0:
+                    self.__condition.wait(timeout)
+                    continue
+            self.run_due()
+
+    def __compact(self) -> None:
+        self.__heap = [e for e in self.__heap if self.__deadlines.get(e[2], (None,))[0] == e[1]]
+        heapq.heapify(self.__heap)
+
+
+deadline_scheduler = DeadlineScheduler()
@@ -0,0 +1,94 @@
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from src.config import OperatorConfig
+from src.workflow.workflow import Workflow
+
+"""
+    Observed run times of steps, used to start steps lying on the longest remaining path of their workflow first.
+"""
+
+# (workflow name, step name, image)
+StepKey = Tuple[str, str, str]
+
+
+class StepDurationStore:
+    """
+        Bounded LRU map of (workflow name, step name, image) -> exponentially weighted moving average of run times
+        of the step. Optionally persisted as a JSON file, so that history survives restart of the operator.
+    """
+    __SMOOTHING__ = 0.3
+    # Duration assumed for steps never seen, if no other step of the workflow has been seen either
+    __DEFAULT_DURATION__ = 1.0
+
+    def __init__(self, max_size: int, path: Optional[str] = None):
+        self.max_size = max_size
+        self.path = path
+        self.__durations: "OrderedDict[StepKey, float]" = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def record(self, workflow_name: str, step_name: str, image: str, seconds: float) -> None:
+        key = (workflow_name, step_name, image)
+        with self.__lock:
+            previous = self.__durations.get(key)
+            self.__durations[key] = seconds if previous is None else \
+                previous + StepDurationStore.__SMOOTHING__ * (seconds - previous)
+            self.__durations.move_to_end(key)
+            while len(self.__durations) > self.max_size:
+                self.__durations.popitem(last=False)
+
+    def get(self, workflow_name: str, step_name: str, image: str) -> Optional[float]:
+        with self.__lock:
+            return self.__durations.get((workflow_name, step_name, image))
+
+    def get_critical_path_lengths(self, workflow_name: str, graph: Workflow,
+                                  topological_order: List[int]) -> List[float]:
+        """
+            Returns, for every step of @graph (by step id), the expected time from its start to the end of
+            the workflow when nothing else delays it: its duration plus the longest remaining path behind it.
+            Steps never seen are assumed to take the mean duration of the seen steps of the workflow.
+        """
+        with self.__lock:
+            durations = [self.__durations.get((workflow_name, s.stepName, s.image)) for s in graph.steps]
+        known = [d for d in durations if d is not None]
+        default = sum(known) / len(known) if known else StepDurationStore.__DEFAULT_DURATION__
+        lengths = [0.0] * len(graph)
+        for step_id in reversed(topological_order):
+            tail = max((lengths[child] for child in graph.successors(step_id)), default=0.0)
+            duration = durations[step_id]
+            lengths[step_id] = (default if duration is None else duration) + tail
+        return lengths
+
+    def load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.getLogger(__name__).warning(f"Failed to load step durations from {self.path}: {e}")
+            return
+        with self.__lock:
+            for workflow_name, step_name, image, seconds in entries[-self.max_size:]:
+                self.__durations[(workflow_name, step_name, image)] = seconds
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self.__lock:
+            entries = [[*key, seconds] for key, seconds in self.__durations.items()]
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+    def __len__(self) -> int:
+        return len(self.__durations)
+
+
+step_duration_store = StepDurationStore(OperatorConfig.STEP_DURATION_STORE_SIZE,
+                                        OperatorConfig.STEP_DURATION_STORE_PATH or None)
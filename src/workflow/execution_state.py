@@ -0,0 +1,67 @@
+import base64
+import re
+from typing import Iterable, Iterator
+
+"""
+    Compact representation of a set of workflow steps - a bitset indexed by step ordinal (position in spec.containers)
+    encoded with base64. Bitset of 10k steps takes less than 2KiB.
+"""
+
+_NON_ZERO_BYTE = re.compile(b'[^\x00]')
+
+
+class StepSet:
+    def __init__(self, bits: int = 0):
+        self.bits = bits
+
+    @staticmethod
+    def decode(value: str) -> 'StepSet':
+        if not value:
+            return StepSet()
+        return StepSet(int.from_bytes(base64.b64decode(value), 'little'))
+
+    @staticmethod
+    def from_ids(step_ids: Iterable[int]) -> 'StepSet':
+        step_set = StepSet()
+        for step_id in step_ids:
+            step_set.add(step_id)
+        return step_set
+
+    def encode(self) -> str:
+        if not self.bits:
+            return ''
+        return base64.b64encode(self.bits.to_bytes((self.bits.bit_length() + 7) // 8, 'little')).decode()
+
+    def add(self, step_id: int) -> None:
+        self.bits |= 1 << step_id
+
+    def discard(self, step_id: int) -> None:
+        self.bits &= ~(1 << step_id)
+
+    def union(self, other: 'StepSet') -> 'StepSet':
+        return StepSet(self.bits | other.bits)
+
+    def issubset(self, other: 'StepSet') -> bool:
+        return self.bits & ~other.bits == 0
+
+    def __contains__(self, step_id: int) -> bool:
+        return (self.bits >> step_id) & 1 == 1
+
+    def __iter__(self) -> Iterator[int]:
+        # Zero bytes are skipped by the regex engine, sparse sets are iterated in O(number of set bytes)
+        data = self.bits.to_bytes((self.bits.bit_length() + 7) // 8, 'little')
+        for match in _NON_ZERO_BYTE.finditer(data):
+            byte_index = match.start()
+            byte = data[byte_index]
+            for bit in range(8):
+                if (byte >> bit) & 1:
+                    yield byte_index * 8 + bit
+
+    def __len__(self) -> int:
+        return bin(self.bits).count('1')
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, StepSet) and self.bits == other.bits
+
+    def __repr__(self) -> str:
+        return f"StepSet({list(self)})"
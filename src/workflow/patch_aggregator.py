@@ -0,0 +1,236 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+import kubernetes
+import urllib3
+
+from src.config import OperatorConfig
+from src.workflow.deadline_scheduler import DeadlineScheduler
+from src.workflow.status import WorkflowStatusEnum
+from src.workflow.workflow_controller import WorkflowController
+from src.workflow.workflow_index import workflow_index
+
+"""
+    Coalesces updates of workflows coming from job events and the step dispatcher into a single patch per workflow.
+    Updates are collected for PATCH_COALESCE_WINDOW seconds and sent as one patch guarded by resourceVersion,
+    the patch is rebuilt from a fresh object and retried on conflict. Patches which would not change anything are dropped.
+    At most one patch of a workflow is in flight, updates collected meanwhile are sent right after it.
+    Patches failing with errors which may go away (conflicts, 429, 5xx, connection errors) are retried
+    with exponential backoff up to PATCH_MAX_ATTEMPTS times, other failures are logged and the patch is dropped.
+"""
+
+
+class PendingWorkflowPatch:
+    def __init__(self):
+        self.executed_steps: Set[str] = set()
+        self.started_steps: Set[str] = set()
+        # step name -> (number of retries, timestamp of the last retry)
+        self.step_retries: Dict[str, Tuple[int, float]] = {}
+        self.status: Optional[Tuple[WorkflowStatusEnum, Optional[str]]] = None
+        self.retries = 0
+
+    def set_status(self, status: WorkflowStatusEnum, message: Optional[str]) -> None:
+        # Failure can't be overridden by a later update collected in the same window
+        if self.status is not None and self.status[0] == WorkflowStatusEnum.FAILED:
+            return
+        self.status = (status, message)
+
+    def merge(self, other: 'PendingWorkflowPatch') -> None:
+        self.executed_steps.update(other.executed_steps)
+        self.started_steps.update(other.started_steps)
+        for step_name, retry in other.step_retries.items():
+            self.step_retries[step_name] = max(self.step_retries.get(step_name, retry), retry)
+        self.retries = max(self.retries, other.retries)
+        if other.status is not None:
+            self.set_status(*other.status)
+
+
+class WorkflowPatchAggregator:
+    __RETRY_DELAY__ = 1.0
+    __MAX_RETRY_DELAY__ = 30.0
+
+    def __init__(self, window: float, max_attempts: int, workers: int = 8):
+        self.window = window
+        self.max_attempts = max_attempts
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+        self.conflicts = 0
+        self.__pending: Dict[Tuple[str, str], PendingWorkflowPatch] = {}
+        self.__in_flight: Set[Tuple[str, str]] = set()
+        self.__lock = threading.Lock()
+        self.__timers = DeadlineScheduler()
+        self.__executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="workflow-patcher")
+
+    def start(self) -> None:
+        self.__timers.start()
+
+    def stop(self) -> None:
+        """
+            Stops timers and sends all pending patches.
+        """
+        self.__timers.stop()
+        with self.__lock:
+            keys = list(self.__pending)
+        for namespace, workflow_name in keys:
+            self.flush(namespace, workflow_name)
+
+    def add_executed_step(self, namespace: str, workflow_name: str, step_name: str) -> None:
+        self.add_executed_steps(namespace, workflow_name, [step_name])
+
+    def add_executed_steps(self, namespace: str, workflow_name: str, step_names: Iterable[str]) -> None:
+        """
+            Adds steps executed together - they are sent in the same patch.
+        """
+        pending = PendingWorkflowPatch()
+        pending.executed_steps.update(step_names)
+        self.__enqueue(namespace, workflow_name, pending, self.window)
+
+    def add_started_step(self, namespace: str, workflow_name: str, step_name: str) -> None:
+        pending = PendingWorkflowPatch()
+        pending.started_steps.add(step_name)
+        self.__enqueue(namespace, workflow_name, pending, self.window)
+
+    def add_step_retry(self, namespace: str, workflow_name: str, step_name: str, attempts: int,
+                       retry_at: float) -> None:
+        pending = PendingWorkflowPatch()
+        pending.step_retries[step_name] = (attempts, retry_at)
+        self.__enqueue(namespace, workflow_name, pending, self.window)
+
+    def set_status(self, namespace: str, workflow_name: str, status: WorkflowStatusEnum,
+                   message: Optional[str] = None) -> None:
+        pending = PendingWorkflowPatch()
+        pending.set_status(status, message)
+        self.__enqueue(namespace, workflow_name, pending, self.window)
+
+    def flush(self, namespace: str, workflow_name: str) -> None:
+        """
+            Sends pending patch of the workflow (if any). If a patch of the workflow is being sent already,
+            the pending one is sent by the same thread right after it.
+        """
+        key = (namespace, workflow_name)
+        while True:
+            with self.__lock:
+                if key in self.__in_flight or key not in self.__pending:
+                    return
+                pending = self.__pending.pop(key)
+                self.__in_flight.add(key)
+            try:
+                if not self.__try_send(namespace, workflow_name, pending):
+                    return
+            finally:
+                with self.__lock:
+                    self.__in_flight.discard(key)
+
+    def has_pending(self, namespace: str, workflow_name: str) -> bool:
+        with self.__lock:
+            return (namespace, workflow_name) in self.__pending or (namespace, workflow_name) in self.__in_flight
+
+    def __enqueue(self, namespace: str, workflow_name: str, pending: PendingWorkflowPatch, delay: float) -> None:
+        key = (namespace, workflow_name)
+        with self.__lock:
+            if key in self.__pending:
+                self.__pending[key].merge(pending)
+                return
+            self.__pending[key] = pending
+        if delay <= 0:
+            self.flush(namespace, workflow_name)
+        else:
+            self.__timers.schedule(key, time.time() + delay,
+                                   lambda: self.__executor.submit(self.flush, namespace, workflow_name))
+
+    def __try_send(self, namespace: str, workflow_name: str, pending: PendingWorkflowPatch) -> bool:
+        """
+            Returns False if the patch has been scheduled for a retry.
+        """
+        logger = logging.getLogger(__name__)
+        try:
+            if self.__send(namespace, workflow_name, pending):
+                return True
+            error = f"conflicting after {self.max_attempts} attempts"
+        except kubernetes.client.ApiException as e:
+            if e.status != 429 and e.status < 500:
+                self.failed += 1
+                logger.error(f"Dropping patch of workflow {workflow_name} in namespace {namespace}: "
+                             f"{e.status} {e.reason}")
+                return True
+            error = f"{e.status} {e.reason}"
+        except (urllib3.exceptions.HTTPError, ConnectionError) as e:
+            error = str(e)
+        except Exception:
+            self.failed += 1
+            logger.exception(f"Dropping patch of workflow {workflow_name} in namespace {namespace}.")
+            return True
+
+        if pending.retries + 1 >= self.max_attempts:
+            self.failed += 1
+            logger.error(f"Dropping patch of workflow {workflow_name} in namespace {namespace} after "
+                         f"{pending.retries + 1} attempts: {error}")
+            return True
+        delay = min(WorkflowPatchAggregator.__RETRY_DELAY__ * 2 ** pending.retries,
+                    WorkflowPatchAggregator.__MAX_RETRY_DELAY__)
+        pending.retries += 1
+        logger.warning(f"Failed to patch workflow {workflow_name} in namespace {namespace} ({error}), "
+                       f"retrying in {delay} seconds...")
+        key = (namespace, workflow_name)
+        with self.__lock:
+            if key in self.__pending:
+                self.__pending[key].merge(pending)
+            else:
+                self.__pending[key] = pending
+        # Updates collected in the meantime wait for the retry as well
+        self.__timers.schedule(key, time.time() + delay,
+                               lambda: self.__executor.submit(self.flush, namespace, workflow_name))
+        return False
+
+    def __send(self, namespace: str, workflow_name: str, pending: PendingWorkflowPatch) -> bool:
+        """
+            Returns False if the patch kept conflicting with concurrent updates.
+        """
+        workflow = workflow_index.get(namespace, workflow_name)
+        for _ in range(self.max_attempts):
+            if workflow is None:
+                workflow = WorkflowController.get_workflow(namespace, workflow_name)
+            patch = WorkflowPatchAggregator.__build_patch(workflow, pending)
+            if not patch:
+                self.dropped += 1
+                return True
+            patch['metadata'] = dict(patch.get('metadata', {}), resourceVersion=workflow['metadata']['resourceVersion'])
+            try:
+                WorkflowController.patch_workflow(patch=patch, workflow_name=workflow_name, namespace=namespace)
+                self.sent += 1
+                return True
+            except kubernetes.client.ApiException as e:
+                if e.status == 404:
+                    return True
+                if e.status != 409:
+                    raise
+                self.conflicts += 1
+                workflow = None
+        return False
+
+    @staticmethod
+    def __build_patch(workflow: Dict, pending: PendingWorkflowPatch) -> Dict:
+        patch = {}
+        # Steps could have been removed from the spec in the meantime
+        executed_steps = set(s for s in pending.executed_steps if WorkflowController.has_step(workflow, s))
+        started_steps = set(s for s in pending.started_steps if WorkflowController.has_step(workflow, s))
+        if executed_steps:
+            WorkflowController.add_executed_steps(workflow, patch, executed_steps)
+        if started_steps:
+            WorkflowController.add_started_steps(workflow, patch, started_steps)
+        for step_name, (attempts, retry_at) in pending.step_retries.items():
+            if WorkflowController.has_step(workflow, step_name):
+                WorkflowController.add_step_retry(workflow, patch, step_name, attempts, retry_at)
+        if pending.status is not None and (
+                'workflow-status' not in workflow.get('status', {}) or
+                WorkflowController.get_status(workflow) != pending.status[0]):
+            WorkflowController.update_status(patch, *pending.status)
+        return patch
+
+
+workflow_patch_aggregator = WorkflowPatchAggregator(OperatorConfig.PATCH_COALESCE_WINDOW,
+                                                    OperatorConfig.PATCH_MAX_ATTEMPTS)
@@ -0,0 +1,111 @@
+import threading
+from array import array
+from typing import Iterable, Optional, Set
+
+from src.workflow.execution_state import StepSet
+from src.workflow.workflow import Workflow
+from src.workflow.workflow_schema import WorkflowStepSchema
+
+"""
+    Incremental computation of the set of steps ready for execution.
+"""
+
+
+class WorkflowScheduler:
+    """
+        Keeps, for every step, the number of its direct dependencies which have not been executed yet, and the set
+        of steps which are ready, but haven't been started. Marking a step as executed costs O(out-degree of the step),
+        syncing with the execution state of the workflow costs O(size of the change) plus a few bitset operations.
+    """
+
+    def __init__(self, graph: Workflow, executed: Optional[StepSet] = None):
+        self.__graph = graph
+        self.__lock = threading.Lock()
+        self.rebuild(executed or StepSet())
+
+    def rebuild(self, executed: StepSet, started: Optional[StepSet] = None) -> None:
+        """
+            Recomputes counters from scratch, e.g. from the execution state stored in the workflow after restart.
+        """
+        with self.__lock:
+            self.__rebuild(executed, started or StepSet())
+
+    def mark_executed(self, step_name: str) -> Set[WorkflowStepSchema]:
+        """
+            Returns steps which became ready for execution because of execution of step @step_name.
+        """
+        with self.__lock:
+            return self.__to_steps(self.__mark_executed(self.__graph.get_id(step_name)))
+
+    def sync(self, executed: StepSet, started: StepSet) -> Set[WorkflowStepSchema]:
+        """
+            Brings the scheduler up to date with execution state of the workflow. Returns steps which became ready
+            for execution since the previous call and haven't been started - all such steps after a rebuild.
+            The scheduler is rebuilt if a step has been removed from @executed or @started (e.g. after workflow restart).
+        """
+        with self.__lock:
+            if not self.__executed_set.issubset(executed) or not self.__started_set.issubset(started):
+                self.__rebuild(executed, started)
+            newly_ready: Set[int] = set()
+            for step_id in StepSet(started.bits & ~self.__started_set.bits):
+                self.__mark_started(step_id)
+            self.__started_set = StepSet(started.bits)
+            for step_id in StepSet(executed.bits & ~self.__executed_set.bits):
+                newly_ready.update(self.__mark_executed(step_id))
+            if not self.__synced:
+                self.__synced = True
+                return self.__to_steps(self.__ready)
+            # Steps executed together with their dependencies are not ready
+            return self.__to_steps(newly_ready & self.__ready)
+
+    def get_ready(self) -> Set[WorkflowStepSchema]:
+        """
+            Returns all steps ready for execution which haven't been started.
+        """
+        with self.__lock:
+            return self.__to_steps(self.__ready)
+
+    def is_executed(self, step_name: str) -> bool:
+        return self.__graph.get_id(step_name) in self.__executed_set
+
+    def __rebuild(self, executed: StepSet, started: StepSet) -> None:
+        self.__synced = False
+        self.__executed_set = StepSet(executed.bits)
+        self.__started_set = StepSet(started.bits)
+        self.__executed = bytearray(len(self.__graph))
+        for step_id in executed:
+            self.__executed[step_id] = 1
+        self.__started = bytearray(len(self.__graph))
+        for step_id in started:
+            self.__started[step_id] = 1
+        self.__pending = array('i', [0]) * len(self.__graph)
+        self.__ready: Set[int] = set()
+        for step_id in range(len(self.__graph)):
+            if self.__executed[step_id]:
+                continue
+            self.__pending[step_id] = sum(1 for p in self.__graph.predecessors(step_id) if not self.__executed[p])
+            if self.__pending[step_id] == 0 and not self.__started[step_id]:
+                self.__ready.add(step_id)
+
+    def __mark_started(self, step_id: int) -> None:
+        self.__started[step_id] = 1
+        self.__ready.discard(step_id)
+
+    def __mark_executed(self, step_id: int) -> Set[int]:
+        if self.__executed[step_id]:
+            return set()
+        self.__executed[step_id] = 1
+        self.__executed_set.add(step_id)
+        self.__ready.discard(step_id)
+        newly_ready = set()
+        for child in self.__graph.successors(step_id):
+            if self.__executed[child]:
+                continue
+            self.__pending[child] -= 1
+            if self.__pending[child] == 0 and not self.__started[child]:
+                newly_ready.add(child)
+        self.__ready.update(newly_ready)
+        return newly_ready
+
+    def __to_steps(self, step_ids: Iterable[int]) -> Set[WorkflowStepSchema]:
+        return set(self.__graph.steps[i] for i in step_ids)
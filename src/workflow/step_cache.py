@@ -0,0 +1,97 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+from src.config import OperatorConfig
+from src.workflow.workflow import Workflow
+
+"""
+    Successful step results of workflows with spec.cacheSteps set, addressed by content of the steps.
+    A step whose key has been recorded is marked executed without creating its job.
+"""
+
+
+def get_step_cache_keys(namespace: str, graph: Workflow, topological_order: List[int]) -> List[str]:
+    """
+        Returns, for every step of @graph (by step id), hash of its namespace, image, command (and completions
+        of indexed steps) and of the keys of its dependencies - two steps share the key only if they and all steps
+        they (transitively) depend on run the same images with the same commands.
+    """
+    keys = [""] * len(graph)
+    for step_id in topological_order:
+        step = graph.steps[step_id]
+        content = [namespace, step.image, step.command, sorted(keys[p] for p in graph.predecessors(step_id))]
+        if step.completions is not None:
+            # Keys of steps which are not indexed are kept as they were before indexed steps
+            content.append(step.completions)
+        keys[step_id] = hashlib.sha256(json.dumps(content, separators=(',', ':')).encode()).hexdigest()
+    return keys
+
+
+class StepResultCache:
+    """
+        Bounded LRU set of keys of successfully executed steps, entries expire @ttl seconds after the last success.
+        Optionally persisted as a JSON file, so that results survive restart of the operator.
+    """
+
+    def __init__(self, max_size: int, ttl: float, path: Optional[str] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        # key -> time of the last success
+        self.__entries: "OrderedDict[str, float]" = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def record(self, key: str, now: Optional[float] = None) -> None:
+        with self.__lock:
+            self.__entries[key] = now or time.time()
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+
+    def contains(self, key: str, now: Optional[float] = None) -> bool:
+        with self.__lock:
+            recorded_at = self.__entries.get(key)
+            if recorded_at is None:
+                return False
+            if (now or time.time()) - recorded_at > self.ttl:
+                del self.__entries[key]
+                return False
+            return True
+
+    def load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.getLogger(__name__).warning(f"Failed to load step results from {self.path}: {e}")
+            return
+        oldest = time.time() - self.ttl
+        with self.__lock:
+            for key, recorded_at in entries[-self.max_size:]:
+                if recorded_at >= oldest:
+                    self.__entries[key] = recorded_at
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self.__lock:
+            entries = [[key, recorded_at] for key, recorded_at in self.__entries.items()]
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+
+step_result_cache = StepResultCache(OperatorConfig.STEP_CACHE_SIZE, OperatorConfig.STEP_CACHE_TTL,
+                                    OperatorConfig.STEP_CACHE_PATH or None)
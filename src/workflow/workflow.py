@@ -1,20 +1,119 @@
-import itertools
-from typing import List, Set
-
-import networkx as nx
+from array import array
+from typing import Dict, Iterator, List, Optional, Set
 
 from src.workflow.workflow_schema import WorkflowStepSchema, WorkflowSchema
 
 """
-    Represents DAG graph of workflow steps.  
+    Represents DAG graph of workflow steps.
+    Steps are given dense integer ids (their position in the spec) and edges are stored in CSR arrays, i.e.
+    successors of step @i are targets[offsets[i]:offsets[i + 1]].
 """
 
 
-class Workflow(nx.DiGraph):
+class Workflow:
     def __init__(self, schema: WorkflowSchema):
-        super().__init__()
-        self.__name_to_node = {}
-        self.__add_steps(schema.steps)
+        self.steps: List[WorkflowStepSchema] = list(schema.steps)
+        self.__name_to_id: Dict[str, int] = {}
+        for step_id, step in enumerate(self.steps):
+            if step.stepName in self.__name_to_id:
+                raise RuntimeError(f"Step name {step.stepName} is not unique!")
+            if step.parallelism is not None and step.completions is None:
+                raise RuntimeError(f"Step {step.stepName} sets parallelism without completions!")
+            self.__name_to_id[step.stepName] = step_id
+        self.__link_steps()
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    def get_id(self, step_name: str) -> int:
+        return self.__name_to_id[step_name]
+
+    def get_step(self, step_name: str) -> WorkflowStepSchema:
+        return self.steps[self.__name_to_id[step_name]]
+
+    def successors(self, step_id: int) -> array:
+        return self.__succ_targets[self.__succ_offsets[step_id]:self.__succ_offsets[step_id + 1]]
+
+    def predecessors(self, step_id: int) -> array:
+        return self.__pred_targets[self.__pred_offsets[step_id]:self.__pred_offsets[step_id + 1]]
+
+    def in_degree(self, step_id: int) -> int:
+        return self.__pred_offsets[step_id + 1] - self.__pred_offsets[step_id]
+
+    def out_degree(self, step_id: int) -> int:
+        return self.__succ_offsets[step_id + 1] - self.__succ_offsets[step_id]
+
+    def roots(self) -> List[int]:
+        return [i for i in range(len(self.steps)) if self.in_degree(i) == 0]
+
+    def topological_order(self) -> Optional[List[int]]:
+        """
+            Returns ids of steps in topological order or None if the graph contains a cycle.
+        """
+        pending = array('i', (self.in_degree(i) for i in range(len(self.steps))))
+        order = self.roots()
+        for step_id in order:
+            for child in self.successors(step_id):
+                pending[child] -= 1
+                if pending[child] == 0:
+                    order.append(child)
+        return order if len(order) == len(self.steps) else None
+
+    def find_cycle(self) -> Optional[List[str]]:
+        """
+            Returns names of steps forming a cycle (first step repeated at the end) or None if the graph is acyclic.
+        """
+        # 0 - not visited, 1 - on the current DFS path, 2 - finished
+        state = bytearray(len(self.steps))
+        for root in range(len(self.steps)):
+            if state[root]:
+                continue
+            path = [root]
+            iterators: List[Iterator[int]] = [iter(self.successors(root))]
+            state[root] = 1
+            while iterators:
+                child = next(iterators[-1], None)
+                if child is None:
+                    state[path.pop()] = 2
+                    iterators.pop()
+                elif state[child] == 1:
+                    cycle = path[path.index(child):] + [child]
+                    return [self.steps[i].stepName for i in cycle]
+                elif state[child] == 0:
+                    state[child] = 1
+                    path.append(child)
+                    iterators.append(iter(self.successors(child)))
+        return None
+
+    def linear_chains(self) -> List[List[int]]:
+        """
+            Returns ids of steps of maximal chains (of at least 2 steps) linked one to one - every step of a chain
+            but the last has the next one as its only successor, which has no other predecessors.
+            Indexed steps and steps with their own maxRetries are not part of any chain.
+        """
+        def can_fuse(step_id: int) -> bool:
+            step = self.steps[step_id]
+            return step.completions is None and step.maxRetries is None
+
+        # Step id -> the next step of its chain
+        next_ids: List[Optional[int]] = [None] * len(self.steps)
+        has_previous = bytearray(len(self.steps))
+        for step_id in range(len(self.steps)):
+            if self.out_degree(step_id) != 1 or not can_fuse(step_id):
+                continue
+            child = self.successors(step_id)[0]
+            if self.in_degree(child) == 1 and can_fuse(child):
+                next_ids[step_id] = child
+                has_previous[child] = 1
+        chains = []
+        for step_id in range(len(self.steps)):
+            if has_previous[step_id] or next_ids[step_id] is None:
+                continue
+            chain = [step_id]
+            while next_ids[chain[-1]] is not None:
+                chain.append(next_ids[chain[-1]])
+            chains.append(chain)
+        return chains
 
     def get_next_to_execute(self, executed_steps: Set[str]) -> Set[WorkflowStepSchema]:
         """
@@ -25,37 +124,29 @@ class Workflow(nx.DiGraph):
                 c) all its predecessors are in @executed_steps
         """
         if not executed_steps:
-            return self.__get_nodes_without_predecessors()
-        to_execute = set()
-        # Iterate over direct descendants of executed steps
-        for child in self.__get_successors([self.__name_to_node[s] for s in executed_steps]):
-            if child.stepName in executed_steps:
-                continue
-            if all([n.stepName in executed_steps for n in self.predecessors(child)]):
-                to_execute.add(child)
-
-        return to_execute
-
-    def __get_nodes_without_predecessors(self) -> Set[WorkflowStepSchema]:
-        return set([step for step in list(self.nodes) if not list(self.predecessors(step))])
-
-    def __get_successors(self, nodes: List[WorkflowStepSchema]) -> Set[WorkflowStepSchema]:
-        """
-            Returns set of successors of nodes in @nodes.
-            A successor is a direct descendant of a node.
-        """
-        return set(itertools.chain(*[list(self.successors(n)) for n in nodes]))
+            return set(self.steps[i] for i in self.roots())
+        executed = set(self.__name_to_id[s] for s in executed_steps)
+        # Direct descendants of executed steps
+        children = set(child for parent in executed for child in self.successors(parent)).difference(executed)
+        return set(self.steps[child] for child in children if all(p in executed for p in self.predecessors(child)))
 
-    def __add_step(self, step: WorkflowStepSchema) -> None:
-        self.add_node(step)
-        self.__name_to_node[step.stepName] = step
+    def __link_steps(self) -> None:
+        n = len(self.steps)
+        parents = [[self.__name_to_id[p] for p in step.dependsOn] for step in self.steps]
 
-    def __add_steps(self, steps: List[WorkflowStepSchema]) -> None:
-        for step in steps:
-            self.__add_step(step)
-        self.__link_steps(steps)
+        self.__pred_offsets = array('i', [0]) * (n + 1)
+        self.__succ_offsets = array('i', [0]) * (n + 1)
+        for step_id, step_parents in enumerate(parents):
+            self.__pred_offsets[step_id + 1] = self.__pred_offsets[step_id] + len(step_parents)
+            for p in step_parents:
+                self.__succ_offsets[p + 1] += 1
+        for i in range(n):
+            self.__succ_offsets[i + 1] += self.__succ_offsets[i]
 
-    def __link_steps(self, steps: List[WorkflowStepSchema]) -> None:
-        for step in steps:
-            for parent in step.dependsOn:
-                self.add_edge(self.__name_to_node[parent], step)
+        self.__pred_targets = array('i', [p for step_parents in parents for p in step_parents])
+        self.__succ_targets = array('i', [0]) * len(self.__pred_targets)
+        fill = array('i', self.__succ_offsets[:n])
+        for step_id, step_parents in enumerate(parents):
+            for p in step_parents:
+                self.__succ_targets[fill[p]] = step_id
+                fill[p] += 1
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from src.config import OperatorConfig
+from src.job.job_template import JobTemplate
+from src.metrics import operator_metrics
+from src.workflow.scheduler import WorkflowScheduler
+from src.workflow.workflow import Workflow
+from src.workflow.workflow_schema import WorkflowStepSchema, WorkflowSchema
+
+"""
+    Process-wide cache of compiled workflow DAGs.
+    Parsing of spec.containers and construction of the graph is done once per (workflow uid, spec generation) pair.
+"""
+
+
+class CompiledWorkflow:
+    def __init__(self, steps: List[WorkflowStepSchema]):
+        self.steps = steps
+        self.name_to_step: Dict[str, WorkflowStepSchema] = {s.stepName: s for s in steps}
+        self.graph: Optional[Workflow] = None
+        self.scheduler: Optional[WorkflowScheduler] = None
+        self.topological_order: List[WorkflowStepSchema] = []
+        self.topological_ids: List[int] = []
+        # Step name -> expected time from start of the step to the end of the workflow, computed on first use
+        self.critical_path: Optional[Dict[str, float]] = None
+        # Step id -> key of the step result, see src.workflow.step_cache, computed on first use
+        self.cache_keys: Optional[List[str]] = None
+        # Step id -> ids of steps of the linear chain containing the step (see Workflow.linear_chains),
+        # computed on first use for workflows fusing chains
+        self.chains: Optional[Dict[int, List[int]]] = None
+        # Template of Job manifests of steps, see src.job.job_template, compiled on first use
+        self.job_template: Optional[JobTemplate] = None
+        self.is_valid = True
+        self.message = ""
+        self.__compile()
+
+    def __compile(self) -> None:
+        try:
+            self.graph = Workflow(WorkflowSchema(steps=self.steps))
+        except (RuntimeError, KeyError) as e:
+            self.is_valid, self.message = False, str(e)
+            return
+        order = self.graph.topological_order()
+        if order is None:
+            self.is_valid = False
+            self.message = f"Workflow contains a cycle: {' -> '.join(self.graph.find_cycle())}!"
+            return
+        self.topological_ids = list(order)
+        self.topological_order = [self.steps[i] for i in order]
+        self.scheduler = WorkflowScheduler(self.graph)
+
+
+class WorkflowCache:
+    """
+        Bounded LRU cache of compiled workflows. There is at most one entry per workflow uid - entry compiled for
+        an outdated spec generation is replaced on first access with the new spec.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.__entries: 'OrderedDict[str, Tuple[str, CompiledWorkflow]]' = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, workflow_body: Dict) -> CompiledWorkflow:
+        key = WorkflowCache.__get_key(workflow_body)
+        spec_version = WorkflowCache.get_spec_version(workflow_body)
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and entry[0] == spec_version:
+                self.hits += 1
+                self.__entries.move_to_end(key)
+                return entry[1]
+            self.misses += 1
+
+        start = time.perf_counter()
+        compiled = CompiledWorkflow([WorkflowStepSchema(**x) for x in workflow_body['spec']['containers']])
+        operator_metrics.dag_compile_seconds.observe(time.perf_counter() - start)
+        with self.__lock:
+            self.__entries[key] = (spec_version, compiled)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+        return compiled
+
+    def invalidate(self, workflow_body: Dict) -> None:
+        with self.__lock:
+            self.__entries.pop(WorkflowCache.__get_key(workflow_body), None)
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self.__lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.__entries)}
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    @staticmethod
+    def get_spec_version(workflow_body: Dict) -> str:
+        """
+            Workflow CRD has status subresource, so metadata.generation changes only with spec.
+            Spec hash is used for objects which don't carry generation.
+        """
+        generation = workflow_body['metadata'].get('generation')
+        if generation is not None:
+            return f"generation-{generation}"
+        return WorkflowCache.get_spec_hash(workflow_body)
+
+    @staticmethod
+    def get_spec_hash(workflow_body: Dict) -> str:
+        spec = json.dumps(workflow_body['spec']['containers'], sort_keys=True, separators=(',', ':'))
+        return hashlib.sha1(spec.encode()).hexdigest()
+
+    @staticmethod
+    def __get_key(workflow_body: Dict) -> str:
+        metadata = workflow_body['metadata']
+        uid = metadata.get('uid')
+        if uid:
+            return uid
+        return f"{metadata.get('namespace')}/{metadata['name']}"
+
+
+workflow_cache = WorkflowCache(OperatorConfig.WORKFLOW_CACHE_SIZE)
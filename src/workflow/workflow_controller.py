@@ -1,99 +1,337 @@
-from datetime import datetime
-from typing import Dict, List, Tuple, Set, Optional
-
-import kubernetes
-import networkx
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Tuple, Set, Optional
 
+from src.api_client import KubernetesApi, kubernetes_api
+from src.config import OperatorConfig
 from src.workflow.constants import WorkflowConstants
+from src.workflow.duration_store import step_duration_store
+from src.workflow.execution_state import StepSet
 from src.workflow.status import WorkflowStatusEnum
-from src.workflow.workflow import Workflow
-from src.workflow.workflow_schema import WorkflowStepSchema, WorkflowSchema
+from src.workflow.step_cache import get_step_cache_keys, step_result_cache
+from src.workflow.workflow_cache import CompiledWorkflow, workflow_cache
+from src.workflow.workflow_index import workflow_index
+from src.workflow.workflow_schema import WorkflowStepSchema
 
 
 class WorkflowController:
-    __WORKFLOW_EXECUTED_STEPS_ANNOTATION__ = "workflow-executed-steps"
-    __WORKFLOW_STARTED_STEPS_ANNOTATION__ = "workflow-started-steps"
-    __STEP_SEPARATOR__ = ';'
-    __EMPTY_EXECUTED_STEPS_STRING__ = ''
+    """
+        Execution state of a workflow is kept in status.execution as bitsets of executed and started steps,
+        see src.workflow.execution_state.StepSet.
+    """
+    __EXECUTION_STATE_FIELD__ = "execution"
+    __EXECUTION_STATE_VERSION__ = 1
+    __EXECUTED_STEPS_FIELD__ = "executed"
+    __STARTED_STEPS_FIELD__ = "started"
+    # step name -> {"attempts": number of retries, "retryAt": timestamp of the last retry}
+    __RETRIES_FIELD__ = "retries"
+    __DEFAULT_BACKOFF__ = 10.0
+    __DEFAULT_MAX_BACKOFF__ = 600.0
+    # Summary of a finished workflow replacing its per-step state, see compact_finished_workflow
+    __SUMMARY_FIELD__ = "summary"
+    # Execution state was kept in ';'-joined annotations by older versions of the operator
+    __LEGACY_EXECUTED_STEPS_ANNOTATION__ = "workflow-executed-steps"
+    __LEGACY_STARTED_STEPS_ANNOTATION__ = "workflow-started-steps"
 
-    STEP_EXECUTED_SELECTOR = f'metadata.annotations.{__WORKFLOW_EXECUTED_STEPS_ANNOTATION__}'
+    STEP_EXECUTED_SELECTOR = f'status.{__EXECUTION_STATE_FIELD__}.{__EXECUTED_STEPS_FIELD__}'
+    STATUS_SELECTOR = 'status.workflow-status'
+    # Setting the annotation to a new value resumes a failed workflow
+    RESUME_SELECTOR = 'metadata.annotations.workflow-resume'
+    api: KubernetesApi = kubernetes_api
 
     @staticmethod
     def validate_workflow_spec(workflow_body: Dict) -> Tuple[bool, str]:
-        try:
-            graph = Workflow(WorkflowSchema(steps=WorkflowController.get_workflow_steps(workflow_body)))
-        except (RuntimeError, KeyError) as e:
-            return False, str(e)
+        compiled = workflow_cache.get(workflow_body)
+        return compiled.is_valid, compiled.message
 
-        if not networkx.is_directed_acyclic_graph(graph):
-            return False, "Workflow contains a cycle!"
-        return True, ""
+    @staticmethod
+    def patch_workflow(patch: Dict, workflow_name: str, namespace: str) -> Dict:
+        """
+            Status is a subresource of workflows - its part of @patch is sent to the status endpoint.
+            metadata.resourceVersion (if given) guards both requests.
+        """
+        workflow = None
+        metadata = patch.get('metadata', {})
+        if 'status' in patch:
+            status_patch = {'status': patch['status']}
+            if 'resourceVersion' in metadata:
+                status_patch['metadata'] = {'resourceVersion': metadata['resourceVersion']}
+            workflow = WorkflowController.api.custom_objects().patch_namespaced_custom_object_status(
+                body=status_patch,
+                name=workflow_name,
+                namespace=namespace,
+                group=WorkflowConstants.GROUP,
+                version=WorkflowConstants.API_VERSION,
+                plural=WorkflowConstants.PLURAL
+            )
+            metadata = dict(metadata, resourceVersion=workflow['metadata']['resourceVersion']) \
+                if 'resourceVersion' in metadata else metadata
+        main_patch = {k: v for k, v in patch.items() if k != 'status'}
+        if set(main_patch) <= {'metadata'} and set(main_patch.get('metadata', {})) <= {'resourceVersion'}:
+            # Nothing but the guard is left for the main resource
+            main_patch = {} if workflow is not None else main_patch
+        if main_patch or workflow is None:
+            if 'metadata' in main_patch:
+                main_patch['metadata'] = metadata
+            workflow = WorkflowController.api.custom_objects().patch_namespaced_custom_object(
+                body=main_patch,
+                name=workflow_name,
+                namespace=namespace,
+                group=WorkflowConstants.GROUP,
+                version=WorkflowConstants.API_VERSION,
+                plural=WorkflowConstants.PLURAL
+            )
+        workflow_index.update(workflow)
+        return workflow
 
     @staticmethod
-    def patch_workflow(patch: Dict, workflow_name: str, namespace: str) -> None:
-        kubernetes.client.CustomObjectsApi().patch_namespaced_custom_object(
-            body=patch,
-            name=workflow_name,
+    def get_workflow(namespace: str, workflow_name: str) -> Dict:
+        workflow = WorkflowController.api.custom_objects().get_namespaced_custom_object(
             namespace=namespace,
             group=WorkflowConstants.GROUP,
             version=WorkflowConstants.API_VERSION,
-            plural=WorkflowConstants.PLURAL
-        )
+            plural=WorkflowConstants.PLURAL,
+            name=workflow_name)
+        workflow_index.update(workflow)
+        return workflow
+
+    @staticmethod
+    def list_workflows() -> Iterator[Dict]:
+        """
+            Lazily lists workflows of all namespaces page by page.
+        """
+        continue_token = None
+        while True:
+            workflows = WorkflowController.api.custom_objects().list_cluster_custom_object(
+                group=WorkflowConstants.GROUP,
+                version=WorkflowConstants.API_VERSION,
+                plural=WorkflowConstants.PLURAL,
+                limit=OperatorConfig.LIST_PAGE_SIZE,
+                _continue=continue_token
+            )
+            yield from workflows['items']
+            continue_token = workflows['metadata'].get('continue')
+            if not continue_token:
+                return
 
     @staticmethod
     def get_workflow_steps(workflow_body: Dict) -> List[WorkflowStepSchema]:
-        return [WorkflowStepSchema(**x) for x in workflow_body['spec']['containers']]
+        return workflow_cache.get(workflow_body).steps
+
+    @staticmethod
+    def forget_workflow(workflow_body: Dict) -> None:
+        workflow_cache.invalidate(workflow_body)
+
+    @staticmethod
+    def has_execution_state(workflow_body: Dict) -> bool:
+        return bool(WorkflowController.__get_execution_state(workflow_body))
+
+    @staticmethod
+    def get_executed_step_set(workflow_body: Dict) -> StepSet:
+        return WorkflowController.__get_step_set(workflow_body, WorkflowController.__EXECUTED_STEPS_FIELD__)
+
+    @staticmethod
+    def get_started_step_set(workflow_body: Dict) -> StepSet:
+        return WorkflowController.__get_step_set(workflow_body, WorkflowController.__STARTED_STEPS_FIELD__)
 
     @staticmethod
     def get_executed_steps(workflow_body: Dict) -> List[str]:
-        executed_value = workflow_body['metadata']['annotations'][
-            WorkflowController.__WORKFLOW_EXECUTED_STEPS_ANNOTATION__]
-        if executed_value == WorkflowController.__EMPTY_EXECUTED_STEPS_STRING__:
-            return []
-        return executed_value.split(WorkflowController.__STEP_SEPARATOR__)
+        steps = WorkflowController.get_workflow_steps(workflow_body)
+        return [steps[i].stepName for i in WorkflowController.get_executed_step_set(workflow_body)]
+
+    @staticmethod
+    def get_step(workflow_body: Dict, step_name: str) -> WorkflowStepSchema:
+        return workflow_cache.get(workflow_body).name_to_step[step_name]
+
+    @staticmethod
+    def has_step(workflow_body: Dict, step_name: str) -> bool:
+        return step_name in workflow_cache.get(workflow_body).name_to_step
+
+    @staticmethod
+    def is_step_executed(workflow_body: Dict, step_name: str) -> bool:
+        step_id = workflow_cache.get(workflow_body).graph.get_id(step_name)
+        return step_id in WorkflowController.get_executed_step_set(workflow_body)
 
     @staticmethod
     def has_finished(workflow_body: Dict) -> bool:
         return len(WorkflowController.get_workflow_steps(workflow_body)) == len(
-            WorkflowController.get_executed_steps(workflow_body))
+            WorkflowController.get_executed_step_set(workflow_body))
 
     @staticmethod
     def add_executed_step(workflow_body: Dict, patch: Dict, step_name: str) -> None:
-        steps = list(set(WorkflowController.get_executed_steps(workflow_body)).union({step_name}))
-        patch.setdefault("metadata", {}).setdefault("annotations", {})[
-            WorkflowController.__WORKFLOW_EXECUTED_STEPS_ANNOTATION__] = WorkflowController.__STEP_SEPARATOR__.join(
-            steps)
+        WorkflowController.add_executed_steps(workflow_body, patch, {step_name})
+
+    @staticmethod
+    def add_executed_steps(workflow_body: Dict, patch: Dict, step_names: Set[str]) -> bool:
+        """
+            Adds @step_names to executed steps of the workflow. Returns False (and leaves @patch intact)
+            if all of them have already been executed.
+        """
+        executed = WorkflowController.get_executed_step_set(workflow_body)
+        new_executed = executed.union(WorkflowController.__to_step_set(workflow_body, step_names))
+        if new_executed == executed:
+            return False
+        WorkflowController.__set_execution_state(patch, WorkflowController.__EXECUTED_STEPS_FIELD__, new_executed)
+        return True
 
     @staticmethod
     def init_executed_steps(workflow_body: Dict) -> None:
-        workflow_body.setdefault("metadata", {}).setdefault("annotations", {})[
-            WorkflowController.__WORKFLOW_EXECUTED_STEPS_ANNOTATION__] \
-            = WorkflowController.__EMPTY_EXECUTED_STEPS_STRING__
-        workflow_body.setdefault("metadata", {}).setdefault("annotations", {})[
-            WorkflowController.__WORKFLOW_STARTED_STEPS_ANNOTATION__] \
-            = WorkflowController.__EMPTY_EXECUTED_STEPS_STRING__
+        WorkflowController.__set_execution_state(workflow_body, WorkflowController.__EXECUTED_STEPS_FIELD__, StepSet())
+        WorkflowController.__set_execution_state(workflow_body, WorkflowController.__STARTED_STEPS_FIELD__, StepSet())
+
+    @staticmethod
+    def carry_over_execution_state(old_spec: Dict, workflow_body: Dict, patch: Dict) -> Set[str]:
+        """
+            Diffs the DAG of @old_spec with the current spec of the workflow. Steps which are unchanged (same image,
+            command, completions and dependencies) and depend only on unchanged steps keep their execution state, state
+            of the other steps is reset in @patch. Started steps of failed workflows are reset, so that they run again.
+            Returns names of steps whose state (and jobs) are kept.
+        """
+        old = CompiledWorkflow([WorkflowStepSchema(**x) for x in old_spec.get('containers', [])])
+        new = workflow_cache.get(workflow_body)
+        unchanged: Set[str] = set()
+        if old.is_valid and new.is_valid:
+            for step in new.topological_order:
+                old_step = old.name_to_step.get(step.stepName)
+                if old_step is not None and old_step.image == step.image and old_step.command == step.command and \
+                        old_step.completions == step.completions and set(old_step.dependsOn) == set(step.dependsOn) \
+                        and all(d in unchanged for d in step.dependsOn):
+                    unchanged.add(step.stepName)
+
+        def kept_steps(step_set: StepSet) -> List[str]:
+            return [old.steps[i].stepName for i in step_set if i < len(old.steps) and old.steps[i].stepName in unchanged]
+
+        executed = kept_steps(WorkflowController.get_executed_step_set(workflow_body))
+        started = kept_steps(WorkflowController.get_started_step_set(workflow_body))
+        if workflow_body.get('status', {}).get('workflow-status') == str(WorkflowStatusEnum.FAILED):
+            executed_names = set(executed)
+            started = [s for s in started if s in executed_names]
+        WorkflowController.__set_execution_state(patch, WorkflowController.__EXECUTED_STEPS_FIELD__,
+                                                 WorkflowController.__to_step_set(workflow_body, executed))
+        WorkflowController.__set_execution_state(patch, WorkflowController.__STARTED_STEPS_FIELD__,
+                                                 WorkflowController.__to_step_set(workflow_body, started))
+        return set(executed) | set(started)
+
+    @staticmethod
+    def reset_unfinished_steps(workflow_body: Dict, patch: Dict) -> Set[str]:
+        """
+            Resets in @patch started state of steps which have not been executed, e.g. to resume a failed workflow.
+            Returns names of executed steps.
+        """
+        executed = WorkflowController.get_executed_step_set(workflow_body)
+        WorkflowController.__set_execution_state(patch, WorkflowController.__STARTED_STEPS_FIELD__, executed)
+        return set(WorkflowController.get_executed_steps(workflow_body))
+
+    @staticmethod
+    def reset_step_retries(patch: Dict) -> None:
+        patch.setdefault('status', {})[WorkflowController.__RETRIES_FIELD__] = None
+
+    @staticmethod
+    def reset_summary(patch: Dict) -> None:
+        patch.setdefault('status', {})[WorkflowController.__SUMMARY_FIELD__] = None
+
+    @staticmethod
+    def compact_finished_workflow(workflow_body: Dict, patch: Dict) -> None:
+        """
+            Replaces per-step state of the finished workflow in @patch with status.summary - numbers of steps,
+            executed steps and retries, run time and (of a failed workflow) steps which were running when it failed.
+            Execution state of a completed workflow is dropped, all its steps have been executed. A failed workflow
+            keeps it, so that it can be resumed (with retry counts reset).
+        """
+        status = WorkflowController.get_status(workflow_body)
+        created = datetime.fromisoformat(workflow_body['metadata']['creationTimestamp'].replace('Z', '+00:00'))
+        summary = {
+            'steps': len(WorkflowController.get_workflow_steps(workflow_body)),
+            'executedSteps': len(WorkflowController.get_executed_step_set(workflow_body)),
+            'retries': sum(r.get('attempts', 0) for r in WorkflowController.get_step_retries(workflow_body).values()),
+            'durationSeconds': round((datetime.now(timezone.utc) - created).total_seconds(), 3)
+        }
+        if status == WorkflowStatusEnum.FAILED:
+            summary['unfinishedSteps'] = WorkflowController.get_running_steps(workflow_body)
+        else:
+            patch.setdefault('status', {})[WorkflowController.__EXECUTION_STATE_FIELD__] = None
+        patch.setdefault('status', {}).update({
+            WorkflowController.__SUMMARY_FIELD__: summary,
+            WorkflowController.__RETRIES_FIELD__: None
+        })
 
     @staticmethod
     def add_to_started_steps(workflow_body: Dict, patch: Dict, new_started: List[str]) -> None:
-        started = set(WorkflowController.__get_already_started_steps(workflow_body)).union(set(new_started))
-        patch.setdefault("metadata", {}).setdefault("annotations", {})[
-            WorkflowController.__WORKFLOW_STARTED_STEPS_ANNOTATION__] = \
-            WorkflowController.__STEP_SEPARATOR__.join(started)
+        WorkflowController.add_started_steps(workflow_body, patch, set(new_started))
+
+    @staticmethod
+    def add_started_steps(workflow_body: Dict, patch: Dict, step_names: Set[str]) -> bool:
+        """
+            Adds @step_names to started steps of the workflow. Returns False (and leaves @patch intact)
+            if all of them have already been started.
+        """
+        started = WorkflowController.get_started_step_set(workflow_body)
+        new_started = started.union(WorkflowController.__to_step_set(workflow_body, step_names))
+        if new_started == started:
+            return False
+        WorkflowController.__set_execution_state(patch, WorkflowController.__STARTED_STEPS_FIELD__, new_started)
+        return True
+
+    @staticmethod
+    def get_running_steps(workflow_body: Dict) -> List[str]:
+        """
+            Returns names of steps which have been started, but have not been executed yet.
+        """
+        steps = WorkflowController.get_workflow_steps(workflow_body)
+        running = StepSet(WorkflowController.get_started_step_set(workflow_body).bits &
+                          ~WorkflowController.get_executed_step_set(workflow_body).bits)
+        return [steps[i].stepName for i in running]
+
+    @staticmethod
+    def get_steps_to_execute(workflow_body: Dict) -> Set[WorkflowStepSchema]:
+        """
+            Returns steps which became ready for execution since the previous call for this version of the workflow
+            (all ready, not started steps on the first call), at a cost proportional to the change only.
+        """
+        return workflow_cache.get(workflow_body).scheduler.sync(
+            WorkflowController.get_executed_step_set(workflow_body), WorkflowController.get_started_step_set(workflow_body))
+
+    @staticmethod
+    def get_ready_steps(workflow_body: Dict) -> Set[WorkflowStepSchema]:
+        """
+            Returns all steps ready for execution which haven't been started.
+        """
+        scheduler = workflow_cache.get(workflow_body).scheduler
+        scheduler.sync(WorkflowController.get_executed_step_set(workflow_body),
+                       WorkflowController.get_started_step_set(workflow_body))
+        return scheduler.get_ready()
 
     @staticmethod
-    def get_steps_to_execute(workflow_body, executed_steps: List[str]) -> Set[WorkflowStepSchema]:
-        steps = Workflow(WorkflowSchema(steps=WorkflowController.get_workflow_steps(workflow_body))) \
-            .get_next_to_execute(set(executed_steps))
-        already_started = WorkflowController.__get_already_started_steps(workflow_body)
-        return set([s for s in steps if s.stepName not in already_started])
+    def migrate_legacy_state(workflow_body: Dict, patch: Dict) -> bool:
+        """
+            Moves execution state kept by older operator versions in ';'-joined annotations into status.
+            Steps which are not in the spec are skipped. Annotations of invalid or failed workflows are only removed.
+            Steps recorded in status already (e.g. results of jobs processed before the migration) are kept.
+            Returns True if the workflow has been migrated.
+        """
+        annotations = workflow_body['metadata'].get('annotations', {})
+        if WorkflowController.__LEGACY_EXECUTED_STEPS_ANNOTATION__ not in annotations:
+            return False
+        compiled = workflow_cache.get(workflow_body)
+        if compiled.is_valid and workflow_body.get('status', {}).get('workflow-status') != str(WorkflowStatusEnum.FAILED):
+            for annotation, field in [
+                (WorkflowController.__LEGACY_EXECUTED_STEPS_ANNOTATION__, WorkflowController.__EXECUTED_STEPS_FIELD__),
+                (WorkflowController.__LEGACY_STARTED_STEPS_ANNOTATION__, WorkflowController.__STARTED_STEPS_FIELD__)
+            ]:
+                steps = [s for s in annotations.get(annotation, '').split(';') if s in compiled.name_to_step]
+                WorkflowController.__set_execution_state(patch, field, WorkflowController.__get_step_set(
+                    workflow_body, field).union(WorkflowController.__to_step_set(workflow_body, steps)))
+        annotations_patch = patch.setdefault('metadata', {}).setdefault('annotations', {})
+        annotations_patch[WorkflowController.__LEGACY_EXECUTED_STEPS_ANNOTATION__] = None
+        annotations_patch[WorkflowController.__LEGACY_STARTED_STEPS_ANNOTATION__] = None
+        return True
 
     @staticmethod
     def update_status(workflow_body: Dict, status: WorkflowStatusEnum, message=Optional[str]) -> None:
-        workflow_body['status'] = {
+        workflow_body.setdefault('status', {}).update({
             'workflow-status': str(status),
             'status-changed': str(datetime.now()),
             'message': str(message)
-        }
+        })
 
     @staticmethod
     def get_status(workflow_body: Dict) -> WorkflowStatusEnum:
@@ -103,14 +341,151 @@ class WorkflowController:
     def get_status_timestamp(workflow_body: Dict):
         return datetime.fromisoformat(workflow_body['status']['status-changed'])
 
+    @staticmethod
+    def get_max_parallelism(workflow_body: Dict) -> Optional[int]:
+        return workflow_body['spec'].get('maxParallelism') or None
+
+    @staticmethod
+    def get_max_retries(workflow_body: Dict, step_name: str) -> int:
+        step = WorkflowController.get_step(workflow_body, step_name)
+        if step.maxRetries is not None:
+            return step.maxRetries
+        return (workflow_body['spec'].get('retryPolicy') or {}).get('maxRetries', 0)
+
+    @staticmethod
+    def get_retry_delay(workflow_body: Dict, attempts: int) -> float:
+        """
+            Returns delay of the retry of a step which has been retried @attempts times already.
+        """
+        policy = workflow_body['spec'].get('retryPolicy') or {}
+        return min(policy.get('backoffSeconds', WorkflowController.__DEFAULT_BACKOFF__) * 2 ** attempts,
+                   policy.get('maxBackoffSeconds', WorkflowController.__DEFAULT_MAX_BACKOFF__))
+
+    @staticmethod
+    def get_step_retries(workflow_body: Dict) -> Dict[str, Dict]:
+        return (workflow_body.get('status') or {}).get(WorkflowController.__RETRIES_FIELD__) or {}
+
+    @staticmethod
+    def get_step_attempts(workflow_body: Dict, step_name: str) -> int:
+        return WorkflowController.get_step_retries(workflow_body).get(step_name, {}).get('attempts', 0)
+
+    @staticmethod
+    def add_step_retry(workflow_body: Dict, patch: Dict, step_name: str, attempts: int, retry_at: float) -> bool:
+        """
+            Records @attempts-th retry of the step, due at @retry_at. Returns False (and leaves @patch intact)
+            if the retry has been recorded already.
+        """
+        if WorkflowController.get_step_attempts(workflow_body, step_name) >= attempts:
+            return False
+        retries = patch.setdefault('status', {}).setdefault(WorkflowController.__RETRIES_FIELD__, {})
+        retries[step_name] = {'attempts': attempts, 'retryAt': retry_at}
+        return True
+
+    @staticmethod
+    def get_step_priorities(workflow_body: Dict) -> Dict[str, float]:
+        """
+            Returns step name -> remaining critical path length of the step, estimated from run times observed
+            before the first call for this version of the workflow. Steps with higher values should start first.
+        """
+        compiled = workflow_cache.get(workflow_body)
+        if compiled.critical_path is None:
+            lengths = step_duration_store.get_critical_path_lengths(
+                workflow_body['metadata']['name'], compiled.graph, compiled.topological_ids)
+            compiled.critical_path = {step.stepName: lengths[i] for i, step in enumerate(compiled.steps)}
+        return compiled.critical_path
+
+    @staticmethod
+    def is_step_cache_enabled(workflow_body: Dict) -> bool:
+        return bool(workflow_body['spec'].get('cacheSteps'))
+
+    @staticmethod
+    def record_step_result(workflow_body: Dict, step_name: str) -> None:
+        step_result_cache.record(WorkflowController.__get_cache_keys(workflow_body)[
+            workflow_cache.get(workflow_body).graph.get_id(step_name)])
+
+    @staticmethod
+    def get_cached_steps(workflow_body: Dict, ready_steps: Iterable[WorkflowStepSchema]) -> List[str]:
+        """
+            Returns names of steps whose results have been recorded: those among @ready_steps, and steps which
+            depend only on executed steps and on such steps (transitively).
+        """
+        compiled = workflow_cache.get(workflow_body)
+        keys = WorkflowController.__get_cache_keys(workflow_body)
+        executed = WorkflowController.get_executed_step_set(workflow_body)
+        graph = compiled.graph
+        cached: Set[int] = set()
+        candidates = [graph.get_id(s.stepName) for s in ready_steps]
+        while candidates:
+            step_id = candidates.pop()
+            if step_id in cached or not step_result_cache.contains(keys[step_id]):
+                continue
+            cached.add(step_id)
+            for child in graph.successors(step_id):
+                if child not in executed and child not in cached and \
+                        all(p in executed or p in cached for p in graph.predecessors(child)):
+                    candidates.append(child)
+        return [compiled.steps[i].stepName for i in cached]
+
+    @staticmethod
+    def is_chain_fusion_enabled(workflow_body: Dict) -> bool:
+        return bool(workflow_body['spec'].get('fuseChains'))
+
+    @staticmethod
+    def get_fused_steps(workflow_body: Dict, step_name: str) -> List[WorkflowStepSchema]:
+        """
+            Returns steps to run in the job of @step_name after it, if the workflow fuses chains - the rest of
+            the linear chain of the step, up to the first step which has been started already.
+        """
+        if not WorkflowController.is_chain_fusion_enabled(workflow_body):
+            return []
+        compiled = workflow_cache.get(workflow_body)
+        if compiled.chains is None:
+            compiled.chains = {step_id: chain for chain in compiled.graph.linear_chains() for step_id in chain}
+        step_id = compiled.graph.get_id(step_name)
+        chain = compiled.chains.get(step_id)
+        if chain is None:
+            return []
+        started = WorkflowController.get_started_step_set(workflow_body)
+        executed = WorkflowController.get_executed_step_set(workflow_body)
+        fused = []
+        for next_id in chain[chain.index(step_id) + 1:]:
+            if next_id in started or next_id in executed:
+                break
+            fused.append(compiled.steps[next_id])
+        return fused
+
     @staticmethod
     def get_max_step_timeout(workflow_body: Dict) -> int:
         return workflow_body['spec']['maxStepTimeout']
 
     @staticmethod
-    def __get_already_started_steps(workflow_body: Dict) -> List[str]:
-        in_progress = workflow_body['metadata']['annotations'][
-            WorkflowController.__WORKFLOW_STARTED_STEPS_ANNOTATION__]
-        if in_progress == WorkflowController.__EMPTY_EXECUTED_STEPS_STRING__:
-            return []
-        return in_progress.split(WorkflowController.__STEP_SEPARATOR__)
+    def __get_cache_keys(workflow_body: Dict) -> List[str]:
+        compiled = workflow_cache.get(workflow_body)
+        if compiled.cache_keys is None:
+            compiled.cache_keys = get_step_cache_keys(workflow_body['metadata'].get('namespace', ''), compiled.graph,
+                                                      compiled.topological_ids)
+        return compiled.cache_keys
+
+    @staticmethod
+    def __get_step_set(workflow_body: Dict, field: str) -> StepSet:
+        state = WorkflowController.__get_execution_state(workflow_body)
+        summary = workflow_body.get('status', {}).get(WorkflowController.__SUMMARY_FIELD__)
+        if not state and summary:
+            # Compacted completed workflow - all steps (of the spec it has been completed for) have been executed
+            return StepSet.from_ids(range(summary['steps']))
+        return StepSet.decode(state.get(field, ''))
+
+    @staticmethod
+    def __get_execution_state(workflow_body: Dict) -> Dict:
+        return (workflow_body.get('status') or {}).get(WorkflowController.__EXECUTION_STATE_FIELD__) or {}
+
+    @staticmethod
+    def __set_execution_state(patch: Dict, field: str, steps: StepSet) -> None:
+        state = patch.setdefault('status', {}).setdefault(WorkflowController.__EXECUTION_STATE_FIELD__, {})
+        state['version'] = WorkflowController.__EXECUTION_STATE_VERSION__
+        state[field] = steps.encode()
+
+    @staticmethod
+    def __to_step_set(workflow_body: Dict, step_names: Iterable[str]) -> StepSet:
+        graph = workflow_cache.get(workflow_body).graph
+        return StepSet.from_ids(graph.get_id(s) for s in step_names)
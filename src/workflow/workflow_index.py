@@ -0,0 +1,74 @@
+import threading
+from typing import Dict, List, Optional, Tuple
+
+"""
+    Local index of Workflow objects kept up to date by the workflows watch.
+"""
+
+
+class WorkflowIndex:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.__workflows: Dict[Tuple[str, str], Dict] = {}
+        self.__lock = threading.Lock()
+
+    def update(self, workflow_body: Dict) -> bool:
+        """
+            Stores @workflow_body unless the index already holds a newer version of the object.
+            Returns True if the index has been updated.
+        """
+        key = WorkflowIndex.__get_key(workflow_body)
+        with self.__lock:
+            current = self.__workflows.get(key)
+            if current is not None and not WorkflowIndex.__is_newer(workflow_body, current):
+                return False
+            self.__workflows[key] = workflow_body
+            return True
+
+    def remove(self, namespace: str, name: str) -> None:
+        with self.__lock:
+            self.__workflows.pop((namespace, name), None)
+
+    def get(self, namespace: str, name: str) -> Optional[Dict]:
+        with self.__lock:
+            workflow = self.__workflows.get((namespace, name))
+            if workflow is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return workflow
+
+    def values(self) -> List[Dict]:
+        with self.__lock:
+            return list(self.__workflows.values())
+
+    def stats(self) -> Dict[str, int]:
+        with self.__lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.__workflows)}
+
+    def __len__(self) -> int:
+        return len(self.__workflows)
+
+    @staticmethod
+    def get_resource_version(workflow_body: Dict) -> Optional[str]:
+        return workflow_body['metadata'].get('resourceVersion')
+
+    @staticmethod
+    def __is_newer(workflow_body: Dict, current: Dict) -> bool:
+        new_version = WorkflowIndex.get_resource_version(workflow_body)
+        current_version = WorkflowIndex.get_resource_version(current)
+        if new_version == current_version:
+            return False
+        # Resource versions are opaque strings, but in practice they are etcd revisions - ignore only
+        # objects which are known to be stale
+        if new_version and current_version and new_version.isdigit() and current_version.isdigit():
+            return int(new_version) > int(current_version)
+        return True
+
+    @staticmethod
+    def __get_key(workflow_body: Dict) -> Tuple[str, str]:
+        return workflow_body['metadata']['namespace'], workflow_body['metadata']['name']
+
+
+workflow_index = WorkflowIndex()
@@ -0,0 +1,51 @@
+from collections import Counter
+from typing import Iterator
+
+from src.workflow.admission_queue import step_admission_queue
+from src.workflow.execution_state import StepSet
+from src.workflow.status import WorkflowStatusEnum
+from src.workflow.workflow_controller import WorkflowController
+from src.workflow.workflow_index import workflow_index
+
+"""
+    Scrape-time metrics of workflows known to the operator, computed from the local workflow index.
+"""
+
+
+class WorkflowStateCollector:
+    __IN_FLIGHT__ = [str(WorkflowStatusEnum.CREATED), str(WorkflowStatusEnum.STARTED)]
+
+    def collect(self) -> Iterator:
+        from prometheus_client.core import GaugeMetricFamily
+
+        workflows, steps = Counter(), Counter()
+        for workflow in workflow_index.values():
+            status = workflow.get('status', {}).get('workflow-status')
+            if status is None:
+                continue
+            workflows[status] += 1
+            if status not in WorkflowStateCollector.__IN_FLIGHT__:
+                continue
+            executed = WorkflowController.get_executed_step_set(workflow)
+            running = len(StepSet(WorkflowController.get_started_step_set(workflow).bits & ~executed.bits))
+            steps['executed'] += len(executed)
+            steps['running'] += running
+            steps['pending'] += len(workflow['spec']['containers']) - len(executed) - running
+
+        workflow_family = GaugeMetricFamily("workflow_operator_workflows", "Workflows by status.", labels=["status"])
+        for status in WorkflowStatusEnum:
+            workflow_family.add_metric([str(status)], workflows[str(status)])
+        yield workflow_family
+        step_family = GaugeMetricFamily("workflow_operator_steps", "Steps of in-flight workflows by state.",
+                                        labels=["state"])
+        for state in ['pending', 'running', 'executed']:
+            step_family.add_metric([state], steps[state])
+        yield step_family
+
+        queued_family = GaugeMetricFamily("workflow_operator_queued_steps", "Steps waiting for admission.",
+                                          labels=["namespace"])
+        for namespace, queued in step_admission_queue.get_queued().items():
+            queued_family.add_metric([namespace], queued)
+        yield queued_family
+        yield GaugeMetricFamily("workflow_operator_admitted_steps", "Steps holding a slot of running steps.",
+                                value=step_admission_queue.running)
@@ -8,12 +8,16 @@ class WorkflowStepSchema(BaseModel):
     image: str
     dependsOn: List[str]
     command: Optional[List[str]]
+    # Overrides spec.retryPolicy.maxRetries for the step
+    maxRetries: Optional[int]
+    # Step run as a single Indexed Job of @completions pods, each given its index in JOB_COMPLETION_INDEX
+    completions: Optional[int]
+    # Pods of an indexed step running at the same time, all of them by default
+    parallelism: Optional[int]
 
     def __hash__(self):
-        if self.command:
-            return hash((self.stepName, self.image, tuple(self.dependsOn), tuple(self.command)))
-        else:
-            return hash((self.stepName, self.image, tuple(self.dependsOn)))
+        # Step names are unique within a workflow, equal steps always share the name
+        return hash(self.stepName)
 
 
 class WorkflowSchema(BaseModel):
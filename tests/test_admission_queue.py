@@ -0,0 +1,251 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import kubernetes
+import pytest
+
+from src.metrics import OperatorMetrics
+from src.workflow import admission_queue
+from src.workflow.admission_queue import StepAdmissionQueue
+from src.workflow.workflow_metrics import WorkflowStateCollector
+
+
+class InlineSubmitter:
+    def submit_async(self, task) -> Future:
+        future = Future()
+        try:
+            future.set_result(task())
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class FakeAggregator:
+    def __init__(self):
+        self.started = []
+
+    def add_started_step(self, namespace, workflow_name, step_name):
+        self.started.append((namespace, workflow_name, step_name))
+
+
+@pytest.fixture
+def aggregator(monkeypatch):
+    aggregator = FakeAggregator()
+    monkeypatch.setattr(admission_queue, "workflow_patch_aggregator", aggregator)
+    return aggregator
+
+
+class Launcher:
+    def __init__(self, result=True):
+        self.launched = []
+        self.job_names = []
+        self.result = result
+
+    def __call__(self, namespace, workflow_name, step_name, job_name):
+        self.launched.append((namespace, workflow_name, step_name))
+        self.job_names.append(job_name)
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+def make_queue(max_running=0, launcher=None, retry_delay=10.0):
+    queue = StepAdmissionQueue(max_running, InlineSubmitter(), retry_delay)
+    launcher = launcher or Launcher()
+    # Launcher is registered, dispatching is driven by the test
+    queue.start(launcher)
+    queue.stop()
+    return queue, launcher
+
+
+def test_namespaces_and_workflows_are_served_round_robin(aggregator):
+    queue, launcher = make_queue(max_running=6)
+    queue.enqueue("ns-a", "wf-1", ["s0", "s1", "s2", "s3"], None)
+    queue.enqueue("ns-a", "wf-2", ["s0", "s1"], None)
+    queue.enqueue("ns-b", "wf-3", ["s0", "s1"], None)
+    assert queue.dispatch() == 6
+    assert launcher.launched == [("ns-a", "wf-1", "s0"), ("ns-b", "wf-3", "s0"),
+                                 ("ns-a", "wf-2", "s0"), ("ns-b", "wf-3", "s1"),
+                                 ("ns-a", "wf-1", "s1"), ("ns-a", "wf-2", "s1")]
+    assert aggregator.started == launcher.launched
+    assert queue.get_queued() == {"ns-a": 2, "ns-b": 0}
+
+
+def test_steps_with_longest_remaining_path_start_first(aggregator):
+    queue, launcher = make_queue(max_running=1)
+    queue.enqueue("default", "wf", ["s0", "s1", "s2"], None, {"s0": 1, "s1": 5, "s2": 3, "s3": 4})
+    queue.dispatch()
+    queue.enqueue("default", "wf", ["s3"], None)
+    for step in ["s1", "s3", "s2"]:
+        queue.release(*launcher.launched[-1])
+        queue.dispatch()
+    assert [s for _, _, s in launcher.launched] == ["s1", "s3", "s2", "s0"]
+
+
+def test_running_steps_are_capped(aggregator):
+    queue, launcher = make_queue(max_running=3)
+    queue.enqueue("default", "wf-1", ["s0", "s1", "s2"], 1)
+    queue.enqueue("default", "wf-2", ["s0", "s1", "s2"], None)
+    assert queue.dispatch() == 3
+    assert [s for s in launcher.launched if s[1] == "wf-1"] == [("default", "wf-1", "s0")]
+    assert queue.running == 3 and queue.dispatch() == 0
+
+    # Slot of wf-2 goes to wf-2, wf-1 is at its maxParallelism
+    queue.release("default", "wf-2", "s0")
+    assert queue.dispatch() == 1 and launcher.launched[-1] == ("default", "wf-2", "s2")
+    queue.release("default", "wf-1", "s0")
+    assert queue.dispatch() == 1 and launcher.launched[-1] == ("default", "wf-1", "s1")
+
+
+def test_queued_and_running_steps_are_not_queued_again(aggregator):
+    queue, launcher = make_queue()
+    assert queue.enqueue("default", "wf", ["s0", "s1"], None) == 2
+    assert queue.dispatch() == 2
+    assert queue.enqueue("default", "wf", ["s0", "s1", "s2"], None) == 1
+    assert queue.enqueue("default", "wf", ["s2"], None) == 0
+
+
+def test_cancel_keeps_running_steps_and_forget_frees_them(aggregator):
+    queue, launcher = make_queue(max_running=2)
+    queue.enqueue("default", "wf-1", ["s0", "s1", "s2"], None)
+    assert queue.dispatch() == 2
+    queue.cancel("default", "wf-1")
+    assert queue.get_queued() == {"default": 0} and queue.running == 2
+    queue.release("default", "wf-1", "s0")
+    assert queue.running == 1 and queue.dispatch() == 0
+
+    queue.enqueue("default", "wf-2", ["s0", "s1"], None)
+    assert queue.dispatch() == 1
+    queue.forget("default", "wf-1")
+    assert not queue.is_tracked("default", "wf-1")
+    assert queue.running == 1 and queue.dispatch() == 1
+    # Release of a forgotten workflow doesn't free slots of others
+    queue.release("default", "wf-1", "s1")
+    assert queue.running == 2
+
+
+def test_restored_running_steps_take_slots(aggregator):
+    queue, launcher = make_queue(max_running=3)
+    queue.restore("default", "wf", ["s0", "s1"], None)
+    queue.restore("default", "wf", ["s1"], None)
+    assert queue.is_tracked("default", "wf") and queue.running == 2
+    assert queue.enqueue("default", "wf", ["s1", "s2", "s3"], None) == 2
+    assert queue.dispatch() == 1 and launcher.launched == [("default", "wf", "s2")]
+
+
+def test_slots_are_released_by_jobs_of_their_admissions(aggregator):
+    queue, launcher = make_queue()
+    queue.enqueue("default", "wf", ["s0", "s1"], 1)
+    assert queue.dispatch() == 1
+    old_job = launcher.job_names[-1]
+    # Workflow runs again (spec update, resume) before DELETED event of the old job of s0 arrives
+    queue.forget("default", "wf")
+    queue.enqueue("default", "wf", ["s0", "s1"], 1)
+    assert queue.dispatch() == 1 and launcher.job_names[-1] != old_job
+    queue.release("default", "wf", "s0", old_job)
+    assert queue.running == 1 and queue.dispatch() == 0
+    queue.release("default", "wf", "s0", launcher.job_names[-1])
+    assert queue.dispatch() == 1 and launcher.launched[-1] == ("default", "wf", "s1")
+
+    # Job of a restored step is not known - any job of the step frees its slot
+    queue.restore("default", "wf-restored", ["s0"], 1)
+    queue.release("default", "wf-restored", "s0", "s0-job")
+    assert queue.running == 1
+
+
+def test_job_creation_calls_of_a_workflow_are_capped(aggregator):
+    class DeferredSubmitter:
+        def __init__(self):
+            self.pending = []
+
+        def submit_async(self, task) -> Future:
+            future = Future()
+            self.pending.append((task, future))
+            return future
+
+        def run_pending(self):
+            pending, self.pending = self.pending, []
+            for task, future in pending:
+                future.set_result(task())
+
+    submitter, launcher = DeferredSubmitter(), Launcher()
+    queue = StepAdmissionQueue(0, submitter, max_launching_per_workflow=2)
+    queue.start(launcher)
+    queue.stop()
+    queue.enqueue("default", "wf-1", ["s0", "s1", "s2", "s3"], None)
+    queue.enqueue("default", "wf-2", ["s0"], None)
+    assert queue.dispatch() == 3 and len(submitter.pending) == 3
+    assert queue.dispatch() == 0
+    submitter.run_pending()
+    assert queue.dispatch() == 2 and queue.running == 5
+
+
+def test_missing_steps_release_their_slots(aggregator):
+    queue, launcher = make_queue(max_running=1, launcher=Launcher(result=False))
+    queue.enqueue("default", "wf", ["s0"], None)
+    assert queue.dispatch() == 1
+    assert queue.running == 0 and aggregator.started == []
+
+
+def test_failed_launch_is_retried(aggregator):
+    launcher = Launcher(result=kubernetes.client.ApiException(status=500))
+    queue, _ = make_queue(max_running=1, launcher=launcher, retry_delay=0.05)
+    queue.enqueue("default", "wf", ["s0"], None)
+    queue.dispatch()
+    assert queue.running == 0 and queue.get_queued() == {"default": 0}
+
+    launcher.result = True
+    queue.start(launcher)
+    try:
+        deadline = time.time() + 5
+        while not aggregator.started and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        queue.stop()
+    assert launcher.launched == [("default", "wf", "s0")] * 2
+    assert aggregator.started == [("default", "wf", "s0")]
+
+
+def test_launch_of_deleted_workflow_is_not_retried(aggregator):
+    launcher = Launcher(result=kubernetes.client.ApiException(status=404))
+    queue, _ = make_queue(launcher=launcher, retry_delay=0)
+    queue.enqueue("default", "wf", ["s0"], None)
+    queue.dispatch()
+    queue.start(launcher)
+    queue.stop()
+    assert queue.get_queued() == {"default": 0} and len(launcher.launched) == 1
+
+
+def test_dispatcher_starts_queued_steps(aggregator):
+    queue = StepAdmissionQueue(2, InlineSubmitter())
+    launched = threading.Semaphore(0)
+
+    def launcher(namespace, workflow_name, step_name, job_name):
+        launched.release()
+        return True
+
+    queue.start(launcher)
+    try:
+        queue.enqueue("default", "wf", ["s0", "s1", "s2"], None)
+        assert launched.acquire(timeout=5) and launched.acquire(timeout=5)
+        queue.release("default", "wf", "s0")
+        assert launched.acquire(timeout=5)
+    finally:
+        queue.stop()
+    assert queue.running == 2 and not queue.has_queued()
+
+
+def test_queue_depth_is_exported(aggregator, monkeypatch):
+    pytest.importorskip("prometheus_client")
+    queue, _ = make_queue(max_running=1)
+    monkeypatch.setattr("src.workflow.workflow_metrics.step_admission_queue", queue)
+    metrics = OperatorMetrics(enabled=True)
+    metrics.register_collector(WorkflowStateCollector())
+    queue.enqueue("ns-a", "wf", ["s0", "s1", "s2"], None)
+    queue.enqueue("ns-b", "wf", ["s0"], None)
+    queue.dispatch()
+    registry = metrics.registry
+    assert registry.get_sample_value("workflow_operator_queued_steps", {"namespace": "ns-a"}) == 2
+    assert registry.get_sample_value("workflow_operator_queued_steps", {"namespace": "ns-b"}) == 1
+    assert registry.get_sample_value("workflow_operator_admitted_steps") == 1
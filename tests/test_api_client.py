@@ -0,0 +1,17 @@
+from src.api_client import KubernetesApi
+
+
+def test_api_objects_are_shared():
+    api = KubernetesApi()
+    assert api.batch() is api.batch()
+    assert api.custom_objects() is api.custom_objects()
+    assert api.coordination() is api.coordination()
+    assert api.batch().api_client is api.custom_objects().api_client is api.coordination().api_client
+
+
+def test_injected_api_objects_are_used():
+    api = KubernetesApi()
+    batch, custom_objects = object(), object()
+    api.configure(custom_objects=custom_objects, batch=batch)
+    assert api.batch() is batch
+    assert api.custom_objects() is custom_objects
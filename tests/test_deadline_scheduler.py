@@ -0,0 +1,52 @@
+import threading
+
+from src.workflow.deadline_scheduler import DeadlineScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_due_deadlines_fire_once():
+    clock = FakeClock()
+    scheduler = DeadlineScheduler(clock)
+    fired = []
+    scheduler.schedule("a", 10, lambda: fired.append("a"))
+    scheduler.schedule("b", 20, lambda: fired.append("b"))
+    assert scheduler.run_due() == 0
+
+    clock.now = 15
+    assert scheduler.run_due() == 1
+    assert fired == ["a"]
+    assert len(scheduler) == 1
+
+
+def test_cancelled_and_replaced_deadlines():
+    clock = FakeClock()
+    scheduler = DeadlineScheduler(clock)
+    fired = []
+    scheduler.schedule("a", 10, lambda: fired.append("a"))
+    scheduler.schedule("b", 10, lambda: fired.append("b"))
+    scheduler.cancel("a")
+    # Step progress moves the deadline
+    scheduler.schedule("b", 30, lambda: fired.append("b"))
+    assert scheduler.get_deadline("b") == 30
+
+    clock.now = 20
+    assert scheduler.run_due() == 0
+    clock.now = 30
+    assert scheduler.run_due() == 1
+    assert fired == ["b"]
+
+
+def test_scheduler_thread_fires_deadline():
+    scheduler = DeadlineScheduler()
+    scheduler.start()
+    fired = threading.Event()
+    scheduler.schedule("a", 0, fired.set)
+    assert fired.wait(5)
+    scheduler.stop()
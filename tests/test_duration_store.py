@@ -0,0 +1,47 @@
+import pytest
+
+from src.workflow.duration_store import StepDurationStore
+from src.workflow.workflow import Workflow
+from src.workflow.workflow_schema import WorkflowSchema, WorkflowStepSchema
+
+steps = [
+    WorkflowStepSchema(stepName="step0", image="a", dependsOn=[]),
+    WorkflowStepSchema(stepName="step1", image="a", dependsOn=["step0"]),
+    WorkflowStepSchema(stepName="step2", image="a", dependsOn=["step0"]),
+    WorkflowStepSchema(stepName="step3", image="a", dependsOn=["step1"]),
+]
+
+
+def test_durations_are_averaged_and_bounded():
+    store = StepDurationStore(max_size=2)
+    store.record("wf", "step0", "a", 10)
+    store.record("wf", "step0", "a", 20)
+    assert store.get("wf", "step0", "a") == pytest.approx(13)
+    assert store.get("wf", "step0", "b") is None
+    store.record("wf", "step1", "a", 1)
+    store.record("wf", "step2", "a", 1)
+    assert len(store) == 2 and store.get("wf", "step0", "a") is None
+
+
+def test_critical_path_lengths():
+    graph = Workflow(WorkflowSchema(steps=steps))
+    store = StepDurationStore(max_size=10)
+    # No history - every step counts as one unit
+    assert store.get_critical_path_lengths("wf", graph, graph.topological_order()) == [3, 2, 1, 1]
+
+    store.record("wf", "step1", "a", 1)
+    store.record("wf", "step2", "a", 10)
+    store.record("wf", "step3", "a", 1)
+    # step0 isn't known and takes the mean of the known steps of the workflow
+    assert store.get_critical_path_lengths("wf", graph, graph.topological_order()) == [14, 2, 10, 1]
+
+
+def test_durations_are_persisted(tmp_path):
+    path = str(tmp_path / "durations.json")
+    store = StepDurationStore(max_size=10, path=path)
+    store.record("wf", "step0", "a", 5)
+    store.save()
+    restored = StepDurationStore(max_size=10, path=path)
+    restored.load()
+    assert restored.get("wf", "step0", "a") == 5
+    StepDurationStore(max_size=10, path=str(tmp_path / "missing.json")).load()
@@ -0,0 +1,137 @@
+from src.workflow.execution_state import StepSet
+from src.workflow.workflow_controller import WorkflowController
+
+
+def make_body(annotations=None, execution=None):
+    return {
+        "metadata": {"name": "wf", "namespace": "default", "uid": "execution-state-wf", "annotations": annotations or {}},
+        "spec": {"containers": [
+            {"stepName": "step0", "image": "", "dependsOn": []},
+            {"stepName": "step1", "image": "", "dependsOn": ["step0"]},
+            {"stepName": "step2", "image": "", "dependsOn": ["step0"]},
+        ]},
+        "status": {"workflow-status": "Started", **({"execution": execution} if execution else {})}
+    }
+
+
+def test_step_set_encoding():
+    steps = StepSet.from_ids([0, 3, 9, 1000])
+    decoded = StepSet.decode(steps.encode())
+    assert decoded == steps
+    assert list(decoded) == [0, 3, 9, 1000]
+    assert len(decoded) == 4
+    assert 9 in decoded and 8 not in decoded
+    assert StepSet().encode() == ''
+    assert len(StepSet.decode('')) == 0
+    # 10k steps fit in less than 2KiB
+    assert len(StepSet.from_ids(range(10_000)).encode()) < 2048
+
+
+def test_executed_and_started_steps():
+    body = make_body()
+    patch = {}
+    WorkflowController.init_executed_steps(patch)
+    body["status"].update(patch["status"])
+    assert WorkflowController.get_steps_to_execute(body) == {WorkflowController.get_workflow_steps(body)[0]}
+
+    patch = {}
+    WorkflowController.add_to_started_steps(body, patch, ["step0"])
+    assert WorkflowController.add_executed_steps(body, patch, {"step0"})
+    body["status"]["execution"].update(patch["status"]["execution"])
+    assert WorkflowController.is_step_executed(body, "step0")
+    assert not WorkflowController.is_step_executed(body, "step1")
+    assert {s.stepName for s in WorkflowController.get_steps_to_execute(body)} == {"step1", "step2"}
+    assert not WorkflowController.add_executed_steps(body, {}, {"step0"})
+    assert not WorkflowController.has_finished(body)
+
+
+def test_legacy_annotations_are_migrated():
+    body = make_body(annotations={"workflow-executed-steps": "step0;step2", "workflow-started-steps": "step0;step2"})
+    patch = {}
+    assert WorkflowController.migrate_legacy_state(body, patch)
+    assert patch["metadata"]["annotations"] == {"workflow-executed-steps": None, "workflow-started-steps": None}
+    body["status"]["execution"] = patch["status"]["execution"]
+    assert sorted(WorkflowController.get_executed_steps(body)) == ["step0", "step2"]
+    assert len(WorkflowController.get_started_step_set(body)) == 2
+
+    assert not WorkflowController.migrate_legacy_state(make_body(execution={"version": 1, "executed": ""}), {})
+
+
+def test_legacy_annotations_are_merged_into_recorded_state():
+    body = make_body(annotations={"workflow-executed-steps": "step0;step1", "workflow-started-steps": "step0;step1"})
+    # Result of a job processed before the migration
+    patch = {}
+    WorkflowController.add_executed_steps(body, patch, {"step2"})
+    body["status"]["execution"] = patch["status"]["execution"]
+    patch = {}
+    assert WorkflowController.migrate_legacy_state(body, patch)
+    body["status"]["execution"] = patch["status"]["execution"]
+    assert sorted(WorkflowController.get_executed_steps(body)) == ["step0", "step1", "step2"]
+    assert len(WorkflowController.get_started_step_set(body)) == 2
+
+
+def test_legacy_steps_missing_from_spec_are_skipped():
+    body = make_body(annotations={"workflow-executed-steps": "step0;removed",
+                                  "workflow-started-steps": "step0;step1;removed"})
+    patch = {}
+    assert WorkflowController.migrate_legacy_state(body, patch)
+    body["status"]["execution"] = patch["status"]["execution"]
+    assert WorkflowController.get_executed_steps(body) == ["step0"]
+    assert len(WorkflowController.get_started_step_set(body)) == 2
+
+
+def test_legacy_annotations_of_invalid_and_failed_workflows_are_dropped():
+    annotations = {"workflow-executed-steps": "step0", "workflow-started-steps": "step0"}
+    invalid = make_body(annotations=annotations)
+    invalid["metadata"]["uid"] = "execution-state-invalid-wf"
+    invalid["spec"]["containers"][0]["dependsOn"] = ["missing"]
+    failed = make_body(annotations=annotations)
+    failed["status"]["workflow-status"] = "Failed"
+    for body in [invalid, failed]:
+        patch = {}
+        assert WorkflowController.migrate_legacy_state(body, patch)
+        assert patch == {"metadata": {"annotations": {"workflow-executed-steps": None, "workflow-started-steps": None}}}
+
+
+def test_execution_state_of_unchanged_steps_is_carried_over():
+    old_spec = make_body()["spec"]
+    body = make_body(execution={"version": 1, "executed": StepSet.from_ids([0, 1]).encode(),
+                                "started": StepSet.from_ids([0, 1, 2]).encode()})
+    body["metadata"]["uid"] = "execution-state-updated-wf"
+    # step1 changes and moves to the end, step3 is new
+    body["spec"]["containers"] = [
+        {"stepName": "step0", "image": "", "dependsOn": []},
+        {"stepName": "step2", "image": "", "dependsOn": ["step0"]},
+        {"stepName": "step3", "image": "", "dependsOn": ["step2"]},
+        {"stepName": "step1", "image": "new", "dependsOn": ["step0"]},
+    ]
+    patch = {}
+    assert WorkflowController.carry_over_execution_state(old_spec, body, patch) == {"step0", "step2"}
+    body["status"]["execution"] = patch["status"]["execution"]
+    assert WorkflowController.get_executed_steps(body) == ["step0"]
+    assert WorkflowController.get_running_steps(body) == ["step2"]
+
+    # Running steps of a failed workflow run again
+    body["status"]["workflow-status"] = "Failed"
+    body["status"]["execution"] = {"version": 1, "executed": StepSet.from_ids([0]).encode(),
+                                   "started": StepSet.from_ids([0, 1, 3]).encode()}
+    patch = {}
+    assert WorkflowController.carry_over_execution_state(body["spec"], body, patch) == {"step0"}
+    body["status"]["execution"] = patch["status"]["execution"]
+    assert WorkflowController.get_running_steps(body) == []
+
+
+def test_step_retries():
+    body = make_body()
+    body["metadata"]["uid"] = "execution-state-retries-wf"
+    body["spec"]["containers"][2]["maxRetries"] = 0
+    body["spec"]["retryPolicy"] = {"maxRetries": 3, "backoffSeconds": 10, "maxBackoffSeconds": 30}
+    assert WorkflowController.get_max_retries(body, "step1") == 3
+    assert WorkflowController.get_max_retries(body, "step2") == 0
+    assert [WorkflowController.get_retry_delay(body, attempts) for attempts in range(3)] == [10, 20, 30]
+
+    patch = {}
+    assert WorkflowController.add_step_retry(body, patch, "step1", 1, 100.0)
+    body["status"].update(patch["status"])
+    assert WorkflowController.get_step_attempts(body, "step1") == 1
+    assert not WorkflowController.add_step_retry(body, {}, "step1", 1, 100.0)
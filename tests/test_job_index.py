@@ -0,0 +1,53 @@
+from src.api_client import KubernetesApi
+from src.job.job_controller import JobController
+from src.job.job_index import JobIndex, job_index
+
+
+def test_unsynced_workflow_is_not_served():
+    index = JobIndex()
+    index.add("default", "wf", "job-0", {"label": "a"})
+    assert index.get_job_names("default", "wf") is None
+
+
+def test_synced_workflow_tracks_watch_events():
+    index = JobIndex()
+    index.add("default", "wf", "job-0", {"label": "a"})
+    index.mark_synced("default", "wf", [("job-1", {"label": "a"})])
+    assert sorted(index.get_job_names("default", "wf")) == ["job-0", "job-1"]
+
+    index.add("default", "wf", "job-2", {"label": "b"})
+    index.remove("default", "wf", "job-0")
+    assert sorted(index.get_job_names("default", "wf")) == ["job-1", "job-2"]
+    assert index.get_job_labels("default", "wf", "job-2") == {"label": "b"}
+    assert index.get_job_names("default", "other-wf") is None
+
+    index.forget("default", "wf")
+    assert index.get_job_names("default", "wf") is None
+
+
+def test_jobs_labeled_already_are_recognized():
+    job_index.mark_synced("default", "wf-labels", [("job-0", {"label": "a", "kopf__workflow__kopf": "wf-labels"})])
+    try:
+        assert JobController.has_labels("default", "wf-labels", "job-0", {"label": "a", "removed": None})
+        assert not JobController.has_labels("default", "wf-labels", "job-0", {"label": "b"})
+        assert not JobController.has_labels("default", "wf-labels", "job-1", {"label": "a"})
+    finally:
+        job_index.forget("default", "wf-labels")
+
+
+def test_jobs_are_deleted_with_their_pods(monkeypatch):
+    calls = []
+
+    class BatchApi:
+        def delete_namespaced_job(self, **kwargs):
+            calls.append(kwargs)
+
+        def delete_collection_namespaced_job(self, **kwargs):
+            calls.append(kwargs)
+
+    api = KubernetesApi()
+    api.configure(batch=BatchApi())
+    monkeypatch.setattr(JobController, "api", api)
+    JobController.delete_job("default", "wf-deleted", "step0-job")
+    JobController.delete_workflow_jobs("default", "wf-deleted", ["step0"])
+    assert len(calls) == 2 and all(c['propagation_policy'] == "Background" for c in calls)
@@ -0,0 +1,25 @@
+from src.job.job_state_tracker import JobStateTracker
+
+
+def job_event(event_type, uid, condition=None):
+    status = {"conditions": [{"type": condition, "status": "True"}]} if condition else {"active": 1}
+    return {"type": event_type, "object": {"metadata": {"uid": uid, "name": uid}, "status": status}}
+
+
+def test_only_terminal_transitions_pass():
+    tracker = JobStateTracker()
+    assert tracker.get_new_terminal_condition(job_event("ADDED", "job-0")) is None
+    assert tracker.get_new_terminal_condition(job_event("MODIFIED", "job-0")) is None
+    assert tracker.get_new_terminal_condition(job_event("MODIFIED", "job-0", "Complete")) == "Complete"
+    # Redelivered terminal event
+    assert tracker.get_new_terminal_condition(job_event("MODIFIED", "job-0", "Complete")) is None
+    assert tracker.get_new_terminal_condition(job_event(None, "job-1", "Failed")) == "Failed"
+    assert tracker.filtered == 3
+    assert len(tracker) == 2
+
+
+def test_deleted_jobs_are_forgotten():
+    tracker = JobStateTracker()
+    tracker.get_new_terminal_condition(job_event("MODIFIED", "job-0", "Complete"))
+    assert tracker.get_new_terminal_condition(job_event("DELETED", "job-0", "Complete")) is None
+    assert len(tracker) == 0
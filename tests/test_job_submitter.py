@@ -0,0 +1,31 @@
+import threading
+import time
+
+from src.job.job_submitter import JobSubmitter
+
+
+def test_partial_failures_are_reported():
+    def fail():
+        raise RuntimeError("API error")
+
+    created, failed = JobSubmitter(4, 2).submit({"step0": lambda: None, "step1": fail, "step2": lambda: None})
+    assert sorted(created) == ["step0", "step2"]
+    assert list(failed) == ["step1"]
+    assert str(failed["step1"]) == "API error"
+
+
+def test_concurrency_is_capped_per_workflow():
+    lock = threading.Lock()
+    in_flight, max_in_flight = [0], [0]
+
+    def create():
+        with lock:
+            in_flight[0] += 1
+            max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+        time.sleep(0.01)
+        with lock:
+            in_flight[0] -= 1
+
+    created, failed = JobSubmitter(8, 3).submit({f"step{i}": create for i in range(20)})
+    assert len(created) == 20 and not failed
+    assert max_in_flight[0] <= 3
@@ -0,0 +1,88 @@
+import json
+
+import kopf
+import kubernetes
+import pytest
+
+from src.config import OperatorConfig
+from src.job.job_builder import BatchJobBuilder
+from src.job.job_controller import JobController
+from src.workflow.constants import WorkflowConstants
+from src.workflow.workflow_cache import workflow_cache
+from src.workflow.workflow_schema import WorkflowStepSchema
+
+
+def make_body(uid, containers, labels=None, **spec):
+    return {
+        "apiVersion": "workflow.example.com/v1", "kind": "Workflow",
+        "metadata": {"uid": uid, "name": uid, "namespace": "default", "generation": 1, "labels": labels},
+        "spec": {"containers": containers, **spec}
+    }
+
+
+def build_job(step, body, job_name):
+    """
+        Job of @step built the way it was before templates - through kubernetes.client models.
+    """
+    builder = BatchJobBuilder(job_name).add_container(job_name, step.image, commands=step.command) \
+        .add_labels({"kopf__workflow__kopf": body["metadata"]["name"],
+                     "kopf__workflow__step__kopf": step.stepName}) \
+        .add_labels(body["metadata"].get("labels") or {})
+    timeout = body["spec"].get("maxStepTimeout", -1)
+    if OperatorConfig.JOB_ACTIVE_DEADLINE and timeout != -1:
+        builder.set_active_deadline(timeout)
+    retries = step.maxRetries if step.maxRetries is not None else \
+        body["spec"].get("retryPolicy", {}).get("maxRetries", 0)
+    if step.completions is not None:
+        builder.set_completions(step.completions, step.parallelism or step.completions)
+    job = builder.build(0 if retries else WorkflowConstants.BACKOFF_LIMIT)
+    kopf.append_owner_reference(job, body)
+    return kubernetes.client.ApiClient().sanitize_for_serialization(job)
+
+
+@pytest.mark.parametrize("uid,step,labels,spec", [
+    ("template-command", {"command": ["sleep", "1"]}, None, {}),
+    ("template-deadline", {}, {"team": "data"}, {"maxStepTimeout": 60}),
+    ("template-step-retries", {"maxRetries": 2}, {"kopf__workflow__step__kopf": "overridden"}, {}),
+    ("template-retries", {}, {}, {"retryPolicy": {"maxRetries": 1}, "maxStepTimeout": 5}),
+    ("template-indexed", {"completions": 100, "parallelism": 10}, None, {}),
+    ("template-indexed-parallel", {"completions": 4}, None, {"maxStepTimeout": 5}),
+])
+def test_template_renders_jobs_equal_to_built_ones(uid, step, labels, spec, monkeypatch):
+    monkeypatch.setattr(OperatorConfig, "JOB_ACTIVE_DEADLINE", True)
+    containers = [{"stepName": "step0", "image": "busybox", "dependsOn": [], **step}]
+    body = make_body(uid, containers, labels, **spec)
+    step = WorkflowStepSchema(**containers[0])
+    job = JobController.create_job(step, uid, body)
+    expected = build_job(step, body, job["metadata"]["name"])
+    assert json.dumps(kubernetes.client.ApiClient().sanitize_for_serialization(job)) == json.dumps(expected)
+
+
+def test_template_is_compiled_once_per_labels():
+    body = make_body("template-labels", [{"stepName": "step0", "image": "busybox", "dependsOn": []}], {"team": "data"})
+    step = WorkflowStepSchema(stepName="step0", image="busybox", dependsOn=[])
+    JobController.create_job(step, "template-labels", body)
+    template = workflow_cache.get(body).job_template
+    JobController.create_job(step, "template-labels", body)
+    assert workflow_cache.get(body).job_template is template
+
+    body["metadata"]["labels"] = {"team": "ml"}
+    job = JobController.create_job(step, "template-labels", body)
+    assert workflow_cache.get(body).job_template is not template
+    assert job["metadata"]["labels"]["team"] == "ml"
+
+
+def test_fused_steps_run_as_init_containers(monkeypatch):
+    monkeypatch.setattr(OperatorConfig, "JOB_ACTIVE_DEADLINE", True)
+    containers = [{"stepName": f"step{i}", "image": f"image{i}", "dependsOn": [f"step{i - 1}"] if i else []}
+                  for i in range(3)]
+    body = make_body("template-fused", containers, None, maxStepTimeout=10)
+    steps = [WorkflowStepSchema(**c) for c in containers]
+    job = JobController.create_job(steps[0], "template-fused", body, steps[1:])
+    pod_spec = job["spec"]["template"]["spec"]
+    assert [(c["name"], c["image"]) for c in pod_spec["initContainers"]] == [("step0", "image0"), ("step1", "image1")]
+    assert [(c["name"], c["image"]) for c in pod_spec["containers"]] == [(job["metadata"]["name"], "image2")]
+    assert job["metadata"]["labels"]["kopf__workflow__step__kopf"] == "step0"
+    assert job["spec"]["activeDeadlineSeconds"] == 30
+    assert [(step, container["image"]) for step, container in JobController.get_job_step_containers(job)] == \
+        [("step0", "image0"), ("step1", "image1"), ("step2", "image2")]
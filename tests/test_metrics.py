@@ -0,0 +1,75 @@
+import kubernetes
+import pytest
+
+from src.metrics import OperatorMetrics
+from src.workflow.workflow_index import workflow_index
+from src.workflow.workflow_metrics import WorkflowStateCollector
+
+prometheus_client = pytest.importorskip("prometheus_client")
+
+
+class FakeApi:
+    def patch_namespaced_custom_object_status(self, group, version, namespace, plural, name, body):
+        return body
+
+    def delete_namespaced_job(self, name, namespace):
+        raise kubernetes.client.ApiException(status=404)
+
+
+def sample(metrics, name, labels=None):
+    return metrics.registry.get_sample_value(name, labels or {})
+
+
+def test_disabled_metrics_leave_functions_unwrapped():
+    metrics = OperatorMetrics(enabled=False)
+
+    def handler():
+        pass
+
+    assert metrics.measure_handler("create")(handler) is handler
+    api = FakeApi()
+    assert metrics.instrument_api(api) is api
+    metrics.ready_steps.observe(3)
+
+
+def test_handler_latency_is_recorded():
+    metrics = OperatorMetrics(enabled=True)
+
+    @metrics.measure_handler("create")
+    def create_workflow(body, **kwargs):
+        return body
+
+    assert create_workflow(body=1) == 1
+    assert create_workflow.__name__ == "create_workflow"
+    assert sample(metrics, "workflow_operator_handler_seconds_count", {"handler": "create"}) == 1
+
+
+def test_api_calls_are_counted_by_verb_and_resource():
+    metrics = OperatorMetrics(enabled=True)
+    api = metrics.instrument_api(FakeApi(), "jobs")
+    api.patch_namespaced_custom_object_status(group="g", version="v1", namespace="default", plural="workflows",
+                                              name="wf", body={})
+    with pytest.raises(kubernetes.client.ApiException):
+        api.delete_namespaced_job(name="job", namespace="default")
+    assert sample(metrics, "workflow_operator_api_requests_total",
+                  {"verb": "patch", "resource": "workflows/status", "code": "200"}) == 1
+    assert sample(metrics, "workflow_operator_api_requests_total",
+                  {"verb": "delete", "resource": "jobs", "code": "404"}) == 1
+
+
+def test_workflows_and_steps_by_state():
+    metrics = OperatorMetrics(enabled=True)
+    metrics.register_collector(WorkflowStateCollector())
+    workflow = {
+        "metadata": {"name": "wf-metrics", "namespace": "default", "uid": "wf-metrics", "resourceVersion": "1"},
+        "spec": {"containers": [{"stepName": f"step{i}", "image": "", "dependsOn": []} for i in range(4)]},
+        # step0 executed, step0 and step1 started
+        "status": {"workflow-status": "Started", "execution": {"version": 1, "executed": "AQ==", "started": "Aw=="}}
+    }
+    workflow_index.update(workflow)
+    try:
+        assert sample(metrics, "workflow_operator_workflows", {"status": "Started"}) >= 1
+        assert sample(metrics, "workflow_operator_steps", {"state": "running"}) >= 1
+        assert sample(metrics, "workflow_operator_steps", {"state": "pending"}) >= 2
+    finally:
+        workflow_index.remove("default", "wf-metrics")
@@ -40,7 +40,7 @@ def test_correct_job_creation_and_labeling():
     jobs = [x.to_dict() for x in jobs]
     assert len(jobs) == 3
     for job in jobs:
-        assert JobController.get_owning_workflow(job)['metadata']['name'] == 'simple-list-workflow'
+        assert job['metadata']['owner_references'][0]['name'] == 'simple-list-workflow'
         assert job['metadata']['labels']['label'] == 'test-label'
 
     steps = set([JobController.get_job_workflow_step_name(job) for job in jobs])
@@ -166,7 +166,7 @@ def test_relabel():
     jobs = [x.to_dict() for x in jobs]
     assert len(jobs) == 3
     for job in jobs:
-        assert JobController.get_owning_workflow(job)['metadata']['name'] == 'simple-list-workflow'
+        assert job['metadata']['owner_references'][0]['name'] == 'simple-list-workflow'
         assert job['metadata']['labels']['label'] == 'test-label2'
         assert job['metadata']['labels']['label2'] == 'test-label2'
 
@@ -193,7 +193,7 @@ def test_spec_update():
     jobs = [x.to_dict() for x in jobs]
     assert len(jobs) == 3
     for job in jobs:
-        assert JobController.get_owning_workflow(job)['metadata']['name'] == 'simple-list-workflow'
+        assert job['metadata']['owner_references'][0]['name'] == 'simple-list-workflow'
         assert job['metadata']['labels']['label'] == 'test-label2'
         assert job['metadata']['labels']['label2'] == 'test-label2'
 
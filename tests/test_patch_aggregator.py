@@ -0,0 +1,130 @@
+import copy
+
+import kubernetes
+import pytest
+import urllib3
+
+from src.api_client import KubernetesApi
+from src.workflow.patch_aggregator import WorkflowPatchAggregator
+from src.workflow.status import WorkflowStatusEnum
+from src.workflow.workflow_controller import WorkflowController
+from src.workflow.workflow_index import workflow_index
+
+
+class FakeCustomObjectsApi:
+    def __init__(self, workflow):
+        self.workflow = workflow
+        self.patches = []
+        self.conflicts_to_raise = 0
+        self.errors_to_raise = []
+
+    def get_namespaced_custom_object(self, namespace, group, version, plural, name):
+        return copy.deepcopy(self.workflow)
+
+    def patch_namespaced_custom_object_status(self, body, name, namespace, group, version, plural):
+        if self.errors_to_raise:
+            raise self.errors_to_raise.pop(0)
+        if self.conflicts_to_raise or body['metadata']['resourceVersion'] != self.workflow['metadata']['resourceVersion']:
+            self.conflicts_to_raise = max(0, self.conflicts_to_raise - 1)
+            raise kubernetes.client.ApiException(status=409)
+        self.patches.append(body)
+        status = body.get('status', {})
+        self.workflow['status'].setdefault('execution', {}).update(status.get('execution', {}))
+        self.workflow['status'].update({k: v for k, v in status.items() if k != 'execution'})
+        self.workflow['metadata']['resourceVersion'] = str(int(self.workflow['metadata']['resourceVersion']) + 1)
+        return copy.deepcopy(self.workflow)
+
+
+@pytest.fixture
+def api():
+    fake = FakeCustomObjectsApi({
+        "metadata": {"name": "wf", "namespace": "default", "resourceVersion": "1", "uid": "wf-uid"},
+        "spec": {"containers": [{"stepName": f"step{i}", "image": "", "dependsOn": []} for i in range(4)]},
+        "status": {"workflow-status": "Started", "execution": {"version": 1, "executed": "AQ==", "started": ""}}
+    })
+    previous = WorkflowController.api
+    WorkflowController.api = KubernetesApi()
+    WorkflowController.api.configure(custom_objects=fake)
+    workflow_index.remove("default", "wf")
+    yield fake
+    WorkflowController.api = previous
+    workflow_index.remove("default", "wf")
+
+
+def executed_steps(fake):
+    return set(WorkflowController.get_executed_steps(fake.workflow))
+
+
+def test_updates_are_coalesced(api):
+    aggregator = WorkflowPatchAggregator(window=60, max_attempts=3)
+    for step in ["step1", "step2", "step3"]:
+        aggregator.add_executed_step("default", "wf", step)
+    aggregator.flush("default", "wf")
+    assert len(api.patches) == 1
+    assert executed_steps(api) == {"step0", "step1", "step2", "step3"}
+    assert not aggregator.has_pending("default", "wf")
+
+
+def test_noop_patches_are_dropped(api):
+    aggregator = WorkflowPatchAggregator(window=60, max_attempts=3)
+    aggregator.add_executed_step("default", "wf", "step0")
+    aggregator.set_status("default", "wf", WorkflowStatusEnum.STARTED)
+    aggregator.flush("default", "wf")
+    assert api.patches == []
+    assert aggregator.dropped == 1
+
+
+def test_failure_is_not_overridden(api):
+    aggregator = WorkflowPatchAggregator(window=60, max_attempts=3)
+    aggregator.set_status("default", "wf", WorkflowStatusEnum.FAILED, "Step step1 has failed.")
+    aggregator.set_status("default", "wf", WorkflowStatusEnum.STARTED)
+    aggregator.flush("default", "wf")
+    assert WorkflowController.get_status(api.workflow) == WorkflowStatusEnum.FAILED
+
+
+def test_conflicts_are_retried_on_fresh_object(api):
+    aggregator = WorkflowPatchAggregator(window=60, max_attempts=3)
+    # Index holds a stale copy of the workflow
+    workflow_index.update(copy.deepcopy(api.workflow))
+    api.workflow['status']['execution']['executed'] = "Aw=="
+    api.workflow['metadata']['resourceVersion'] = "2"
+
+    aggregator.add_executed_step("default", "wf", "step2")
+    aggregator.flush("default", "wf")
+    assert aggregator.conflicts == 1
+    assert executed_steps(api) == {"step0", "step1", "step2"}
+
+
+def test_transient_errors_are_retried_with_bounded_attempts(api):
+    aggregator = WorkflowPatchAggregator(window=60, max_attempts=3)
+    api.errors_to_raise = [kubernetes.client.ApiException(status=503), urllib3.exceptions.ProtocolError("reset")]
+    aggregator.add_executed_step("default", "wf", "step1")
+    aggregator.flush("default", "wf")
+    aggregator.flush("default", "wf")
+    assert api.patches == [] and aggregator.has_pending("default", "wf")
+    aggregator.flush("default", "wf")
+    assert executed_steps(api) == {"step0", "step1"}
+
+    api.conflicts_to_raise = 9
+    aggregator.add_executed_step("default", "wf", "step2")
+    for _ in range(3):
+        aggregator.flush("default", "wf")
+    assert aggregator.failed == 1 and not aggregator.has_pending("default", "wf")
+
+
+def test_permanent_errors_are_dropped(api):
+    aggregator = WorkflowPatchAggregator(window=60, max_attempts=3)
+    api.errors_to_raise = [kubernetes.client.ApiException(status=422)]
+    aggregator.add_executed_step("default", "wf", "step1")
+    aggregator.flush("default", "wf")
+    assert aggregator.failed == 1 and not aggregator.has_pending("default", "wf")
+    assert api.patches == []
+
+
+def test_pending_patches_are_sent_on_stop(api):
+    aggregator = WorkflowPatchAggregator(window=60, max_attempts=3)
+    aggregator.start()
+    aggregator.add_executed_step("default", "wf", "step3")
+    aggregator.stop()
+    assert executed_steps(api) == {"step0", "step3"}
+    assert not aggregator.has_pending("default", "wf")
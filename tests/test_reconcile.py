@@ -0,0 +1,451 @@
+import json
+import logging
+import time
+
+import kopf
+import kubernetes
+import pytest
+
+import workflow_operator
+from benchmarks.bench_reconcile import ReconcileHarness, compare, run_case
+from benchmarks.dags import SHAPES
+from benchmarks.fake_api import JOBS, LEASES, WORKFLOWS, FakeApiServer, FakeCluster, matches_selector, merge_patch
+from src.api_client import kubernetes_api
+from src.config import OperatorConfig
+from src.job.job_state_tracker import job_state_tracker
+from src.sharding import shard_membership
+from src.workflow.deadline_scheduler import deadline_scheduler
+from src.workflow.execution_state import StepSet
+from src.workflow.patch_aggregator import workflow_patch_aggregator
+from src.workflow.status import WorkflowStatusEnum
+from src.workflow.workflow_controller import WorkflowController
+from src.workflow.workflow_index import workflow_index
+
+
+@pytest.fixture(autouse=True)
+def inline_patches():
+    window = workflow_patch_aggregator.window
+    workflow_patch_aggregator.window = 0
+    yield
+    workflow_patch_aggregator.window = window
+    kubernetes_api.configure()
+
+
+def test_merge_patch_removes_nulls_and_keeps_target():
+    target = {"a": {"b": 1, "c": 2}, "d": 3}
+    assert merge_patch(target, {"a": {"b": None, "e": 4}, "d": None}) == {"a": {"c": 2, "e": 4}}
+    assert target == {"a": {"b": 1, "c": 2}, "d": 3}
+
+
+def test_label_selectors():
+    labels = {"workflow": "wf", "shard": "1"}
+    assert matches_selector(labels, "workflow=wf,shard in (1,2)")
+    assert not matches_selector(labels, "workflow!=wf")
+    assert matches_selector(labels, "!owner,shard")
+
+
+@pytest.mark.parametrize("shape", list(SHAPES))
+def test_workflow_runs_to_completion(shape):
+    result = run_case(shape, 30, churn=1, run_id=0)
+    assert result["api_calls_per_step"] < 5
+
+
+@pytest.mark.parametrize("client", ["pooled", "per-call"])
+def test_workflows_run_over_http(client):
+    result = run_case("diamond_lattice", 20, churn=0, run_id=0, workflows=3, client=client)
+    assert result["api_calls_per_step"] < 5
+
+
+def test_every_step_is_started_once():
+    harness = ReconcileHarness()
+    harness.add_workflow("wf-a", SHAPES["diamond_lattice"](40))
+    harness.add_workflow("wf-b", SHAPES["chain"](5))
+    harness.run()
+    steps = [(j['metadata']['labels']['kopf__workflow__kopf'], j['metadata']['labels']['kopf__workflow__step__kopf'])
+             for j in harness.cluster.objects[JOBS].values()]
+    assert len(steps) == len(set(steps)) == 45
+    assert all(w['status']['workflow-status'] == "Completed" for w in harness.cluster.objects[WORKFLOWS].values())
+    assert len(harness.latencies) == 45
+
+
+def test_regressions_are_reported():
+    baseline = {"chain/10": {"events_per_sec": 1000, "api_calls_per_step": 3}}
+    assert compare({"chain/10": {"events_per_sec": 900, "api_calls_per_step": 3}}, baseline, 0.2) == []
+    assert len(compare({"chain/10": {"events_per_sec": 700, "api_calls_per_step": 4}}, baseline, 0.2)) == 2
+
+
+def test_pod_churn_is_filtered():
+    filtered = job_state_tracker.filtered
+    harness = ReconcileHarness(churn=3)
+    harness.add_workflow("wf-churn", SHAPES["chain"](5))
+    harness.run()
+    # ADDED and 3 non terminal updates of every job
+    assert job_state_tracker.filtered - filtered == 5 * 4
+    assert harness.cluster.objects[WORKFLOWS][("default", "wf-churn")]['status']['workflow-status'] == "Completed"
+    # Terminal event redelivered after restart of the operator is recognized from the workflow
+    assert workflow_operator.is_job_result_recorded("default", "wf-churn", "step0", "Complete")
+
+
+def test_spec_update_reruns_changed_steps_only():
+    harness = ReconcileHarness()
+    containers = SHAPES["chain"](10)
+    harness.add_workflow("wf-update", containers)
+    harness.run()
+    jobs = {j['metadata']['labels']['kopf__workflow__step__kopf']: j['metadata']['uid']
+            for j in harness.cluster.objects[JOBS].values()}
+
+    # step5 changes, step10 is added after it
+    updated = containers[:5] + [dict(containers[5], image="alpine")] + containers[6:] + [
+        dict(containers[9], stepName="step10", dependsOn=["step9"])]
+    harness.update_workflow("wf-update", updated)
+    harness.run()
+    rerun = {j['metadata']['labels']['kopf__workflow__step__kopf']: j['metadata']['uid']
+             for j in harness.cluster.objects[JOBS].values()}
+    assert sorted(rerun) == sorted(f"step{i}" for i in range(11))
+    assert [s for s in sorted(rerun) if rerun[s] == jobs.get(s)] == [f"step{i}" for i in range(5)]
+    assert harness.cluster.calls['deletecollection', JOBS] == 1 and harness.cluster.calls['delete', JOBS] == 0
+    assert harness.cluster.objects[WORKFLOWS][("default", "wf-update")]['status']['workflow-status'] == "Completed"
+
+
+def test_indexed_step_runs_as_single_job():
+    harness = ReconcileHarness()
+    containers = SHAPES["chain"](3)
+    containers[1] = dict(containers[1], completions=1000, parallelism=50)
+    harness.add_workflow("wf-indexed", containers)
+    harness.run()
+    jobs = {j['metadata']['labels']['kopf__workflow__step__kopf']: j['spec']
+            for j in harness.cluster.objects[JOBS].values()}
+    assert len(jobs) == 3
+    assert jobs["step1"]['completionMode'] == "Indexed"
+    assert (jobs["step1"]['completions'], jobs["step1"]['parallelism']) == (1000, 50)
+    assert 'completionMode' not in jobs["step0"]
+    assert harness.cluster.objects[WORKFLOWS][("default", "wf-indexed")]['status']['workflow-status'] == "Completed"
+
+    # Changed number of indexes reruns the step
+    harness.update_workflow("wf-indexed", containers[:1] + [dict(containers[1], completions=2000)] + containers[2:])
+    harness.run()
+    assert sorted(j['spec'].get('completions') for j in harness.cluster.objects[JOBS].values()
+                  if j['metadata']['labels']['kopf__workflow__step__kopf'] == "step1") == [2000]
+
+
+def test_chains_are_fused_into_single_jobs():
+    harness = ReconcileHarness()
+    # Chains step0..step2 and step5..step9 around a fan-out
+    containers = SHAPES["chain"](10)
+    containers[3] = dict(containers[3], dependsOn=["step2"])
+    containers[4] = dict(containers[4], dependsOn=["step2"])
+    containers[5] = dict(containers[5], dependsOn=["step3", "step4"])
+    harness.add_workflow("wf-fused", containers, fuseChains=True, retryPolicy={"maxRetries": 1, "backoffSeconds": 0})
+    harness.failures[("wf-fused", "step5")] = 1
+    harness.run()
+    jobs = {j['metadata']['labels']['kopf__workflow__step__kopf']: j for j in harness.cluster.objects[JOBS].values()}
+    assert sorted(jobs) == ["step0", "step3", "step4", "step5"]
+    assert len(jobs["step5"]['spec']['template']['spec']['initContainers']) == 4
+    workflow = harness.cluster.objects[WORKFLOWS][("default", "wf-fused")]
+    assert workflow['status']['workflow-status'] == "Completed"
+    assert workflow['status']['retries']['step5']['attempts'] == 1
+    assert len(WorkflowController.get_executed_steps(workflow)) == 10
+
+
+def test_spec_update_without_step_changes_keeps_workflow_completed():
+    harness = ReconcileHarness()
+    harness.add_workflow("wf-timeout", SHAPES["chain"](3))
+    harness.run()
+    harness.cluster.patch(WORKFLOWS, "default", "wf-timeout", {'spec': {'maxStepTimeout': 100}})
+    harness.run()
+    assert len(harness.cluster.objects[JOBS]) == 3
+    workflow = harness.cluster.objects[WORKFLOWS][("default", "wf-timeout")]
+    assert workflow['status']['workflow-status'] == "Completed"
+    assert workflow['status']['message'] == "All steps have been executed already"
+
+
+@pytest.fixture
+def retention(monkeypatch):
+    monkeypatch.setattr(OperatorConfig, "JOB_TTL_AFTER_FINISHED", 600)
+    monkeypatch.setattr(OperatorConfig, "COMPACT_FINISHED_WORKFLOWS", True)
+
+
+def test_completed_workflow_is_compacted(retention):
+    harness = ReconcileHarness()
+    containers = SHAPES["chain"](5)
+    harness.add_workflow("wf-compact", containers, retryPolicy={"maxRetries": 1, "backoffSeconds": 0})
+    harness.failures[("wf-compact", "step2")] = 1
+    harness.run()
+    workflow = harness.cluster.objects[WORKFLOWS][("default", "wf-compact")]
+    assert workflow['status']['workflow-status'] == "Completed"
+    assert 'execution' not in workflow['status'] and 'retries' not in workflow['status']
+    summary = workflow['status']['summary']
+    assert (summary['steps'], summary['executedSteps'], summary['retries']) == (5, 5, 1)
+    assert all(j['spec']['ttlSecondsAfterFinished'] == 600 for j in harness.cluster.objects[JOBS].values())
+
+    # Only the added step runs after update of the compacted workflow
+    harness.update_workflow("wf-compact", containers + [dict(containers[4], stepName="step5", dependsOn=["step4"])])
+    harness.run()
+    workflow = harness.cluster.objects[WORKFLOWS][("default", "wf-compact")]
+    assert workflow['status']['workflow-status'] == "Completed"
+    assert sorted(j['metadata']['labels']['kopf__workflow__step__kopf']
+                  for j in harness.cluster.objects[JOBS].values()) == [f"step{i}" for i in range(6)]
+    assert workflow['status']['summary']['steps'] == 6
+
+
+def test_failed_workflow_is_compacted_and_resumed(retention):
+    harness = ReconcileHarness()
+    harness.add_workflow("wf-compact-failed", SHAPES["chain"](3))
+    harness.failures[("wf-compact-failed", "step1")] = 1
+    harness.run()
+    workflow = harness.cluster.objects[WORKFLOWS][("default", "wf-compact-failed")]
+    assert workflow['status']['workflow-status'] == "Failed"
+    assert workflow['status']['summary']['unfinishedSteps'] == ["step1"]
+    assert WorkflowController.get_executed_steps(workflow) == ["step0"]
+
+    harness.cluster.patch(WORKFLOWS, "default", "wf-compact-failed",
+                          {'metadata': {'annotations': {'workflow-resume': "1"}}})
+    harness.run()
+    workflow = harness.cluster.objects[WORKFLOWS][("default", "wf-compact-failed")]
+    assert workflow['status']['workflow-status'] == "Completed"
+    assert workflow['status']['summary']['executedSteps'] == 3
+
+
+def test_failed_steps_are_retried():
+    harness = ReconcileHarness()
+    harness.add_workflow("wf-retry", SHAPES["chain"](3), retryPolicy={"maxRetries": 2, "backoffSeconds": 0})
+    harness.failures[("wf-retry", "step1")] = 2
+    harness.run()
+    workflow = harness.cluster.objects[WORKFLOWS][("default", "wf-retry")]
+    assert workflow['status']['workflow-status'] == "Completed"
+    assert workflow['status']['retries']['step1']['attempts'] == 2
+    # Failed jobs are replaced
+    jobs = list(harness.cluster.objects[JOBS].values())
+    assert len(jobs) == 3 and all(j['spec']['backoffLimit'] == 0 for j in jobs)
+
+
+def test_failed_workflow_is_resumed_from_failed_step():
+    harness = ReconcileHarness()
+    harness.add_workflow("wf-resume", SHAPES["chain"](3), retryPolicy={"maxRetries": 1, "backoffSeconds": 0})
+    harness.failures[("wf-resume", "step1")] = 2
+    harness.run()
+    assert harness.cluster.objects[WORKFLOWS][("default", "wf-resume")]['status']['workflow-status'] == "Failed"
+    step0_jobs = [j['metadata']['uid'] for j in harness.cluster.objects[JOBS].values()
+                  if j['metadata']['labels']['kopf__workflow__step__kopf'] == "step0"]
+
+    harness.cluster.patch(WORKFLOWS, "default", "wf-resume", {'metadata': {'annotations': {'workflow-resume': "1"}}})
+    harness.run()
+    workflow = harness.cluster.objects[WORKFLOWS][("default", "wf-resume")]
+    assert workflow['status']['workflow-status'] == "Completed" and 'retries' not in workflow['status']
+    steps = {j['metadata']['labels']['kopf__workflow__step__kopf']: j['metadata']['uid']
+             for j in harness.cluster.objects[JOBS].values()}
+    assert sorted(steps) == ["step0", "step1", "step2"] and [steps["step0"]] == step0_jobs
+
+
+def timeout_workflow(name):
+    body = {'metadata': {'name': name, 'namespace': "default", 'uid': name, 'generation': 1, 'resourceVersion': "1"},
+            'spec': {'containers': SHAPES["chain"](3), 'maxStepTimeout': 60}}
+    workflow_index.update(body)
+    return body
+
+
+def test_progress_keeps_workflow_timeout_of_retried_steps():
+    body = timeout_workflow("wf-backoff")
+    retry_at = time.time() + 80
+    try:
+        workflow_operator.schedule_step_retry("default", "wf-backoff", "step1", retry_at)
+        assert deadline_scheduler.get_deadline(("default", "wf-backoff")) == retry_at + 60
+        # Another branch makes progress during the backoff
+        workflow_operator.watch_workflow_timeout(body, "wf-backoff", "default")
+        assert deadline_scheduler.get_deadline(("default", "wf-backoff")) == retry_at + 60
+        workflow_operator.watch_workflow_timeout(body, "wf-backoff", "default", since=retry_at + 10)
+        assert deadline_scheduler.get_deadline(("default", "wf-backoff")) == retry_at + 70
+    finally:
+        deadline_scheduler.cancel(("default", "wf-backoff", "step1"))
+        workflow_operator.cancel_workflow_timeout("wf-backoff", "default")
+        workflow_index.remove("default", "wf-backoff")
+
+
+def test_progress_keeps_workflow_timeout_of_fused_chains():
+    harness = ReconcileHarness()
+    harness.add_workflow("wf-fused-timeout", SHAPES["chain"](3), maxStepTimeout=60, fuseChains=True)
+    body = harness.cluster.objects[WORKFLOWS][("default", "wf-fused-timeout")]
+    step = WorkflowController.get_step(body, "step0")
+    try:
+        workflow_operator.start_workflow_step(step, "wf-fused-timeout", "default", body, "step0-job")
+        # Chain of 3 steps is given the timeout of every step
+        deadline = deadline_scheduler.get_deadline(("default", "wf-fused-timeout"))
+        assert deadline > time.time() + 170
+        # Step of a parallel branch is executed
+        workflow_operator.watch_workflow_timeout(body, "wf-fused-timeout", "default")
+        assert deadline_scheduler.get_deadline(("default", "wf-fused-timeout")) == deadline
+    finally:
+        workflow_operator.cancel_workflow_timeout("wf-fused-timeout", "default")
+
+
+@pytest.fixture
+def sharding():
+    enabled, identity = shard_membership.enabled, shard_membership.identity
+    shard_membership.enabled, shard_membership.identity = True, "replica-0"
+    yield shard_membership
+    shard_membership.enabled, shard_membership.identity = enabled, identity
+    shard_membership.set_members([])
+
+
+def test_workflows_of_lost_replica_are_taken_over(sharding):
+    harness = ReconcileHarness()
+    sharding.set_members(["replica-0", "replica-1"])
+    names = [f"wf-shard-{i}" for i in range(10)]
+    owned = [name for name in names if sharding.owns("default", name)]
+    assert 0 < len(owned) < len(names)
+    for name in names:
+        harness.add_workflow(name, SHAPES["chain"](3))
+    harness.run()
+    statuses = {name: harness.cluster.objects[WORKFLOWS][("default", name)].get('status', {}).get('workflow-status')
+                for name in names}
+    assert {name for name, status in statuses.items() if status == "Completed"} == set(owned)
+    assert len(harness.cluster.objects[JOBS]) == 3 * len(owned)
+
+    # replica-1 leaves the group without having handled its workflows
+    previous = sharding.get_ring()
+    sharding.set_members(["replica-0"])
+    workflow_operator.rebalance_workflows(previous)
+    harness.run()
+    assert all(w['status']['workflow-status'] == "Completed" for w in harness.cluster.objects[WORKFLOWS].values())
+    assert len(harness.cluster.objects[JOBS]) == 3 * len(names)
+
+
+def test_warm_start_records_jobs_finished_while_operator_was_down():
+    harness = ReconcileHarness()
+    harness.add_workflow("wf-warm", SHAPES["chain"](4), maxParallelism=1)
+    patch = {'status': {'execution': {'version': 1, 'executed': StepSet.from_ids([0]).encode(),
+                                      'started': StepSet.from_ids([0, 1]).encode()}}}
+    WorkflowController.update_status(patch, WorkflowStatusEnum.STARTED)
+    harness.cluster.patch(WORKFLOWS, "default", "wf-warm", patch, subresource='status')
+    # Job of step1 has completed while the operator was down
+    harness.cluster.create(JOBS, {
+        'metadata': {'name': "step1-job", 'namespace': "default",
+                     'labels': {'kopf__workflow__kopf': "wf-warm", 'kopf__workflow__step__kopf': "step1"}},
+        'spec': {'template': {'spec': {'containers': [{'name': "step1", 'image': "busybox"}]}}},
+        'status': {'conditions': [{'type': "Complete", 'status': "True"}], 'succeeded': 1}
+    })
+
+    workflow_operator.warm_start(harness.logger)
+    assert harness.cluster.calls == {('list', WORKFLOWS): 1, ('list', JOBS): 1, ('patch', WORKFLOWS + '/status'): 1}
+    workflow = harness.cluster.objects[WORKFLOWS][("default", "wf-warm")]
+    assert WorkflowController.get_executed_steps(workflow) == ["step0", "step1"]
+
+    harness.run()
+    workflow = harness.cluster.objects[WORKFLOWS][("default", "wf-warm")]
+    assert workflow['status']['workflow-status'] == "Completed"
+    steps = sorted(j['metadata']['labels']['kopf__workflow__step__kopf']
+                   for j in harness.cluster.objects[JOBS].values())
+    assert steps == ["step1", "step2", "step3"]
+
+
+def test_warm_start_migrates_legacy_state_before_recording_jobs():
+    harness = ReconcileHarness()
+    harness.add_workflow("wf-legacy", SHAPES["chain"](4))
+    patch = {'metadata': {'annotations': {'workflow-executed-steps': "step0", 'workflow-started-steps': "step0;step1"}}}
+    harness.cluster.patch(WORKFLOWS, "default", "wf-legacy", patch)
+    patch = {}
+    WorkflowController.update_status(patch, WorkflowStatusEnum.STARTED)
+    harness.cluster.patch(WORKFLOWS, "default", "wf-legacy", patch, subresource='status')
+    harness.cluster.create(JOBS, {
+        'metadata': {'name': "step1-job", 'namespace': "default",
+                     'labels': {'kopf__workflow__kopf': "wf-legacy", 'kopf__workflow__step__kopf': "step1"}},
+        'spec': {'template': {'spec': {'containers': [{'name': "step1", 'image': "busybox"}]}}},
+        'status': {'conditions': [{'type': "Complete", 'status': "True"}], 'succeeded': 1}
+    })
+
+    workflow_operator.warm_start(harness.logger)
+    workflow = harness.cluster.objects[WORKFLOWS][("default", "wf-legacy")]
+    assert WorkflowController.get_executed_steps(workflow) == ["step0", "step1"]
+    assert 'workflow-executed-steps' not in workflow['metadata'].get('annotations', {})
+
+    harness.run()
+    workflow = harness.cluster.objects[WORKFLOWS][("default", "wf-legacy")]
+    assert workflow['status']['workflow-status'] == "Completed"
+    steps = sorted(j['metadata']['labels']['kopf__workflow__step__kopf']
+                   for j in harness.cluster.objects[JOBS].values())
+    assert steps == ["step1", "step2", "step3"]
+
+
+@pytest.fixture
+def kube_config(tmp_path, monkeypatch):
+    """
+        Cluster served over HTTP and a kubeconfig pointing to it - the operator is not given any clients.
+    """
+    cluster = FakeCluster()
+    server = FakeApiServer(cluster)
+    server.start()
+    config_file = tmp_path / "kubeconfig"
+    config_file.write_text(json.dumps({
+        'apiVersion': "v1", 'kind': "Config", 'current-context': "fake",
+        'clusters': [{'name': "fake", 'cluster': {'server': server.host}}],
+        'users': [{'name': "fake", 'user': {'token': "fake"}}],
+        'contexts': [{'name': "fake", 'context': {'cluster': "fake", 'user': "fake"}}]
+    }))
+    monkeypatch.delenv("KUBERNETES_SERVICE_HOST", raising=False)
+    monkeypatch.setattr(kubernetes.config.kube_config, "KUBE_CONFIG_DEFAULT_LOCATION", str(config_file))
+    default_configuration = kubernetes.client.Configuration.get_default_copy()
+    kubernetes_api.configure()
+    yield cluster
+    kubernetes.client.Configuration.set_default(default_configuration)
+    server.stop()
+
+
+def test_warm_start_runs_before_login_of_kopf(kube_config, monkeypatch):
+    monkeypatch.setattr(OperatorConfig, "WARM_START", True)
+    kube_config.create(WORKFLOWS, {
+        'apiVersion': "workflow.example.com/v1", 'kind': "Workflow",
+        'metadata': {'name': "wf-startup", 'namespace': "default"},
+        'spec': {'containers': SHAPES["chain"](2)}
+    })
+    logger = logging.getLogger("test_reconcile")
+    workflow_operator.configure(settings=kopf.OperatorSettings(), logger=logger)
+    try:
+        assert kube_config.calls['list', WORKFLOWS] == 1 and kube_config.calls['list', JOBS] == 1
+        assert workflow_index.get("default", "wf-startup") is not None
+    finally:
+        workflow_operator.cleanup(logger=logger)
+
+
+def test_replica_joins_shard_group_before_login_of_kopf(kube_config, sharding, monkeypatch):
+    monkeypatch.setattr(OperatorConfig, "WARM_START", False)
+    logger = logging.getLogger("test_reconcile")
+    workflow_operator.configure(settings=kopf.OperatorSettings(), logger=logger)
+    try:
+        lease = kube_config.objects[LEASES][(sharding.namespace, sharding.lease_name)]
+        assert lease['spec']['holderIdentity'] == "replica-0"
+        assert sharding.owns("default", "wf-startup")
+    finally:
+        workflow_operator.cleanup(logger=logger)
+    assert (sharding.namespace, sharding.lease_name) not in kube_config.objects[LEASES]
+
+
+def test_labels_are_propagated_to_jobs():
+    harness = ReconcileHarness()
+    harness.add_workflow("wf-labels", SHAPES["fan_out"](20))
+    harness.run()
+    jobs = harness.cluster.objects[JOBS]
+
+    harness.cluster.patch(WORKFLOWS, "default", "wf-labels", {'metadata': {'labels': {'benchmark': None, 'team': "a"}}})
+    harness.run()
+    assert harness.cluster.calls['patch', JOBS] == 20
+    assert all(j['metadata']['labels'].get('team') == "a" and 'benchmark' not in j['metadata']['labels']
+               for j in jobs.values())
+
+    # All labels removed - kopf reports the whole field as removed
+    harness.cluster.patch(WORKFLOWS, "default", "wf-labels", {'metadata': {'labels': None}})
+    harness.run()
+    assert harness.cluster.calls['patch', JOBS] == 40
+    assert all(set(j['metadata']['labels']) == {'kopf__workflow__kopf', 'kopf__workflow__step__kopf'}
+               for j in jobs.values())
+
+    # Interrupted handler runs again - jobs carrying the labels already are not patched
+    workflow_operator.relabel(diff=[('change', ('team',), "a", None)], name="wf-labels", namespace="default",
+                              logger=harness.logger)
+    assert harness.cluster.calls['patch', JOBS] == 40
+
+
+def test_labels_patch_of_whole_field():
+    assert workflow_operator.get_labels_patch([('add', (), None, {'a': "1"})]) == {'a': "1"}
+    assert workflow_operator.get_labels_patch([('remove', (), {'a': "1"}, None)]) == {'a': None}
+    assert workflow_operator.get_labels_patch([('change', ('a',), "1", "2"), ('remove', ('b',), "1", None)]) == \
+        {'a': "2", 'b': None}
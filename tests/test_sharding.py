@@ -0,0 +1,99 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from benchmarks.fake_api import LEASES, FakeCluster, FakeCoordinationV1Api
+from src.api_client import KubernetesApi
+from src.sharding import HashRing, ShardMembership
+
+keys = [f"default/workflow-{i}" for i in range(2000)]
+
+
+def make_membership(identity, cluster, monkeypatch):
+    api = KubernetesApi()
+    api.configure(coordination=FakeCoordinationV1Api(cluster))
+    monkeypatch.setattr(ShardMembership, "api", api)
+    return ShardMembership(True, identity, "operator", "default", lease_duration=15, renew_interval=5,
+                           virtual_nodes=64)
+
+
+def add_lease(cluster, identity, renewed_at):
+    cluster.create(LEASES, {
+        'metadata': {'name': f"operator-{identity}", 'namespace': "default",
+                     'labels': {ShardMembership.GROUP_LABEL: "operator"}},
+        'spec': {'holderIdentity': identity, 'leaseDurationSeconds': 15,
+                 'renewTime': datetime.fromtimestamp(renewed_at, timezone.utc).isoformat()}
+    })
+
+
+def test_keys_are_spread_evenly():
+    ring = HashRing([f"replica-{i}" for i in range(4)])
+    owners = [ring.get_owner(key) for key in keys]
+    assert all(300 < owners.count(f"replica-{i}") < 700 for i in range(4))
+    assert HashRing().get_owner(keys[0]) is None
+
+
+def test_joining_replica_takes_over_only_its_keys():
+    ring = HashRing(["replica-0", "replica-1", "replica-2"])
+    joined = HashRing(["replica-0", "replica-1", "replica-2", "replica-3"])
+    moved = [key for key in keys if ring.get_owner(key) != joined.get_owner(key)]
+    assert all(joined.get_owner(key) == "replica-3" for key in moved)
+    assert 300 < len(moved) < 700
+
+
+def test_membership_is_disabled_by_default():
+    membership = ShardMembership(False, "replica-0", "operator", "default", 15, 5, 64)
+    assert membership.owns("default", "workflow-0")
+
+
+def test_members_are_replicas_with_live_leases(monkeypatch):
+    cluster = FakeCluster()
+    now = datetime.now(timezone.utc).timestamp()
+    add_lease(cluster, "replica-1", now - 5)
+    add_lease(cluster, "replica-2", now - 60)
+    membership = make_membership("replica-0", cluster, monkeypatch)
+    rebalances = []
+    membership.start(rebalances.append)
+    try:
+        assert membership.get_ring().members == {"replica-0", "replica-1"}
+        assert len(rebalances) == 1 and not rebalances[0].members
+        assert cluster.objects[LEASES][("default", "operator-replica-0")]['spec']['holderIdentity'] == "replica-0"
+
+        # Lease of replica-1 expires
+        assert membership.refresh(now + 15)
+        assert membership.get_ring().members == {"replica-0"}
+        assert all(membership.owns("default", f"workflow-{i}") for i in range(100))
+        assert not membership.refresh(now + 16)
+    finally:
+        membership.stop()
+    assert ("default", "operator-replica-0") not in cluster.objects[LEASES]
+
+
+def test_replica_failing_to_renew_its_lease_owns_nothing(monkeypatch):
+    cluster = FakeCluster()
+    membership = make_membership("replica-0", cluster, monkeypatch)
+    now = datetime.now(timezone.utc).timestamp()
+    membership.refresh(now)
+    assert membership.owns("default", "workflow-0")
+
+    def fail(*args, **kwargs):
+        raise ConnectionError("API server is unreachable")
+
+    monkeypatch.setattr(ShardMembership.api.coordination(), "patch_namespaced_lease", fail)
+    monkeypatch.setattr(ShardMembership.api.coordination(), "list_namespaced_lease", fail)
+    membership.refresh(now + 10)
+    assert membership.owns("default", "workflow-0")
+    membership.refresh(now + 20)
+    assert not membership.owns("default", "workflow-0")
+
+
+@pytest.mark.parametrize("replicas", [2, 3])
+def test_every_workflow_has_exactly_one_owner(replicas, monkeypatch):
+    cluster = FakeCluster()
+    memberships = [make_membership(f"replica-{i}", cluster, monkeypatch) for i in range(replicas)]
+    for membership in memberships:
+        membership.refresh()
+    for membership in memberships:
+        membership.refresh()
+    for i in range(200):
+        assert sum(m.owns("default", f"workflow-{i}") for m in memberships) == 1
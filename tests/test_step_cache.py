@@ -0,0 +1,95 @@
+import pytest
+
+from src.workflow.step_cache import StepResultCache, get_step_cache_keys
+from src.workflow.workflow import Workflow
+from src.workflow.workflow_controller import WorkflowController
+from src.workflow.workflow_schema import WorkflowSchema, WorkflowStepSchema
+
+containers = [
+    {"stepName": "step0", "image": "a", "command": ["true"], "dependsOn": []},
+    {"stepName": "step1", "image": "a", "command": ["true"], "dependsOn": ["step0"]},
+    {"stepName": "step2", "image": "b", "command": None, "dependsOn": ["step0"]},
+    {"stepName": "step3", "image": "a", "command": ["true"], "dependsOn": ["step1", "step2"]},
+]
+
+
+def make_graph(steps):
+    graph = Workflow(WorkflowSchema(steps=[WorkflowStepSchema(**c) for c in steps]))
+    return graph, graph.topological_order()
+
+
+def make_body(uid, executed=""):
+    return {
+        "metadata": {"name": "wf", "namespace": "default", "uid": uid},
+        "spec": {"containers": containers, "cacheSteps": True},
+        "status": {"execution": {"version": 1, "executed": executed, "started": ""}},
+    }
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = StepResultCache(max_size=100, ttl=60)
+    monkeypatch.setattr("src.workflow.workflow_controller.step_result_cache", cache)
+    return cache
+
+
+def test_keys_depend_on_step_content_and_dependencies():
+    keys = get_step_cache_keys("default", *make_graph(containers))
+    assert len(set(keys)) == 4
+    assert get_step_cache_keys("default", *make_graph(containers)) == keys
+    assert get_step_cache_keys("other", *make_graph(containers))[0] != keys[0]
+
+    changed = [dict(containers[0], command=["false"])] + containers[1:]
+    changed_keys = get_step_cache_keys("default", *make_graph(changed))
+    # Change of a step invalidates results of all steps depending on it
+    assert all(a != b for a, b in zip(keys, changed_keys))
+
+    changed = containers[:2] + [dict(containers[2], image="c")] + containers[3:]
+    changed_keys = get_step_cache_keys("default", *make_graph(changed))
+    assert [a == b for a, b in zip(keys, changed_keys)] == [True, True, False, False]
+
+
+def test_results_expire_and_are_bounded():
+    cache = StepResultCache(max_size=2, ttl=10)
+    cache.record("k0", now=100)
+    assert cache.contains("k0", now=105) and not cache.contains("k1", now=105)
+    assert not cache.contains("k0", now=111) and len(cache) == 0
+
+    cache.record("k0", now=100)
+    cache.record("k1", now=100)
+    cache.record("k2", now=100)
+    assert len(cache) == 2 and not cache.contains("k0", now=100)
+
+
+def test_results_are_persisted(tmp_path):
+    path = str(tmp_path / "results.json")
+    cache = StepResultCache(max_size=10, ttl=60, path=path)
+    cache.record("k0")
+    cache.record("expired", now=1)
+    cache.save()
+    restored = StepResultCache(max_size=10, ttl=60, path=path)
+    restored.load()
+    assert restored.contains("k0") and len(restored) == 1
+
+
+def test_cached_steps_are_resolved_transitively(cache):
+    body = make_body("step-cache-wf")
+    WorkflowController.record_step_result(body, "step0")
+    WorkflowController.record_step_result(body, "step1")
+    ready = WorkflowController.get_ready_steps(body)
+    assert sorted(WorkflowController.get_cached_steps(body, ready)) == ["step0", "step1"]
+
+    WorkflowController.record_step_result(body, "step2")
+    assert sorted(WorkflowController.get_cached_steps(body, ready)) == ["step0", "step1", "step2"]
+
+    # Same spec resubmitted as another workflow reuses the results
+    resubmitted = make_body("step-cache-wf-2")
+    assert sorted(WorkflowController.get_cached_steps(
+        resubmitted, WorkflowController.get_ready_steps(resubmitted))) == ["step0", "step1", "step2"]
+
+
+def test_cache_is_opt_in():
+    body = make_body("step-cache-opt-in")
+    assert WorkflowController.is_step_cache_enabled(body)
+    del body["spec"]["cacheSteps"]
+    assert not WorkflowController.is_step_cache_enabled(body)
@@ -1,3 +1,7 @@
+import pytest
+
+from src.workflow.execution_state import StepSet
+from src.workflow.scheduler import WorkflowScheduler
 from src.workflow.workflow import Workflow
 from src.workflow.workflow_schema import WorkflowStepSchema, WorkflowSchema
 
@@ -52,4 +56,91 @@ def test_diamond_workflow():
 
     # Step3 can't be executed because it's waiting for step2
     assert (workflow_graph.get_next_to_execute({"step0", "step1"}) == {diamond_workflow[2]})
-    assert (workflow_graph.get_next_to_execute({"step1", "step2"}) == {diamond_workflow[3]})
\ No newline at end of file
+    assert (workflow_graph.get_next_to_execute({"step1", "step2"}) == {diamond_workflow[3]})
+
+def test_scheduler_marks_steps_incrementally():
+    scheduler = WorkflowScheduler(Workflow(WorkflowSchema(steps=diamond_workflow)))
+    assert scheduler.get_ready() == {diamond_workflow[0]}
+    assert scheduler.mark_executed("step0") == {diamond_workflow[1], diamond_workflow[2]}
+    assert scheduler.mark_executed("step1") == set()
+    assert scheduler.get_ready() == {diamond_workflow[2]}
+    assert scheduler.mark_executed("step2") == {diamond_workflow[3]}
+    assert scheduler.mark_executed("step2") == set()
+
+
+def test_scheduler_rebuild_from_executed_steps():
+    graph = Workflow(WorkflowSchema(steps=binary_tree_workflow))
+    scheduler = WorkflowScheduler(graph, executed=StepSet.from_ids([0, 1]))
+    assert scheduler.get_ready() == {binary_tree_workflow[i] for i in [2, 3, 4]}
+
+    assert scheduler.sync(StepSet.from_ids([0, 1, 2]), StepSet.from_ids([0, 1, 2])) == \
+        {binary_tree_workflow[i] for i in [3, 4, 5, 6]}
+    # Removal of executed steps (workflow restart) forces a rebuild
+    assert scheduler.sync(StepSet(), StepSet()) == {binary_tree_workflow[0]}
+
+
+def test_scheduler_sync_returns_newly_ready_steps():
+    graph = Workflow(WorkflowSchema(steps=binary_tree_workflow))
+    scheduler = WorkflowScheduler(graph)
+    assert scheduler.sync(StepSet(), StepSet()) == {binary_tree_workflow[0]}
+    assert scheduler.sync(StepSet(), StepSet.from_ids([0])) == set()
+    assert scheduler.get_ready() == set()
+
+    assert scheduler.sync(StepSet.from_ids([0]), StepSet.from_ids([0, 1])) == {binary_tree_workflow[2]}
+    assert scheduler.get_ready() == {binary_tree_workflow[2]}
+    assert scheduler.sync(StepSet.from_ids([0, 1]), StepSet.from_ids([0, 1, 2])) == \
+        {binary_tree_workflow[i] for i in [3, 4]}
+    assert scheduler.sync(StepSet.from_ids([0, 1]), StepSet.from_ids([0, 1, 2])) == set()
+    assert scheduler.get_ready() == {binary_tree_workflow[i] for i in [3, 4]}
+
+
+def test_scheduler_sync_of_steps_executed_together():
+    scheduler = WorkflowScheduler(Workflow(WorkflowSchema(steps=list_workflow)))
+    assert scheduler.sync(StepSet(), StepSet.from_ids([0])) == set()
+    assert scheduler.sync(StepSet.from_ids([0, 1, 2]), StepSet.from_ids([0])) == {list_workflow[3]}
+
+
+def test_graph_structure():
+    workflow_graph = Workflow(WorkflowSchema(steps=diamond_workflow))
+    assert workflow_graph.roots() == [0]
+    assert sorted(workflow_graph.successors(0)) == [1, 2]
+    assert sorted(workflow_graph.predecessors(3)) == [1, 2]
+    order = workflow_graph.topological_order()
+    assert order[0] == 0 and order[-1] == 3
+    assert workflow_graph.find_cycle() is None
+
+
+def test_cycle_detection():
+    steps = [
+        WorkflowStepSchema(stepName="step0", image="", dependsOn=[]),
+        WorkflowStepSchema(stepName="step1", image="", dependsOn=["step0", "step3"]),
+        WorkflowStepSchema(stepName="step2", image="", dependsOn=["step1"]),
+        WorkflowStepSchema(stepName="step3", image="", dependsOn=["step2"]),
+    ]
+    workflow_graph = Workflow(WorkflowSchema(steps=steps))
+    assert workflow_graph.topological_order() is None
+    assert workflow_graph.find_cycle() == ["step1", "step2", "step3", "step1"]
+
+
+def test_parallelism_requires_completions():
+    steps = [WorkflowStepSchema(stepName="step0", image="", dependsOn=[], completions=4, parallelism=2),
+             WorkflowStepSchema(stepName="step1", image="", dependsOn=["step0"], parallelism=2)]
+    with pytest.raises(RuntimeError, match="step1"):
+        Workflow(WorkflowSchema(steps=steps))
+
+
+def test_linear_chains():
+    steps = [
+        WorkflowStepSchema(stepName="step0", image="", dependsOn=[]),
+        WorkflowStepSchema(stepName="step1", image="", dependsOn=["step0"]),
+        WorkflowStepSchema(stepName="step2", image="", dependsOn=["step1"]),
+        WorkflowStepSchema(stepName="step3", image="", dependsOn=["step2"]),
+        WorkflowStepSchema(stepName="step4", image="", dependsOn=["step2"], completions=4),
+        WorkflowStepSchema(stepName="step5", image="", dependsOn=["step3"]),
+        WorkflowStepSchema(stepName="step6", image="", dependsOn=["step4"]),
+        WorkflowStepSchema(stepName="step7", image="", dependsOn=["step5", "step6"]),
+        WorkflowStepSchema(stepName="step8", image="", dependsOn=["step7"], maxRetries=1),
+    ]
+    assert sorted(Workflow(WorkflowSchema(steps=steps)).linear_chains()) == [[0, 1, 2], [3, 5]]
+    assert Workflow(WorkflowSchema(steps=diamond_workflow)).linear_chains() == []
+    assert Workflow(WorkflowSchema(steps=list_workflow)).linear_chains() == [[0, 1, 2, 3, 4]]
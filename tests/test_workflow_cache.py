@@ -0,0 +1,73 @@
+from src.workflow.workflow_cache import WorkflowCache
+
+
+def make_body(uid, containers):
+    return {"metadata": {"uid": uid, "name": uid, "namespace": "default"}, "spec": {"containers": containers}}
+
+
+diamond_containers = [
+    {"stepName": "step0", "image": "", "dependsOn": []},
+    {"stepName": "step1", "image": "", "dependsOn": ["step0"]},
+    {"stepName": "step2", "image": "", "dependsOn": ["step0"]},
+    {"stepName": "step3", "image": "", "dependsOn": ["step1", "step2"]},
+]
+
+cyclic_containers = [
+    {"stepName": "step0", "image": "", "dependsOn": ["step1"]},
+    {"stepName": "step1", "image": "", "dependsOn": ["step0"]},
+]
+
+
+def test_compiled_workflow_is_reused():
+    cache = WorkflowCache(max_size=4)
+    body = make_body("a", diamond_containers)
+    compiled = cache.get(body)
+    assert compiled.is_valid
+    assert [s.stepName for s in compiled.topological_order][0] == "step0"
+    assert [s.stepName for s in compiled.topological_order][-1] == "step3"
+    assert cache.get(body) is compiled
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+
+def test_spec_change_recompiles():
+    cache = WorkflowCache(max_size=4)
+    compiled = cache.get(make_body("a", diamond_containers))
+    recompiled = cache.get(make_body("a", diamond_containers[:2]))
+    assert recompiled is not compiled
+    assert len(recompiled.steps) == 2
+    assert len(cache) == 1
+
+
+def test_generation_identifies_spec():
+    cache = WorkflowCache(max_size=4)
+    body = make_body("a", diamond_containers)
+    body["metadata"]["generation"] = 1
+    compiled = cache.get(body)
+    assert cache.get(dict(body, status={"workflow-status": "Started"})) is compiled
+    body["metadata"]["generation"] = 2
+    assert cache.get(body) is not compiled
+
+
+def test_invalid_workflows():
+    cache = WorkflowCache(max_size=4)
+    cyclic = cache.get(make_body("a", cyclic_containers))
+    assert not cyclic.is_valid
+    assert cyclic.message == "Workflow contains a cycle: step0 -> step1 -> step0!"
+    missing_dependency = cache.get(make_body("b", [{"stepName": "step0", "image": "", "dependsOn": ["step9"]}]))
+    assert not missing_dependency.is_valid
+
+
+def test_lru_eviction_and_invalidation():
+    cache = WorkflowCache(max_size=2)
+    a, b, c = (make_body(uid, diamond_containers) for uid in "abc")
+    cache.get(a)
+    cache.get(b)
+    cache.get(a)
+    cache.get(c)
+    assert len(cache) == 2
+    cache.get(b)
+    assert cache.stats()["misses"] == 4
+
+    cache.invalidate(a)
+    cache.get(a)
+    assert cache.stats()["misses"] == 5
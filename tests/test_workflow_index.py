@@ -0,0 +1,25 @@
+from src.workflow.workflow_index import WorkflowIndex
+
+
+def make_body(name, resource_version):
+    return {"metadata": {"name": name, "namespace": "default", "resourceVersion": resource_version}}
+
+
+def test_index_keeps_newest_version():
+    index = WorkflowIndex()
+    assert index.get("default", "wf") is None
+    assert index.update(make_body("wf", "10"))
+    assert not index.update(make_body("wf", "10"))
+    # Stale watch event must not override newer object
+    assert not index.update(make_body("wf", "9"))
+    assert index.update(make_body("wf", "11"))
+    assert index.get("default", "wf")["metadata"]["resourceVersion"] == "11"
+    assert index.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+
+def test_index_removal():
+    index = WorkflowIndex()
+    index.update(make_body("wf", "1"))
+    index.remove("default", "wf")
+    assert index.get("default", "wf") is None
+    assert len(index) == 0
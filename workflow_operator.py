@@ -1,28 +1,97 @@
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Set
+from typing import Dict, List, Optional, Set, Tuple
 
 import kopf
 import kubernetes
-from kubernetes import client
 
+from src.api_client import kubernetes_api
+from src.config import OperatorConfig
 from src.job.job_controller import JobController
+from src.job.job_state_tracker import COMPLETE, job_state_tracker
+from src.metrics import operator_metrics
+from src.sharding import HashRing, ShardMembership, shard_membership
+from src.workflow.admission_queue import step_admission_queue
+from src.workflow.deadline_scheduler import deadline_scheduler
+from src.workflow.duration_store import step_duration_store
+from src.workflow.patch_aggregator import workflow_patch_aggregator
 from src.workflow.status import WorkflowStatusEnum
+from src.workflow.step_cache import step_result_cache
 from src.workflow.workflow_controller import WorkflowController
+from src.workflow.workflow_index import workflow_index
+from src.workflow.workflow_metrics import WorkflowStateCollector
 from src.workflow.workflow_schema import WorkflowStepSchema
 
 
-@kopf.on.create('workflows')
-def create_workflow(body, namespace, patch, logger, **kwargs):
+@kopf.on.startup()
+def configure(settings: kopf.OperatorSettings, logger, **kwargs):
+    # Synchronous handlers block a worker thread for the duration of API calls, keep enough workers
+    # (and connections in the shared API client pool) to not serialize handlers on them
+    settings.execution.max_workers = OperatorConfig.HANDLER_WORKERS
+    # Startup handlers run before kopf logs in - API calls made from here (warm start, leases of the shard group)
+    # would go to a client without credentials
+    kubernetes_api.load_config()
+    step_duration_store.load()
+    step_result_cache.load()
+    deadline_scheduler.start()
+    workflow_patch_aggregator.start()
+    step_admission_queue.start(launch_workflow_step)
+    if shard_membership.enabled:
+        # Replicas share the work instead of standing by for each other
+        settings.peering.standalone = True
+        shard_membership.start(rebalance_workflows)
+        logger.info(f"Running as replica {shard_membership.identity} of shard group {shard_membership.group}.")
+    logger.info(f"Running with {OperatorConfig.HANDLER_WORKERS} handler workers and API connection pool of size "
+                f"{OperatorConfig.API_CONNECTION_POOL_SIZE}.")
+    if operator_metrics.enabled:
+        operator_metrics.register_collector(WorkflowStateCollector())
+        operator_metrics.start_server(OperatorConfig.METRICS_PORT)
+        logger.info(f"Serving metrics on port {OperatorConfig.METRICS_PORT}.")
+    elif OperatorConfig.METRICS_PORT:
+        logger.warning("METRICS_PORT is set, but prometheus_client is not installed. Metrics are disabled.")
+    if OperatorConfig.WARM_START:
+        warm_start(logger)
+
+
+@kopf.on.cleanup()
+def cleanup(logger, **kwargs):
+    if shard_membership.enabled:
+        shard_membership.stop()
+    deadline_scheduler.stop()
+    workflow_patch_aggregator.stop()
+    step_admission_queue.stop()
+    step_duration_store.save()
+    step_result_cache.save()
+
+
+# Filters of handlers - with sharding enabled, events of workflows (and their jobs) handled by other replicas are
+# dropped. All workflows are still indexed, workflows taken over from other replicas are resumed from the index.
+def is_owned_workflow(name, namespace, **kwargs) -> bool:
+    return shard_membership.owns(namespace, name)
+
+
+def is_owned_job(body, namespace, **kwargs) -> bool:
+    return shard_membership.owns(namespace, JobController.get_job_workflow_name(body))
+
+
+@kopf.on.create('workflows', when=is_owned_workflow)
+@operator_metrics.measure_handler("create")
+def create_workflow(body, name, namespace, patch, logger, **kwargs):
     logger.info(f"Starting creation of workflow handler in namespace {namespace}...")
     is_valid, mess = WorkflowController.validate_workflow_spec(body)
     if not is_valid:
         WorkflowController.update_status(patch, WorkflowStatusEnum.FAILED, mess)
     else:
         WorkflowController.update_status(patch, WorkflowStatusEnum.CREATED)
+        watch_workflow_timeout(body, name, namespace)
         WorkflowController.init_executed_steps(patch)
 
 
-@kopf.on.field('workflows', field=WorkflowController.STEP_EXECUTED_SELECTOR)
+@kopf.on.field('workflows', field=WorkflowController.STEP_EXECUTED_SELECTOR, when=is_owned_workflow)
+@operator_metrics.measure_handler("step-executed")
 def update_workflow_after_step_execution(body, name, namespace, patch, logger, **kwargs):
     logger.info(f"Starting workflow step completion handler in namespace {namespace} for workflow {name}...")
 
@@ -33,91 +102,486 @@ def update_workflow_after_step_execution(body, name, namespace, patch, logger, *
     if WorkflowController.has_finished(body):
         logger.info(f"Workflow {name} has executed all its steps.")
         WorkflowController.update_status(patch, WorkflowStatusEnum.COMPLETED)
+        cancel_workflow_timeout(name, namespace)
+        step_admission_queue.forget(namespace, name)
     else:
         WorkflowController.update_status(patch, WorkflowStatusEnum.STARTED)
-        steps_to_execute = WorkflowController.get_steps_to_execute(body,
-                                                                   executed_steps=WorkflowController.get_executed_steps(
-                                                                       body))
-        logger.info(f"Workflow {name} will start execution of the following steps:\n{steps_to_execute}")
-        start_workflow_steps(steps_to_execute, name, namespace, logger, body)
-        WorkflowController.add_to_started_steps(body, patch, [s.stepName for s in steps_to_execute])
+        watch_workflow_timeout(body, name, namespace)
+        queue_ready_steps(body, name, namespace, logger)
 
 
-@kopf.on.event('jobs', labels=JobController.JOB_SELECTOR)
-def handle_workflow_job_completion(event, namespace, logger, **kwargs):
-    if event['type'] == 'MODIFIED':
-        logger.info(
-            f"Starting job event handler for job {event['object']['metadata']['name']} in namespace {namespace}...")
+@kopf.on.event('workflows')
+def index_workflow(event, name, namespace, **kwargs):
+    if event['type'] == 'DELETED':
+        workflow_index.remove(namespace, name)
+    else:
+        workflow_index.update(event['object'])
 
-        workflow = JobController.get_owning_workflow(event['object'])
-        step_name = JobController.get_job_workflow_step_name(event['object'])
-        workflow_name = workflow['metadata']['name']
-        patch = {}
 
-        if JobController.has_completed(event['object']):
-            logger.info(f"Job corresponding to step {step_name} in workflow {workflow_name} has completed.")
-            WorkflowController.add_executed_step(workflow, patch, step_name)
-        elif JobController.has_failed(event['object']):
-            logger.info(f"Job corresponding to step {step_name} in workflow {workflow_name} has failed.")
-            WorkflowController.update_status(patch, WorkflowStatusEnum.FAILED, f"Step {step_name} has failed.")
+@kopf.on.event('jobs', labels=JobController.JOB_SELECTOR, when=is_owned_job)
+@operator_metrics.measure_handler("job-event")
+def handle_workflow_job_completion(event, namespace, logger, **kwargs):
+    JobController.index_job_event(event)
+    condition = job_state_tracker.get_new_terminal_condition(event)
+    if condition is None and event['type'] != 'DELETED':
+        operator_metrics.job_events_filtered.labels("not-terminal").inc()
+        return
 
-        WorkflowController.patch_workflow(patch=patch, workflow_name=workflow_name, namespace=namespace)
+    step_name = JobController.get_job_workflow_step_name(event['object'])
+    workflow_name = JobController.get_job_workflow_name(event['object'])
+    # Finished (or deleted) job doesn't occupy a slot of running steps anymore
+    step_admission_queue.release(namespace, workflow_name, step_name, event['object']['metadata']['name'])
+    if condition is None:
+        operator_metrics.job_events_filtered.labels("not-terminal").inc()
+        return
+    if is_job_result_recorded(namespace, workflow_name, step_name, condition):
+        # Terminal event redelivered after restart of the operator
+        job_state_tracker.count_filtered()
+        operator_metrics.job_events_filtered.labels("recorded").inc()
+        return
 
+    logger.info(f"Starting job event handler for job {event['object']['metadata']['name']} in namespace {namespace}...")
+    step_containers = JobController.get_job_step_containers(event['object'])
+    if condition == COMPLETE:
+        logger.info(f"Job corresponding to step {step_name} in workflow {workflow_name} has completed.")
+        run_time = JobController.get_job_run_time(event['object'])
+        operator_metrics.step_run_seconds.labels("completed").observe(run_time)
+        if len(step_containers) == 1:
+            # Run time of fused steps is not known step by step
+            step_duration_store.record(workflow_name, step_name, JobController.get_job_image(event['object']),
+                                       run_time)
+        record_executed_steps(namespace, workflow_name, step_containers)
+    else:
+        logger.info(f"Job corresponding to step {step_name} in workflow {workflow_name} has failed.")
+        operator_metrics.step_run_seconds.labels("failed").observe(JobController.get_job_run_time(event['object']))
+        if retry_failed_step(namespace, workflow_name, step_name, event['object']['metadata']['name'], logger):
+            return
+        fused_steps = [fused_step for fused_step, _ in step_containers[1:]]
+        message = f"Step {step_name} or one of steps fused with it ({', '.join(fused_steps)}) has failed." \
+            if fused_steps else f"Step {step_name} has failed."
+        workflow_patch_aggregator.set_status(namespace, workflow_name, WorkflowStatusEnum.FAILED, message)
+        cancel_workflow_timeout(workflow_name, namespace)
+        step_admission_queue.cancel(namespace, workflow_name)
 
-@kopf.on.update('workflows', field='metadata.labels')
+
+@kopf.on.update('workflows', field='metadata.labels', when=is_owned_workflow)
+@operator_metrics.measure_handler("relabel")
 def relabel(diff, name, namespace, logger, **kwargs):
     logger.info(f"Starting handler for relabeling of workflow {name} in namespace {namespace}...")
-    labels_patch = {field[0]: new for op, field, old, new in diff}
+    labels_patch = get_labels_patch(diff)
     logger.info(f"Labels patch is: {labels_patch}")
-    jobs = JobController.fetch_workflow_job_names(namespace, workflow_name=name)
+    job_names = list(JobController.fetch_workflow_job_names(namespace, workflow_name=name))
+    # Jobs patched before an interrupted run of the handler carry the labels already and are skipped
+    jobs = [job_name for job_name in job_names if not JobController.has_labels(namespace, name, job_name, labels_patch)]
+    if not jobs:
+        return
+    logger.info(f"Patching labels of {len(jobs)} jobs...")
+    failed = JobController.patch_workflow_jobs(namespace, name, jobs, {'metadata': {'labels': labels_patch}})
+    if failed:
+        job_name, error = next(iter(failed.items()))
+        raise kopf.TemporaryError(f"Failed to patch labels of {len(failed)} of {len(jobs)} jobs, "
+                                  f"e.g. of job {job_name}: {error}")
 
-    job_patch = {'metadata': {'labels': labels_patch}}
-    for job_name in jobs:
-        logger.info(f"Patching labels of job {job_name}...")
-        JobController.patch_job(namespace, name=job_name, patch=job_patch)
+
+@kopf.on.field('workflows', field=WorkflowController.STATUS_SELECTOR, when=is_owned_workflow)
+@operator_metrics.measure_handler("finished")
+def clean_up_finished_workflow(body, name, namespace, patch, new, logger, **kwargs):
+    if new not in [str(WorkflowStatusEnum.COMPLETED), str(WorkflowStatusEnum.FAILED)]:
+        return
+    if OperatorConfig.JOB_TTL_AFTER_FINISHED >= 0:
+        # Results of all jobs have been recorded, Kubernetes deletes the jobs (and their pods) once their TTL expires
+        job_names = list(JobController.fetch_workflow_job_names(namespace, workflow_name=name))
+        logger.info(f"Setting TTL of {len(job_names)} jobs of finished workflow {name}...")
+        failed = JobController.patch_workflow_jobs(
+            namespace, name, job_names, {'spec': {'ttlSecondsAfterFinished': OperatorConfig.JOB_TTL_AFTER_FINISHED}})
+        if failed:
+            job_name, error = next(iter(failed.items()))
+            raise kopf.TemporaryError(f"Failed to set TTL of {len(failed)} of {len(job_names)} jobs, "
+                                      f"e.g. of job {job_name}: {error}")
+    if OperatorConfig.COMPACT_FINISHED_WORKFLOWS:
+        WorkflowController.compact_finished_workflow(body, patch)
 
 
-@kopf.on.update('workflows', field='spec')
-def spec_update(patch, body, name, namespace, logger, **kwargs):
+def get_labels_patch(diff) -> Dict[str, Optional[str]]:
+    """
+        Returns patch of labels (None removes a label) from kopf diff of metadata.labels. Diff of a workflow
+        gaining its first labels or losing all of them has a single item for the whole field.
+    """
+    labels_patch = {}
+    for op, field, old, new in diff:
+        if field:
+            labels_patch[field[0]] = new
+        else:
+            labels_patch.update({key: None for key in old or {}})
+            labels_patch.update(new or {})
+    return labels_patch
+
+
+@kopf.on.update('workflows', field='spec', when=is_owned_workflow)
+@operator_metrics.measure_handler("spec-update")
+def spec_update(patch, body, old, name, namespace, logger, **kwargs):
     logger.info(f"Starting handler for update of workflow {name} spec field in namespace {namespace}...")
 
+    WorkflowController.forget_workflow(body)
+    step_admission_queue.forget(namespace, name)
     is_valid, mess = WorkflowController.validate_workflow_spec(body)
     if not is_valid:
         WorkflowController.update_status(patch, WorkflowStatusEnum.FAILED, mess)
+        cancel_workflow_timeout(name, namespace)
+        return
+
+    kept_steps = WorkflowController.carry_over_execution_state(old or {}, body, patch)
+    rerun_workflow(body, patch, name, namespace, kept_steps, "Restarted job after spec update", logger)
+
+
+@kopf.on.field('workflows', field=WorkflowController.RESUME_SELECTOR, when=is_owned_workflow)
+@operator_metrics.measure_handler("resume")
+def resume_failed_workflow(body, name, namespace, patch, new, logger, **kwargs):
+    if not new or 'workflow-status' not in body.get('status', {}) or \
+            WorkflowController.get_status(body) != WorkflowStatusEnum.FAILED:
+        return
+    logger.info(f"Resuming failed workflow {name} in namespace {namespace}...")
+    WorkflowController.forget_workflow(body)
+    step_admission_queue.forget(namespace, name)
+    is_valid, _ = WorkflowController.validate_workflow_spec(body)
+    if not is_valid:
+        return
+    executed_steps = WorkflowController.reset_unfinished_steps(body, patch)
+    rerun_workflow(body, patch, name, namespace, executed_steps, "Resumed after failure", logger)
+
+
+@kopf.on.delete('workflows', optional=True, when=is_owned_workflow)
+def delete_workflow(body, name, namespace, logger, **kwargs):
+    logger.info(f"Dropping cached state of deleted workflow {name} in namespace {namespace}...")
+    WorkflowController.forget_workflow(body)
+    JobController.forget_workflow_jobs(namespace, name)
+    cancel_workflow_timeout(name, namespace)
+    step_admission_queue.forget(namespace, name)
+
+
+@kopf.on.resume('workflows', when=is_owned_workflow)
+def migrate_execution_state(body, name, namespace, patch, logger, **kwargs):
+    if WorkflowController.migrate_legacy_state(body, patch):
+        logger.info(f"Migrated execution state of workflow {name} in namespace {namespace} from annotations to status.")
+
+
+@kopf.on.resume('workflows', when=is_owned_workflow)
+def resume_workflow_timeout(body, name, namespace, logger, **kwargs):
+    if 'workflow-status' not in body.get('status', {}):
+        return
+    if WorkflowController.get_status(body) in [WorkflowStatusEnum.CREATED, WorkflowStatusEnum.STARTED]:
+        watch_workflow_timeout(body, name, namespace, since=WorkflowController.get_status_timestamp(body).timestamp())
+
+
+@kopf.on.resume('workflows', when=is_owned_workflow)
+def resume_workflow_steps(body, name, namespace, logger, **kwargs):
+    # Queue of ready steps is not persistent - steps ready, but not started before restart are queued again
+    if 'workflow-status' not in body.get('status', {}) or not WorkflowController.has_execution_state(body):
+        return
+    if WorkflowController.get_status(body) in [WorkflowStatusEnum.CREATED, WorkflowStatusEnum.STARTED]:
+        queue_ready_steps(body, name, namespace, logger)
+        resume_step_retries(body, name, namespace)
+
+
+def resume_step_retries(workflow_body, name: str, namespace: str) -> None:
+    """
+        Reschedules retries of steps which haven't been run again before restart of the operator -
+        retried steps which are running, but have no job.
+    """
+    retries = WorkflowController.get_step_retries(workflow_body)
+    running = set(WorkflowController.get_running_steps(workflow_body)).intersection(retries)
+    if not running:
+        return
+    steps_with_jobs = JobController.get_workflow_job_steps(namespace, name)
+    for step_name in running - steps_with_jobs:
+        # Restored as running, but it isn't
+        step_admission_queue.release(namespace, name, step_name)
+        schedule_step_retry(namespace, name, step_name, retries[step_name]['retryAt'])
+
+
+def warm_start(logger) -> None:
+    """
+        Startup phase run before kopf starts watching: workflows and jobs are listed in bulk into the local indexes,
+        in-flight workflows are resumed and results of jobs which have finished while the operator was down are
+        recorded, for many workflows in parallel. Resume handlers run by kopf afterwards find everything in memory.
+    """
+    start = time.perf_counter()
+    workflows = 0
+    for workflow in WorkflowController.list_workflows():
+        workflow_index.update(workflow)
+        workflows += 1
+    jobs: Dict[Tuple[str, str], List[Dict]] = {}
+    for job in JobController.list_jobs():
+        jobs.setdefault((job['metadata']['namespace'], JobController.get_job_workflow_name(job)), []).append(job)
+
+    in_flight = []
+    for workflow in workflow_index.values():
+        name, namespace = workflow['metadata']['name'], workflow['metadata']['namespace']
+        if not shard_membership.owns(namespace, name):
+            # Jobs of workflows of other replicas are not watched - the index would go stale
+            continue
+        JobController.index_workflow_jobs(namespace, name, jobs.get((namespace, name), []))
+        if 'workflow-status' in workflow.get('status', {}) and \
+                WorkflowController.get_status(workflow) in [WorkflowStatusEnum.CREATED, WorkflowStatusEnum.STARTED]:
+            in_flight.append(workflow)
+    with ThreadPoolExecutor(OperatorConfig.HANDLER_WORKERS, thread_name_prefix="warm-start") as executor:
+        recorded = sum(executor.map(
+            lambda w: warm_start_workflow(w, jobs.get((w['metadata']['namespace'], w['metadata']['name']), []), logger),
+            in_flight))
+    logger.info(f"Ready after {time.perf_counter() - start:.2f} seconds of warm start: indexed {workflows} workflows "
+                f"and {sum(len(j) for j in jobs.values())} jobs, resumed {len(in_flight)} workflows and recorded "
+                f"{recorded} results of jobs finished while the operator was down.")
+
+
+def warm_start_workflow(workflow_body, jobs: List[Dict], logger) -> int:
+    """
+        Resumes in-flight workflow and processes terminal conditions of its @jobs like job events.
+        Returns number of job results which haven't been recorded in the workflow yet.
+    """
+    name, namespace = workflow_body['metadata']['name'], workflow_body['metadata']['namespace']
+    # Results of jobs must be recorded on top of the migrated execution state, not of an empty one
+    patch = {}
+    if WorkflowController.migrate_legacy_state(workflow_body, patch):
+        logger.info(f"Migrated execution state of workflow {name} in namespace {namespace} from annotations to status.")
+        workflow_body = WorkflowController.patch_workflow(patch, name, namespace)
+        workflow_index.update(workflow_body)
+    # Slots of running steps are restored before their finished jobs release them
+    resume_workflow_timeout(body=workflow_body, name=name, namespace=namespace, logger=logger)
+    resume_workflow_steps(body=workflow_body, name=name, namespace=namespace, logger=logger)
+    recorded = 0
+    for job in jobs:
+        condition = job_state_tracker.get_terminal_condition(job)
+        if condition is None:
+            continue
+        step_name = JobController.get_job_workflow_step_name(job)
+        recorded += not is_job_result_recorded(namespace, name, step_name, condition)
+        handle_workflow_job_completion(event={'type': 'MODIFIED', 'object': job}, namespace=namespace, logger=logger)
+    return recorded
+
+
+def rebalance_workflows(previous_ring: HashRing) -> None:
+    """
+        Called (from the shard membership thread) when replicas join or leave the shard group: workflows taken over
+        from other replicas are resumed, state of workflows handed over to other replicas is dropped.
+    """
+    logger = logging.getLogger(__name__)
+    taken_over, handed_over = 0, 0
+    for workflow in workflow_index.values():
+        name, namespace = workflow['metadata']['name'], workflow['metadata']['namespace']
+        owned = shard_membership.owns(namespace, name)
+        if owned == shard_membership.owns(namespace, name, previous_ring):
+            continue
+        if owned:
+            taken_over += 1
+            try:
+                take_over_workflow(workflow, name, namespace, logger)
+            except kubernetes.client.ApiException as e:
+                logger.warning(f"Failed to take over workflow {name} in namespace {namespace}: {e.reason}")
+        else:
+            handed_over += 1
+            WorkflowController.forget_workflow(workflow)
+            JobController.forget_workflow_jobs(namespace, name)
+            cancel_workflow_timeout(name, namespace)
+            step_admission_queue.forget(namespace, name)
+    logger.info(f"Took over {taken_over} and handed over {handed_over} workflows.")
+
+
+def take_over_workflow(workflow_body, name: str, namespace: str, logger) -> None:
+    if 'workflow-status' in workflow_body.get('status', {}):
+        resume_workflow_timeout(body=workflow_body, name=name, namespace=namespace, logger=logger)
+        resume_workflow_steps(body=workflow_body, name=name, namespace=namespace, logger=logger)
+        return
+    # Not created by its previous owner - there may be no more events of the workflow to run the create handler on
+    WorkflowController.patch_workflow(
+        {'metadata': {'annotations': {ShardMembership.OWNER_ANNOTATION: shard_membership.identity}}}, name, namespace)
+
+
+def queue_ready_steps(workflow_body, name: str, namespace: str, logger) -> None:
+    max_parallelism = WorkflowController.get_max_parallelism(workflow_body)
+    if step_admission_queue.is_tracked(namespace, name):
+        steps_to_execute = WorkflowController.get_steps_to_execute(workflow_body)
     else:
-        WorkflowController.update_status(patch, WorkflowStatusEnum.CREATED, message="Restarted job after spec update")
-        WorkflowController.init_executed_steps(patch)
+        # Steps started before restart of the operator keep their slots, ready steps are queued again
+        step_admission_queue.restore(namespace, name, WorkflowController.get_running_steps(workflow_body),
+                                     max_parallelism)
+        steps_to_execute = WorkflowController.get_ready_steps(workflow_body)
+    operator_metrics.ready_steps.observe(len(steps_to_execute))
+    if WorkflowController.is_step_cache_enabled(workflow_body):
+        cached = set(WorkflowController.get_cached_steps(workflow_body, steps_to_execute))
+        if cached:
+            logger.info(f"Workflow {name} has {len(cached)} steps with recorded results, marking them executed.")
+            operator_metrics.step_cache_hits.inc(len(cached))
+            workflow_patch_aggregator.add_executed_steps(namespace, name, cached)
+            steps_to_execute = [s for s in steps_to_execute if s.stepName not in cached]
+    queued = step_admission_queue.enqueue(namespace, name, [s.stepName for s in steps_to_execute], max_parallelism,
+                                          WorkflowController.get_step_priorities(workflow_body))
+    logger.info(f"Workflow {name} has {len(steps_to_execute)} steps ready for execution, {queued} of them newly queued.")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Steps of workflow {name} ready for execution: {sorted(s.stepName for s in steps_to_execute)}")
 
-        logger.info(f"Deleting jobs corresponding to old spec...")
-        for job_name in JobController.fetch_workflow_job_names(namespace, name):
-            kubernetes.client.api.BatchV1Api().delete_namespaced_job(name=job_name, namespace=namespace)
+
+def rerun_workflow(workflow_body, patch, name: str, namespace: str, kept_steps: Set[str], message: str,
+                   logger) -> None:
+    """
+        Runs steps of the workflow whose execution state has been reset in @patch, jobs of other steps
+        than @kept_steps are deleted. Retry counts of all steps are reset.
+        Status part of @patch is sent right away - updates coming from the started steps must be built on it.
+    """
+    logger.info(f"Deleting jobs of steps to run again, keeping jobs of {len(kept_steps)} steps...")
+    JobController.delete_workflow_jobs(namespace, name, kept_steps)
+    WorkflowController.reset_step_retries(patch)
+    WorkflowController.reset_summary(patch)
+    WorkflowController.update_status(patch, WorkflowStatusEnum.CREATED, message=message)
+    workflow = WorkflowController.patch_workflow({'status': patch.pop('status')}, name, namespace)
+    # Deadline extended for steps of the previous run doesn't apply anymore
+    cancel_workflow_timeout(name, namespace)
+    if WorkflowController.has_finished(workflow):
+        WorkflowController.update_status(patch, WorkflowStatusEnum.COMPLETED,
+                                         message="All steps have been executed already")
+        return
+    watch_workflow_timeout(workflow, name, namespace)
+    queue_ready_steps(workflow, name, namespace, logger)
 
 
-@kopf.daemon('workflows', initial_delay=30)
-def monitor_workflow_timeout(stopped, name, body, logger, patch, **kwargs):
-    if WorkflowController.get_max_step_timeout(body) == -1:
+def retry_failed_step(namespace: str, workflow_name: str, step_name: str, job_name: str, logger) -> bool:
+    """
+        Schedules the step to run again after a backoff, if it has retries left. The failed job is deleted.
+        Returns False if the step has no retries left.
+    """
+    workflow = workflow_index.get(namespace, workflow_name)
+    if workflow is None or not WorkflowController.has_step(workflow, step_name):
+        return False
+    attempts = WorkflowController.get_step_attempts(workflow, step_name)
+    if attempts >= WorkflowController.get_max_retries(workflow, step_name):
+        return False
+    retry_at = time.time() + WorkflowController.get_retry_delay(workflow, attempts)
+    logger.info(f"Step {step_name} in workflow {workflow_name} will run again at {datetime.fromtimestamp(retry_at)}, "
+                f"retry {attempts + 1} of {WorkflowController.get_max_retries(workflow, step_name)}.")
+    operator_metrics.step_retries.inc()
+    workflow_patch_aggregator.add_step_retry(namespace, workflow_name, step_name, attempts + 1, retry_at)
+    # Terminal event of the failed job must not count as another failure after restart of the operator
+    JobController.delete_job(namespace, workflow_name, job_name)
+    schedule_step_retry(namespace, workflow_name, step_name, retry_at)
+    return True
+
+
+def schedule_step_retry(namespace: str, workflow_name: str, step_name: str, retry_at: float) -> None:
+    deadline_scheduler.schedule((namespace, workflow_name, step_name), retry_at,
+                                functools.partial(queue_retried_step, namespace, workflow_name, step_name))
+    # Backoff doesn't count against maxStepTimeout
+    workflow = workflow_index.get(namespace, workflow_name)
+    if workflow is not None:
+        watch_workflow_timeout(workflow, workflow_name, namespace, since=retry_at)
+
+
+def queue_retried_step(namespace: str, workflow_name: str, step_name: str) -> None:
+    # Called from the deadline scheduler thread, outside of any kopf handler
+    workflow = workflow_index.get(namespace, workflow_name)
+    if workflow is None or not shard_membership.owns(namespace, workflow_name) or \
+            'workflow-status' not in workflow.get('status', {}) or \
+            WorkflowController.get_status(workflow) not in [WorkflowStatusEnum.CREATED, WorkflowStatusEnum.STARTED] or \
+            not WorkflowController.has_step(workflow, step_name):
+        return
+    step_admission_queue.enqueue(namespace, workflow_name, [step_name], WorkflowController.get_max_parallelism(workflow),
+                                 WorkflowController.get_step_priorities(workflow))
+
+
+def watch_workflow_timeout(workflow_body, name: str, namespace: str, since: Optional[float] = None) -> None:
+    """
+        (Re)registers deadline of the workflow - it fails if no step makes progress within maxStepTimeout seconds.
+        The deadline is never moved earlier - it may have been extended for a retried step (backoff doesn't count
+        against the timeout) or for a chain of fused steps (given the timeout of every step of the chain).
+    """
+    timeout = WorkflowController.get_max_step_timeout(workflow_body)
+    if timeout == -1:
+        return
+    deadline = (since or datetime.now().timestamp()) + timeout
+    current = deadline_scheduler.get_deadline((namespace, name))
+    if current is not None and current >= deadline:
+        return
+    deadline_scheduler.schedule((namespace, name), deadline,
+                                functools.partial(fail_timed_out_workflow, name, namespace, timeout))
+
+
+def cancel_workflow_timeout(name: str, namespace: str) -> None:
+    deadline_scheduler.cancel((namespace, name))
+
+
+@operator_metrics.measure_handler("timeout")
+def fail_timed_out_workflow(name: str, namespace: str, timeout: int) -> None:
+    # Called from the deadline scheduler thread, outside of any kopf handler
+    workflow = workflow_index.get(namespace, name)
+    if workflow is not None and WorkflowController.get_status(workflow) in [WorkflowStatusEnum.COMPLETED,
+                                                                             WorkflowStatusEnum.FAILED]:
+        return
+    if not shard_membership.owns(namespace, name):
         return
-    while not stopped:
-        logger.info(f"Daemon for workflow {name} is awaken....")
-        timeout = WorkflowController.get_max_step_timeout(body)
-        ts_diff = (datetime.now().timestamp() - WorkflowController.get_status_timestamp(body).timestamp())
-        if ts_diff > timeout:
-            logger.info(f"Detected timeout for workflow {name} with difference {ts_diff}")
-            WorkflowController.update_status(patch, WorkflowStatusEnum.FAILED, "Workflow timeout")
+    logging.getLogger(__name__).info(
+        f"Detected timeout for workflow {name} in namespace {namespace}, no progress within {timeout} seconds.")
+    workflow_patch_aggregator.set_status(namespace, name, WorkflowStatusEnum.FAILED, "Workflow timeout")
+    step_admission_queue.cancel(namespace, name)
+
+
+def is_job_result_recorded(namespace: str, workflow_name: str, step_name: str, condition: str) -> bool:
+    """
+        Checks (against the indexed workflow) whether terminal @condition of the job of step @step_name
+        has already been recorded in the workflow - or doesn't matter anymore.
+    """
+    workflow = workflow_index.get(namespace, workflow_name)
+    if workflow is None or 'workflow-status' not in workflow.get('status', {}):
+        return False
+    if WorkflowController.get_status(workflow) in [WorkflowStatusEnum.COMPLETED, WorkflowStatusEnum.FAILED]:
+        return True
+    if not WorkflowController.has_step(workflow, step_name):
+        # Job of a step removed from the spec
+        return True
+    return condition == COMPLETE and WorkflowController.is_step_executed(workflow, step_name)
+
+
+def record_executed_steps(namespace: str, workflow_name: str, step_containers: List[Tuple[str, Dict]]) -> None:
+    """
+        Marks steps run by a completed job (see JobController.get_job_step_containers) executed. Steps fused into
+        the job are marked only up to the first one changed since creation of the job, which has to run again.
+        Successful execution of steps run for their current spec is recorded in the step cache, if the workflow
+        has it enabled.
+    """
+    workflow = workflow_index.get(namespace, workflow_name)
+    executed = []
+    for step_name, container in step_containers:
+        is_current = workflow is not None and WorkflowController.has_step(workflow, step_name) and \
+            WorkflowController.get_step(workflow, step_name).image == container['image'] and \
+            WorkflowController.get_step(workflow, step_name).command == container.get('command')
+        if executed and not is_current:
             break
-        logger.info(f"Going to sleep with diff {ts_diff}...")
-        stopped.wait(10)
+        if is_current and WorkflowController.is_step_cache_enabled(workflow):
+            WorkflowController.record_step_result(workflow, step_name)
+        executed.append(step_name)
+    # Steps following the first one must not become ready before they are marked executed
+    workflow_patch_aggregator.add_executed_steps(namespace, workflow_name, executed)
 
 
-def start_workflow_step(step: WorkflowStepSchema, workflow_name: str, namespace: str, workflow_body) -> None:
-    job = JobController.create_job(step, workflow_name, workflow_body)
-    kopf.append_owner_reference(job, workflow_body)
-    client.BatchV1Api().create_namespaced_job(namespace=namespace, body=job)
+def launch_workflow_step(namespace: str, workflow_name: str, step_name: str, job_name: str) -> bool:
+    """
+        Creates job @job_name of a step admitted by the step dispatcher. Returns False if the step doesn't exist anymore
+        (or the workflow has been handed over to another replica in the meantime).
+    """
+    if not shard_membership.owns(namespace, workflow_name):
+        return False
+    workflow = workflow_index.get(namespace, workflow_name)
+    if workflow is None:
+        workflow = WorkflowController.get_workflow(namespace, workflow_name)
+    if not WorkflowController.has_step(workflow, step_name):
+        return False
+    start_workflow_step(WorkflowController.get_step(workflow, step_name), workflow_name, namespace, workflow, job_name)
+    return True
 
 
-def start_workflow_steps(steps: Set[WorkflowStepSchema], workflow_name: str, namespace: str, logger,
-                         workflow_body) -> None:
-    for step in steps:
-        logger.info(f"Starting job for step {step.stepName} in workflow {workflow_name}...")
-        start_workflow_step(step, workflow_name, namespace, workflow_body)
-        logger.info(f"Job for step {step.stepName} in workflow {workflow_name} started successfully.")
+def start_workflow_step(step: WorkflowStepSchema, workflow_name: str, namespace: str, workflow_body,
+                        job_name: str) -> None:
+    fused_steps = WorkflowController.get_fused_steps(workflow_body, step.stepName)
+    JobController.submit_job(namespace, JobController.create_job(step, workflow_name, workflow_body, fused_steps,
+                                                                 job_name))
+    if fused_steps:
+        # No progress is made until the last of the fused steps finishes
+        timeout = WorkflowController.get_max_step_timeout(workflow_body)
+        watch_workflow_timeout(workflow_body, workflow_name, namespace, since=time.time() + timeout * len(fused_steps))